@@ -30,6 +30,8 @@ class SouthboundListener(ShapeshifterProxy):
         super(SouthboundListener, self).__init__(*args, **kwargs)
         self.igp_graph = IGPGraph()
         self.dirty = False
+        # The version of igp_graph, kept across sessions
+        self.graph_version = None
         self.json_proxy = SJMPClient(hostname=CFG.get(DEFAULTSECT,
                                                       'json_hostname'),
                                      port=CFG.getint(DEFAULTSECT, 'json_port'),
@@ -46,7 +48,11 @@ class SouthboundListener(ShapeshifterProxy):
         """Stop the connection to the southbound controller"""
         self.json_proxy.stop()
 
-    def bootstrap_graph(self, graph, node_properties):
+    def graph_session(self, token):
+        self.quagga_manager.resume(token, self.graph_version)
+
+    def bootstrap_graph(self, graph, node_properties, version=None):
+        self.graph_version = version
         self.igp_graph.clear()
         self.igp_graph.add_edges_from(graph)
         for _, _, d in self.igp_graph.edges_iter(data=True):
@@ -57,6 +63,26 @@ class SouthboundListener(ShapeshifterProxy):
         self.received_initial_graph()
         self.graph_changed()
 
+    def bootstrap_begin(self, version=None):
+        self.igp_graph.clear()
+
+    def bootstrap_edges(self, edges):
+        self.igp_graph.add_edges_from(edges)
+        for edge in edges:
+            sanitize_edge_data(self.igp_graph[edge[0]][edge[1]])
+
+    def bootstrap_nodes(self, node_properties):
+        for node, data in node_properties.iteritems():
+            self.igp_graph.add_node(node, data)
+
+    def bootstrap_end(self, version=None):
+        self.graph_version = version
+        log.debug('Bootstrapped graph with %d edges and %d nodes',
+                  self.igp_graph.number_of_edges(),
+                  self.igp_graph.number_of_nodes())
+        self.received_initial_graph()
+        self.graph_changed()
+
     def received_initial_graph(self):
         """Called when the initial graph has been bootstrapped, before
         calling graph_changed"""
@@ -70,8 +96,10 @@ class SouthboundListener(ShapeshifterProxy):
         # Only trigger an update if the link is bidirectional
         self.dirty = self.igp_graph.has_edge(destination, source)
 
-    def commit(self):
+    def commit(self, version=None):
         log.debug('End of graph update')
+        if version is not None:
+            self.graph_version = version
         if self.dirty:
             self.dirty = False
             self.graph_changed()
@@ -96,6 +124,26 @@ class SouthboundListener(ShapeshifterProxy):
         else:
             self.dirty = True
 
+    def update_prefixes(self, added, removed, node_properties):
+        for source, prefix in removed:
+            try:
+                self.igp_graph.remove_edge(source, prefix)
+            except nx.NetworkXError:
+                pass
+        for source, prefix, properties in added:
+            properties = sanitize_edge_data(properties)
+            if self.igp_graph.has_edge(source, prefix):
+                # The new properties replace the previous ones
+                data = self.igp_graph[source][prefix]
+                data.clear()
+                data.update(properties)
+            else:
+                self.igp_graph.add_edge(source, prefix, properties)
+        for prefix, data in node_properties.iteritems():
+            self.igp_graph.add_node(prefix, data)
+        log.debug('Updated prefixes: +%d -%d', len(added), len(removed))
+        self.dirty = self.dirty or bool(added or removed or node_properties)
+
     def update_node_properties(self, **properties):
         log.debug('Updating node propeties: %s', properties)
         for node, data in properties.iteritems():
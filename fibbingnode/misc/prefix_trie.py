@@ -0,0 +1,264 @@
+"""
+A binary radix trie (PATRICIA trie) indexing values by IP prefix, which
+answers the exact, longest-prefix-match and covering/covered queries in
+O(prefix length), instead of scanning every prefix.
+"""
+from socket import inet_aton, error as socket_error
+from struct import unpack
+
+from ipaddress import ip_network
+
+
+def parse_prefix(prefix):
+    """
+    :param prefix: an ip_network or ip_address, an 'address/prefixlen'
+                   or 'address' string, or an IPv4 address as int
+    :return: (address width, network address as int, prefix length)
+    :raise ValueError: if prefix is not a valid prefix
+    """
+    if isinstance(prefix, basestring):
+        address, _, length = prefix.partition('/')
+        if ':' not in address and address.count('.') == 3:
+            try:
+                bits = unpack('!I', inet_aton(address))[0]
+            except socket_error:
+                raise ValueError('%s is not a valid prefix' % prefix)
+            length = int(length) if length else 32
+            if not 0 <= length <= 32:
+                raise ValueError('%s is not a valid prefix' % prefix)
+            return 32, bits & ~((1 << 32 - length) - 1), length
+        prefix = ip_network(unicode(prefix), strict=False)
+    elif type(prefix) is int or type(prefix) is long:
+        return 32, prefix, 32
+    try:
+        return (prefix.max_prefixlen, int(prefix.network_address),
+                prefix.prefixlen)
+    except AttributeError:  # An ip_address
+        return prefix.max_prefixlen, int(prefix), prefix.max_prefixlen
+
+
+# The value of the nodes that only join their children
+_EMPTY = object()
+
+
+class _Node(object):
+    __slots__ = ('bits', 'length', 'key', 'value', 'zero', 'one')
+
+    def __init__(self, bits, length, key=None, value=_EMPTY):
+        self.bits = bits
+        self.length = length
+        self.key = key
+        self.value = value
+        self.zero = self.one = None
+
+
+class PrefixTrie(object):
+    """
+    A dict-like mapping of IP prefixes to values, keeping the keys as given
+    (e.g. ip_network or 'address/prefixlen' strings, see parse_prefix).
+    Two keys denoting the same prefix are the same key. IPv4 and IPv6
+    prefixes are kept in separate tries. The nodes with a single child and
+    no value are merged away, the trie thus has at most two nodes per
+    prefix.
+    """
+
+    def __init__(self, items=()):
+        """:param items: an iterable of (prefix, value)"""
+        self._roots = {}  # address width: root node
+        self._len = 0
+        for key, value in items:
+            self[key] = value
+
+    def __len__(self):
+        return self._len
+
+    def _walk(self, width, bits, length):
+        """
+        Iterate over the nodes on the path towards a parsed prefix, i.e. the
+        nodes covering it, then the first node covered by it, if any
+        :return: an iterator over (node, whether it covers the prefix)
+        """
+        node = self._roots.get(width)
+        while node is not None:
+            shift = width - min(node.length, length)
+            if (node.bits ^ bits) >> shift:
+                return  # Diverges from the prefix
+            if node.length >= length:
+                yield node, node.length == length
+                return
+            yield node, True
+            node = (node.one if bits >> (width - 1 - node.length) & 1
+                    else node.zero)
+
+    def _find(self, prefix):
+        """:return: the node holding prefix, None if absent"""
+        parsed = parse_prefix(prefix)
+        for node, covers in self._walk(*parsed):
+            if covers and node.length == parsed[2] and \
+                    node.value is not _EMPTY:
+                return node
+        return None
+
+    def __getitem__(self, prefix):
+        node = self._find(prefix)
+        if node is None:
+            raise KeyError(prefix)
+        return node.value
+
+    def get(self, prefix, default=None):
+        node = self._find(prefix)
+        return default if node is None else node.value
+
+    def __contains__(self, prefix):
+        return self._find(prefix) is not None
+
+    def __setitem__(self, prefix, value):
+        width, bits, length = parse_prefix(prefix)
+        node = self._roots.get(width)
+        if node is None:
+            node = self._roots[width] = _Node(0, 0)
+        while True:
+            if node.length == length:
+                if node.value is _EMPTY:
+                    self._len += 1
+                node.key, node.value = prefix, value
+                return
+            bit = bits >> (width - 1 - node.length) & 1
+            child = node.one if bit else node.zero
+            if child is None:
+                new = _Node(bits, length, prefix, value)
+                break
+            # The length of the common prefix of child and prefix
+            common = min(width - ((child.bits ^ bits).bit_length()),
+                         child.length, length)
+            if common == child.length:
+                node = child
+                continue
+            if common == length:
+                new = _Node(bits, length, prefix, value)
+            else:
+                new = _Node(bits & ~((1 << width - common) - 1), common)
+                self._link(new, _Node(bits, length, prefix, value), width)
+            self._link(new, child, width)
+            break
+        if bit:
+            node.one = new
+        else:
+            node.zero = new
+        self._len += 1
+
+    @staticmethod
+    def _link(parent, child, width):
+        if child.bits >> (width - 1 - parent.length) & 1:
+            parent.one = child
+        else:
+            parent.zero = child
+
+    def __delitem__(self, prefix):
+        width, bits, length = parse_prefix(prefix)
+        path = [node for node, covers in self._walk(width, bits, length)
+                if covers]
+        node = path[-1] if path else None
+        if node is None or node.length != length or node.value is _EMPTY:
+            raise KeyError(prefix)
+        node.key, node.value = None, _EMPTY
+        self._len -= 1
+        # Merge away the nodes left with no value and at most one child
+        while len(path) > 1 and node.value is _EMPTY and \
+                (node.zero is None or node.one is None):
+            parent = path[-2]
+            child = node.zero or node.one
+            if parent.zero is node:
+                parent.zero = child
+            else:
+                parent.one = child
+            path.pop()
+            node = parent
+
+    def pop(self, prefix, *default):
+        node = self._find(prefix)
+        if node is None:
+            if default:
+                return default[0]
+            raise KeyError(prefix)
+        value = node.value
+        del self[prefix]
+        return value
+
+    def longest_match(self, prefix):
+        """
+        :param prefix: a prefix, or an address to look up
+        :return: the (key, value) of the longest prefix covering prefix
+        :raise KeyError: if no prefix covers it
+        """
+        match = None
+        for node, covers in self._walk(*parse_prefix(prefix)):
+            if covers and node.value is not _EMPTY:
+                match = node
+        if match is None:
+            raise KeyError(prefix)
+        return match.key, match.value
+
+    def covering(self, prefix):
+        """
+        :return: an iterator over the (key, value) of the prefixes covering
+                 prefix, including itself, from the least specific one
+        """
+        for node, covers in self._walk(*parse_prefix(prefix)):
+            if covers and node.value is not _EMPTY:
+                yield node.key, node.value
+
+    def covered_by(self, prefix):
+        """
+        :return: an iterator over the (key, value) of the prefixes covered
+                 by prefix, including itself
+        """
+        parsed = parse_prefix(prefix)
+        last = None
+        for last, _ in self._walk(*parsed):
+            pass
+        if last is None or last.length < parsed[2]:
+            return iter(())
+        return self._subtree(last)
+
+    @staticmethod
+    def _subtree(node):
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            if node.value is not _EMPTY:
+                yield node.key, node.value
+            if node.one is not None:
+                stack.append(node.one)
+            if node.zero is not None:
+                stack.append(node.zero)
+
+    def iteritems(self):
+        """:return: an iterator over the (key, value), in prefix order"""
+        for width in sorted(self._roots):
+            for item in self._subtree(self._roots[width]):
+                yield item
+
+    def __iter__(self):
+        return (key for key, _ in self.iteritems())
+
+    iterkeys = __iter__
+
+    def itervalues(self):
+        return (value for _, value in self.iteritems())
+
+    def keys(self):
+        return list(self)
+
+    def values(self):
+        return list(self.itervalues())
+
+    def items(self):
+        return list(self.iteritems())
+
+    def clear(self):
+        self._roots.clear()
+        self._len = 0
+
+    def __repr__(self):
+        return 'PrefixTrie(%r)' % self.items()
@@ -2,6 +2,9 @@ import os
 import sys
 import collections
 
+from ipaddress import ip_address, ip_interface
+from socket import inet_aton, inet_ntoa, error as socket_error
+from struct import pack, unpack
 from time import sleep
 from fibbingnode import log
 
@@ -103,6 +106,140 @@ def del_file(f):
     force(os.remove, f)
 
 
+def read_lines(fd, chunk_size=65536, sep='\n'):
+    """
+    Iterate over the lines read from a file descriptor, performing large
+    reads instead of byte-per-byte ones.
+    The data is accumulated in a single bytearray and every line is sliced
+    out of it through a memoryview, thus copied exactly once. Partial lines
+    at the end of a chunk are kept until the next read completes them.
+    :param fd: the file descriptor to read from (e.g. a FIFO)
+    :param chunk_size: the maximal amount of bytes to request per read
+    :param sep: the line separator, not included in the returned lines
+    :return: an iterator over the complete lines, without separator
+    """
+    buf = bytearray()
+    while True:
+        data = os.read(fd, chunk_size)
+        if not data:
+            break
+        buf.extend(data)
+        # The pending bytes are known not to contain any separator
+        end = buf.find(sep, len(buf) - len(data))
+        start = 0
+        view = memoryview(buf)
+        while end >= 0:
+            yield view[start:end].tobytes()
+            start = end + 1
+            end = buf.find(sep, start)
+        # A bytearray cannot be resized while a view on it exists
+        del view
+        del buf[:start]
+    if buf:
+        log.debug('Discarding incomplete trailing line: %s', buf)
+
+
+class BoundedCache(object):
+    """
+    Memoize the results of a function, keeping at most maxsize of them.
+    The cache is simply emptied once full, which is much cheaper than
+    tracking the least recently used entries, and good enough for the
+    mostly stable sets of values that it is meant for.
+    Exceptions raised by the function are not cached.
+    """
+
+    def __init__(self, f, maxsize=65536):
+        """
+        :param f: the function to memoize, its arguments must be hashable
+        :param maxsize: the maximal number of results to keep
+        """
+        self.f = f
+        self.maxsize = maxsize
+        self.cache = {}
+        self.hits = self.misses = 0
+
+    def __call__(self, *args):
+        try:
+            result = self.cache[args]
+        except KeyError:
+            self.misses += 1
+            if len(self.cache) >= self.maxsize:
+                self.cache.clear()
+            result = self.cache[args] = self.f(*args)
+            return result
+        self.hits += 1
+        return result
+
+    def hit_rate(self):
+        """:return: the ratio of calls answered from the cache"""
+        total = self.hits + self.misses
+        return float(self.hits) / total if total else 0.0
+
+    def __str__(self):
+        return '%d entries, %d hits, %d misses (%.1f%% hits)' % (
+            len(self.cache), self.hits, self.misses, 100 * self.hit_rate())
+
+
+def _parse_address(address):
+    """:return: the IPAddress object of address, or None if not an IP"""
+    try:
+        return ip_address(address)
+    except ValueError:
+        return None
+
+
+def _prefix_of(address, mask):
+    """:return: the prefix address/mask, in its address/prefixlen form"""
+    return intern(str(ip_interface('%s/%s' % (address, mask))
+                      .with_prefixlen))
+
+
+def _interface_ip(interface):
+    """:return: the address of an IP interface, i.e. without its netmask"""
+    return str(ip_interface(interface).ip)
+
+
+def _address_to_int(address):
+    """:return: an IPv4 address as int, anything else (e.g. a prefix) as-is"""
+    # inet_aton also accepts shorthands such as '10.1'
+    if address.count('.') != 3:
+        return address
+    try:
+        return unpack('!I', inet_aton(address))[0]
+    except socket_error:
+        return address
+
+
+def _int_to_address(n):
+    """:return: the dotted-quad form of an IPv4 address given as int"""
+    return inet_ntoa(pack('!I', n))
+
+
+# The parsed forms of the router ids, prefixes and forwarding addresses are
+# shared by the whole LSDB processing, as their ipaddress objects are costly
+# to build. The LSDB sizes them, see size_address_caches.
+parse_address = BoundedCache(_parse_address)
+prefix_of = BoundedCache(_prefix_of)
+interface_ip = BoundedCache(_interface_ip)
+address_to_int = BoundedCache(_address_to_int)
+int_to_address = BoundedCache(_int_to_address)
+ADDRESS_CACHES = {'address': parse_address,
+                  'prefix': prefix_of,
+                  'interface_ip': interface_ip,
+                  'address_to_int': address_to_int,
+                  'int_to_address': int_to_address}
+
+
+def size_address_caches(maxsize):
+    """
+    Bound the address caches, those over the new bound are emptied on
+    their next miss
+    :param maxsize: the maximal number of results to keep per cache
+    """
+    for cache in ADDRESS_CACHES.itervalues():
+        cache.maxsize = maxsize
+
+
 class ConfigDict(dict):
     """
     A dictionary whose attributes are its keys
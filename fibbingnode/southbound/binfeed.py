@@ -0,0 +1,235 @@
+"""
+Compact binary framing of the LSDB feed, an alternative to the text lines
+of ospfd --log_lsdb that does not repeat the field names in every LSA and
+can be decoded with a few struct calls instead of string splitting.
+
+The feed is a sequence of length-prefixed records, integers are big-endian
+and addresses are 4 bytes long:
+    record  := length (uint16, bytes following it) action (uint8) [lsa]
+    action  := 1 (ADD) | 2 (REM) | 3 (BEGIN) | 4 (COMMIT)
+    lsa     := lsa_type (uint8) flags (uint8) rid link_id mask
+               count (uint16) group{count}
+    flags   := 1 if the mask is present
+Each group then holds the fields of LSA_TYPE.FIELDS for that LSA type:
+    1 (Router)      link_type (uint8) link_id link_data metric (uint16)
+    2 (Network)     rid
+    5 (AS-External) metric (uint32) fwd_addr
+Other LSA types have no groups.
+
+Usage: python -m fibbingnode.southbound.binfeed TEXT_CAPTURE BINARY_CAPTURE
+"""
+import argparse
+import os
+import struct
+from socket import inet_aton, inet_ntoa
+
+import fibbingnode
+from lsdb import (LSAHeader, LSA_TYPES, RouterLSA, NetworkLSA, ASExtLSA,
+                  UnusedLSA, PARSER, ADD, REM, BEGIN, COMMIT, SEP_ACTION)
+from replay import read_capture
+
+log = fibbingnode.log
+
+ACTIONS = (None, ADD, REM, BEGIN, COMMIT)
+ACTION_CODES = {action: code for code, action in enumerate(ACTIONS)}
+
+LENGTH = struct.Struct('!H')
+ACTION = struct.Struct('!B')
+HEADER = struct.Struct('!BB4s4s4sH')
+HAS_MASK = 1
+
+ADDRESS = '4s'
+# The encoding of the group fields, per LSA type
+GROUP_FORMATS = {RouterLSA.TYPE: ('B', ADDRESS, ADDRESS, 'H'),
+                 NetworkLSA.TYPE: (ADDRESS,),
+                 ASExtLSA.TYPE: ('I', ADDRESS)}
+
+
+class _Groups(object):
+    """The encoding of count groups of a given LSA type"""
+
+    def __init__(self, fmt, count):
+        self.struct = struct.Struct('!' + ''.join(fmt) * count)
+        self.width = len(fmt)
+        self.decoders = [inet_ntoa if f == ADDRESS else str for f in fmt]
+        self.encoders = [inet_aton if f == ADDRESS else int for f in fmt]
+
+    def decode(self, record, offset):
+        """:return: the list of tuples of field values"""
+        flat = self.struct.unpack_from(record, offset)
+        w = self.width
+        return zip(*[map(decoder, flat[i::w])
+                     for i, decoder in enumerate(self.decoders)])
+
+    def encode(self, groups):
+        """:return: the packed groups"""
+        return self.struct.pack(*[encoder(value) for group in groups
+                                  for encoder, value in zip(self.encoders,
+                                                            group)])
+
+
+# Bound the number of cached group encodings, one per (LSA type, count)
+MAX_GROUPS = 1024
+_groups = {}
+
+
+def _groups_of(lsa_type, count):
+    try:
+        return _groups[lsa_type, count]
+    except KeyError:
+        if len(_groups) >= MAX_GROUPS:
+            _groups.clear()
+        g = _groups[lsa_type, count] = _Groups(GROUP_FORMATS.get(lsa_type,
+                                                                 ()),
+                                               count)
+        return g
+
+
+def encode_record(action, header=None, groups=()):
+    """
+    :param action: ADD, REM, BEGIN or COMMIT
+    :param header: the values of LSAHeader.FIELDS, for ADD and REM
+    :param groups: for each group, the values of the FIELDS of the LSA
+    :return: the record, including its length prefix
+    """
+    body = ACTION.pack(ACTION_CODES[action])
+    if header is not None:
+        routerid, linkid, lsa_type, mask = header
+        groups = list(groups) if lsa_type in GROUP_FORMATS else []
+        body += HEADER.pack(int(lsa_type),
+                            HAS_MASK if mask is not None else 0,
+                            inet_aton(routerid),
+                            inet_aton(linkid),
+                            inet_aton(mask if mask is not None else '0.0.0.0'),
+                            len(groups))
+        body += _groups_of(lsa_type, len(groups)).encode(groups)
+    return LENGTH.pack(len(body)) + body
+
+
+def decode_record(record, address_id=intern):
+    """
+    :param record: a record, without its length prefix
+    :param address_id: the representation of the addresses, see
+                       LSDB.address_id
+    :return: the action of that record and its LSA, if any
+    """
+    action = ACTIONS[ACTION.unpack_from(record)[0]]
+    if action == BEGIN or action == COMMIT:
+        return action, None
+    (lsa_type, flags, routerid, linkid, mask,
+     count) = HEADER.unpack_from(record, ACTION.size)
+    lsa_type = str(lsa_type)
+    try:
+        cls = LSA_TYPES[lsa_type]
+    except KeyError:
+        log.debug('Couldn''t parse the LSA type %s', lsa_type)
+        return action, UnusedLSA()
+    header = LSAHeader.parse((inet_ntoa(routerid), inet_ntoa(linkid),
+                              lsa_type,
+                              inet_ntoa(mask) if flags & HAS_MASK else None),
+                             address_id)
+    return action, cls.parse(header, _groups_of(lsa_type, count).decode(
+        record, ACTION.size + HEADER.size), address_id)
+
+
+# The LSA type, flags, router id, link id and mask, e.g. the prefixes of
+# AS-External LSAs only differ by their mask
+KEY_SIZE = HEADER.size - struct.calcsize('!H')
+_LSA_ACTIONS = frozenset(ACTION.pack(ACTION_CODES[action])
+                         for action in (ADD, REM))
+_REM_ACTION = ACTION.pack(ACTION_CODES[REM])
+
+
+def record_key(record):
+    """
+    :param record: a record, without its length prefix
+    :return: the bytes identifying the LSA of that record, None if it
+             has no LSA
+    """
+    if record[:ACTION.size] in _LSA_ACTIONS:
+        return record[ACTION.size:ACTION.size + KEY_SIZE]
+    return None
+
+
+def record_removes(record):
+    """
+    :param record: a record, without its length prefix
+    :return: whether that record removes an LSA
+    """
+    return record[:ACTION.size] == _REM_ACTION
+
+
+def read_records(fd, chunk_size=65536):
+    """
+    Iterate over the records read from a file descriptor, performing large
+    reads. As read_lines, records are sliced out of a single bytearray
+    through a memoryview, and thus copied exactly once.
+    :param fd: the file descriptor to read from (e.g. a FIFO)
+    :param chunk_size: the maximal amount of bytes to request per read
+    :return: an iterator over the complete records, without length prefix
+    """
+    buf = bytearray()
+    while True:
+        data = os.read(fd, chunk_size)
+        if not data:
+            break
+        buf.extend(data)
+        start = 0
+        view = memoryview(buf)
+        while len(buf) - start >= LENGTH.size:
+            length, = LENGTH.unpack_from(buf, start)
+            end = start + LENGTH.size + length
+            if end > len(buf):
+                break
+            yield view[start + LENGTH.size:end].tobytes()
+            start = end
+        # A bytearray cannot be resized while a view on it exists
+        del view
+        del buf[:start]
+    if buf:
+        log.debug('Discarding incomplete trailing record of %d bytes',
+                  len(buf))
+
+
+def text_to_record(line):
+    """
+    Convert a text LSDB log line to a binary record, the fields that
+    the LSDB does not use (e.g. link_metrictype) are not kept
+    :param line: the text line, without its trailing separator
+    :return: the record, including its length prefix
+    """
+    action, lsa_info = line.split(SEP_ACTION)
+    if action == BEGIN or action == COMMIT:
+        return encode_record(action)
+    header, cls, groups = PARSER.fields(lsa_info)
+    return encode_record(action, header, groups)
+
+
+def convert(text_capture, binary_capture):
+    """
+    Convert a text capture of the LSDB log (possibly timestamped, see
+    replay.py) to a binary one, the timestamps are not kept
+    :return: the number of converted lines
+    """
+    count = 0
+    with open(binary_capture, 'wb') as out:
+        for ts, line in read_capture(text_capture):
+            try:
+                out.write(text_to_record(line))
+                count += 1
+            except (ValueError, TypeError, KeyError, struct.error) as e:
+                log.error('Cannot convert %s [%s]', line, e)
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Convert a text LSDB log '
+                                                 'capture to binary records.')
+    parser.add_argument('text', help='The text capture')
+    parser.add_argument('binary', help='Where to save the binary capture')
+    args = parser.parse_args()
+    log.info('Converted %d lines', convert(args.text, args.binary))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,244 @@
+"""
+A census of the objects held by the LSDB, its graphs and the fibbing
+routes: how many there are and approximately how many bytes they use, to
+find leaks and to size the hosts of large deployments.
+
+The sizes are the sum of sys.getsizeof over all the objects reachable from
+each category, each object being counted once, in the first category
+reaching it (e.g. the addresses shared by the LSAs and the graph are
+counted with the LSAs). Only the containers and the instances of the
+fibbingnode, networkx and ipaddress classes are traversed.
+
+Censuses can be diffed. If tracemalloc is available (Python 3, or the
+pytracemalloc backport for Python 2) and tracing, each census also holds a
+tracemalloc snapshot, and the diff then gives the allocation sites that
+grew the most.
+"""
+from collections import OrderedDict, deque
+from copy import copy
+import sys
+import time
+
+import fibbingnode
+from lsdb import LSA_TYPES
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+log = fibbingnode.log
+
+# The instances of these packages are traversed
+TRAVERSED = frozenset(('fibbingnode', 'networkx', 'ipaddress'))
+
+_slots_cache = {}  # class: the names of its slots
+
+
+def _slots(cls):
+    try:
+        return _slots_cache[cls]
+    except KeyError:
+        pass
+    slots = []
+    for c in cls.__mro__:
+        s = c.__dict__.get('__slots__', ())
+        slots.extend((s,) if isinstance(s, basestring) else s)
+    _slots_cache[cls] = slots
+    return slots
+
+
+def deep_sizeof(obj, seen):
+    """
+    :param obj: the root object
+    :param seen: the ids of the objects already counted, or not to count
+                 nor traverse, updated with those counted
+    :return: the approximate size of the objects reachable from obj,
+             in bytes
+    """
+    size = 0
+    stack = [obj]
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen:
+            continue
+        seen.add(id(obj))
+        size += sys.getsizeof(obj)
+        if isinstance(obj, dict):
+            stack.extend(obj.iterkeys())
+            stack.extend(obj.itervalues())
+        elif isinstance(obj, (list, tuple, set, frozenset, deque)):
+            stack.extend(obj)
+        elif type(obj).__module__.partition('.')[0] in TRAVERSED:
+            d = getattr(obj, '__dict__', None)
+            if d is not None:
+                stack.append(d)
+            for name in _slots(type(obj)):
+                try:
+                    stack.append(getattr(obj, name))
+                except AttributeError:
+                    pass  # Unset slot
+    return size
+
+
+def start_tracing(frames=1):
+    """
+    Start tracing the memory allocations, if tracemalloc is available
+    :param frames: how many frames to record per allocation
+    :return: whether the allocations are traced
+    """
+    if tracemalloc is None:
+        log.warning('tracemalloc is not available, the censuses will only '
+                    'count the objects')
+        return False
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(frames)
+    return True
+
+
+def stop_tracing():
+    """Stop tracing the memory allocations, if tracemalloc is available"""
+    if tracemalloc is not None:
+        tracemalloc.stop()
+
+
+def is_tracing():
+    return tracemalloc is not None and tracemalloc.is_tracing()
+
+
+class Census(object):
+    """The object counts and sizes, by category, at some point in time"""
+
+    def __init__(self, categories, snapshot=None, traced=None):
+        """
+        :param categories: an OrderedDict name: (count, bytes)
+        :param snapshot: a tracemalloc snapshot, None if not tracing
+        :param traced: the traced memory and its peak, in bytes
+        """
+        self.time = time.time()
+        self.categories = categories
+        self.snapshot = snapshot
+        self.traced = traced
+
+    def total(self):
+        """:return: the total size of the categories, in bytes"""
+        return sum(size for _, size in self.categories.itervalues())
+
+    def diff(self, older, top=10):
+        """
+        :param older: a previous census
+        :param top: how many allocation sites to give
+        :return: an OrderedDict name: (count change, bytes change), and the
+                 list of the tracemalloc StatisticDiff of the top
+                 allocation sites (empty if either census has no snapshot)
+        """
+        changes = OrderedDict()
+        for name in self.categories.keys() + [n for n in older.categories
+                                              if n not in self.categories]:
+            count, size = self.categories.get(name, (0, 0))
+            old_count, old_size = older.categories.get(name, (0, 0))
+            changes[name] = count - old_count, size - old_size
+        sites = []
+        if self.snapshot is not None and older.snapshot is not None:
+            sites = self.snapshot.compare_to(older.snapshot, 'lineno')[:top]
+        return changes, sites
+
+    def report(self):
+        """:return: the lines describing this census"""
+        lines = ['%-16s %10d objects %12d bytes' % (name, count, size)
+                 for name, (count, size) in self.categories.iteritems()]
+        lines.append('%-16s %10s         %12d bytes' % ('total', '',
+                                                        self.total()))
+        if self.traced is not None:
+            lines.append('traced memory: %d bytes (peak %d)' % self.traced)
+        return lines
+
+    def diff_report(self, older, top=10):
+        """:return: the lines describing the changes since older"""
+        changes, sites = self.diff(older, top)
+        lines = ['changes over %.1fs:' % (self.time - older.time)]
+        lines.extend('%-16s %+10d objects %+12d bytes' % (name, count, size)
+                     for name, (count, size) in changes.iteritems()
+                     if count or size)
+        lines.extend(str(stat) for stat in sites)
+        return lines
+
+
+def _copy_graph(graph):
+    """
+    :param graph: a directed graph
+    :return: copies of its dict of nodes and of its successors and
+             predecessors dicts, sharing the attribute dicts
+    """
+    return (dict(graph.node),
+            {u: dict(nbrs) for u, nbrs in graph.succ.iteritems()},
+            {v: dict(nbrs) for v, nbrs in graph.pred.iteritems()})
+
+
+def take(lsdb, manager=None):
+    """
+    Count the objects of an LSDB and of the routes of a fibbing manager.
+    The structures are copied while the LSDB is neither processing LSAs nor
+    updating its graph, and measured afterwards, without blocking it. The
+    copies share their items with the LSDB, the sizes of the items changed
+    meanwhile are thus those at the time they are measured.
+    :param lsdb: the LSDB
+    :param manager: the FibbingManager, None to skip the fibbing routes
+    :return: a Census
+    """
+    snapshot = traced = None
+    if is_tracing():
+        snapshot = tracemalloc.take_snapshot()
+        traced = tracemalloc.get_traced_memory()
+    # name: (count, the copies to measure)
+    copies = OrderedDict()
+    # In the order the processing thread takes the locks
+    with lsdb.lsdb_lock, lsdb.graph_lock:
+        for lsa_type in sorted(LSA_TYPES):
+            cls = LSA_TYPES[lsa_type]
+            db = lsdb.lsdb(cls)
+            copies[cls.__name__] = len(db), [copy(db)]
+        graph = lsdb.graph
+        nodes, succ, pred = _copy_graph(graph)
+        copies['graph.nodes'] = graph.number_of_nodes(), [nodes]
+        copies['graph.edges'] = graph.number_of_edges(), [succ, pred]
+        copies['prefix_table'] = (len(lsdb.prefix_table),
+                                  [copy(lsdb.prefix_table)])
+        # The graphs are only measured through their copies
+        graphs = [graph]
+        if lsdb.incremental:
+            copies['incremental'] = (len(lsdb.incremental._contributions),
+                                     [copy(lsdb.incremental)])
+            if lsdb.check_graph is not None:
+                graphs.append(lsdb.check_graph)
+                copies['check_graph'] = (lsdb.check_graph.number_of_edges(),
+                                         list(_copy_graph(lsdb.check_graph)))
+        copies['ext_prefixes'] = (len(lsdb.ext_prefixes),
+                                  [copy(lsdb.ext_prefixes)])
+        digests = lsdb.digests or {}
+        copies['digests'] = len(digests), [copy(digests)]
+        copies['addresses'] = len(lsdb.address_owners), [
+            copy(x) for x in (lsdb.address_owners, lsdb.owned_addresses,
+                              lsdb.transit_routers, lsdb.private_addresses)]
+        copies['deltas'] = len(lsdb.deltas), [copy(lsdb.deltas)]
+    if manager is not None:
+        # The routes are changed by the northbound controllers without a
+        # lock, only shallow copies of them are thus taken
+        routes = manager.routes.values()
+        points = [p for r in routes
+                  for p in r.attraction_points.values()]
+        copies['AttractionPoint'] = len(points), points
+        copies['FibbingRoute'] = len(routes), [copy(manager.routes),
+                                               copy(manager.route_mappings)]
+    # Never traverse the owners of the structures
+    seen = {id(lsdb), id(manager)}
+    seen.update(id(g) for g in graphs)
+    if manager is not None:
+        # The fibbing nodes advertizing the routes are not counted
+        seen.update(id(n) for n in manager.nodes.values())
+        seen.add(id(manager.root))
+    categories = OrderedDict()
+    for name, (count, structures) in copies.iteritems():
+        categories[name] = count, sum(deep_sizeof(s, seen)
+                                      for s in structures)
+    return Census(categories, snapshot, traced)
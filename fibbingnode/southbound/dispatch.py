@@ -0,0 +1,344 @@
+"""
+Asynchronous fan-out of the graph updates to the northbound listeners, such
+that a slow or remote controller does not stall the LSA processing.
+"""
+from collections import OrderedDict
+from threading import Thread, Condition, current_thread
+import time
+
+import fibbingnode
+import latency
+
+log = fibbingnode.log
+
+# The kinds of chunks of a streamed bootstrap
+EDGES = 'edges'
+NODES = 'nodes'
+
+# Seconds to wait before retrying to push updates to a failed listener
+RETRY_DELAY = 1
+
+
+class ListenerDispatcher(object):
+    """
+    Push the graph updates to a single listener, from its own sender thread.
+    The updates not yet sent are coalesced into a single pending batch,
+    where each edge and node appears at most once with its latest state.
+    E.g. an edge added then removed before being sent is only removed.
+    The prefix attachments are coalesced apart and sent with their own
+    call, update_prefixes.
+    The backlog is thus bounded by the size of the graph, whatever the
+    speed of the listener.
+    If sending a batch fails, the listener may have received only part of
+    it. After RETRY_DELAY, the listener is either resynchronized, or the
+    batch is queued again under the updates pushed meanwhile.
+    """
+
+    def __init__(self, proxy, name=None, started=True, resync=None):
+        """
+        :param proxy: the ShapeshifterProxy to push the updates to
+        :param name: a name for this listener, e.g. for its metrics
+        :param started: whether to push the updates right away, or to
+                        ignore them until bootstrap() or resume() is called
+        :param resync: called with this dispatcher once sending failed, to
+                       bootstrap it the whole graph again, None to queue
+                       the failed batch again instead
+        """
+        self.proxy = proxy
+        self.resync = resync
+        self.name = name if name else str(proxy)
+        self.started = started
+        # Whether the listener tracks the graph versions
+        self.versioned = False
+        self._cond = Condition()
+        # (edges, node properties, version, chunks)
+        self._bootstrap = None
+        self._version = None  # The graph version of the pending batch
+        self._edges = OrderedDict()  # (u, v): (remove first?, data or None)
+        self._nodes = {}  # node: properties
+        # (u, prefix): (remove first?, data or None)
+        self._prefixes = OrderedDict()
+        self._prefix_nodes = {}  # prefix: properties
+        self._updates = 0  # Updates merged in the pending batch
+        self._since = None  # When the oldest pending update was pushed
+        self._sending = False
+        self.running = True
+        # Metrics
+        self.pushed = self.sent = self.coalesced = self.elided = 0
+        self.failed = 0
+        self.max_lag = self.last_lag = self.last_send = 0
+        self._thread = Thread(target=self._run,
+                              name='listener_%s' % self.name)
+        self._thread.setDaemon(True)
+        self._thread.start()
+
+    def bootstrap(self, graph, node_properties, version=None,
+                  versioned=False, chunks=None):
+        """
+        Queue a full graph, superseding any pending update
+        :param graph: the list of edges (u, v, data)
+        :param node_properties: a dict node: properties
+        :param version: the version of that graph
+        :param versioned: whether the listener tracks the graph versions
+        :param chunks: to stream the graph instead, an iterable of
+                       (EDGES, list of edges) then of (NODES, properties),
+                       consumed by the sender thread. The graph can then
+                       change while it is streamed, as the updates pushed
+                       meanwhile are sent afterwards.
+        """
+        with self._cond:
+            self.started = True
+            self.versioned = versioned
+            self._edges.clear()
+            self._nodes.clear()
+            self._prefixes.clear()
+            self._prefix_nodes.clear()
+            self._bootstrap = graph, node_properties, version, chunks
+            self._version = version
+            self._pushed()
+
+    def resume(self, deltas):
+        """
+        Start pushing the updates to a listener which already has the graph
+        that preceded the given deltas
+        :param deltas: the list of (version, added, removed, node properties,
+                       prefixes) the listener missed, see push()
+        """
+        with self._cond:
+            self.started = self.versioned = True
+            for version, added, removed, node_properties, prefixes in deltas:
+                self.push(added, removed, node_properties, version, prefixes)
+
+    def push(self, added, removed, node_properties, version=None,
+             prefixes=None):
+        """
+        Queue a graph update, the edge and node properties are sent later
+        on and must thus not be modified afterwards
+        :param added: the list of added or updated edges (u, v, data)
+        :param removed: the list of removed edges (u, v)
+        :param node_properties: a dict node: properties
+        :param version: the version of the graph once updated
+        :param prefixes: the changes of the prefix attachments, as
+                         (added, removed, node properties), or None
+        """
+        with self._cond:
+            if not self.started:
+                return
+            self._version = version
+            for u, v, data in added:
+                self._merge(self._edges, (u, v), data)
+            for u, v in removed:
+                self._merge(self._edges, (u, v), None)
+            for n, data in node_properties.iteritems():
+                if n in self._nodes:
+                    self.elided += 1
+                self._nodes[n] = data
+            if prefixes:
+                self._push_prefixes(*prefixes)
+            self._pushed()
+
+    def _merge(self, pending, key, data, remove_first=False):
+        """
+        Record the latest state of an edge in a pending batch
+        :param pending: the OrderedDict of the pending edges or prefixes
+        :param data: the edge properties, None if it is removed
+        :param remove_first: whether the edge was removed before being
+                             added with data
+        """
+        old = pending.pop(key, None)
+        if old:
+            self.elided += 1
+        # Removing then adding an edge resets its properties
+        pending[key] = (data is not None and
+                        (remove_first or
+                         (old is not None and (old[0] or old[1] is None))),
+                        data)
+
+    def _push_prefixes(self, added, removed, node_properties):
+        for u, p, data in added:
+            self._merge(self._prefixes, (u, p), data)
+        for u, p in removed:
+            self._merge(self._prefixes, (u, p), None)
+        for p, data in node_properties.iteritems():
+            if p in self._prefix_nodes:
+                self.elided += 1
+            self._prefix_nodes[p] = data
+
+    def _pushed(self):
+        if self._updates:
+            self.coalesced += 1
+        else:
+            self._since = time.time()
+        self._updates += 1
+        self.pushed += 1
+        self._cond.notify()
+
+    def _run(self):
+        while self.running:
+            with self._cond:
+                while self.running and not self._updates:
+                    self._cond.wait()
+                if not self.running:
+                    return
+                bootstrap, self._bootstrap = self._bootstrap, None
+                edges, self._edges = self._edges, OrderedDict()
+                nodes, self._nodes = self._nodes, {}
+                prefixes, self._prefixes = self._prefixes, OrderedDict()
+                prefix_nodes, self._prefix_nodes = self._prefix_nodes, {}
+                since, self._updates = self._since, 0
+                version, versioned = self._version, self.versioned
+                self._sending = True
+            start = time.time()
+            try:
+                self._send(bootstrap, edges, nodes, prefixes, prefix_nodes,
+                           version if versioned else None)
+            except Exception as e:
+                log.error('Failed to push the graph changes to %s: %s',
+                          self.name, e)
+                log.exception(e)
+                self._failed(since, bootstrap, edges, nodes, prefixes,
+                             prefix_nodes)
+            with self._cond:
+                self._sending = False
+                now = time.time()
+                self.sent += 1
+                self.last_send = now - start
+                self.last_lag = now - since
+                latency.record(latency.LISTENER_PUSH, self.last_send)
+                latency.record(latency.LISTENER_LAG, self.last_lag)
+                self.max_lag = max(self.max_lag, self.last_lag)
+                self._cond.notify_all()
+
+    def _failed(self, since, bootstrap, edges, nodes, prefixes,
+                prefix_nodes):
+        """Recover from a batch that could not be sent"""
+        with self._cond:
+            self.failed += 1
+            # Wait for the listener to recover, unless stopped
+            deadline = time.time() + RETRY_DELAY
+            while self.running and time.time() < deadline:
+                self._cond.wait(deadline - time.time())
+            if not self.running or self._bootstrap is not None:
+                return  # Superseded by the pending bootstrap
+            if self.resync is None:
+                if bootstrap is not None and bootstrap[3] is not None:
+                    log.error('Cannot stream the graph to %s again, it is '
+                              'out of sync', self.name)
+                else:
+                    self._requeue(since, bootstrap, edges, nodes, prefixes,
+                                  prefix_nodes)
+                return
+        log.info('Pushing the whole graph to %s again', self.name)
+        self.resync(self)
+
+    def _requeue(self, since, bootstrap, edges, nodes, prefixes,
+                 prefix_nodes):
+        """Queue a batch again, under the updates pushed since then"""
+        self._bootstrap = bootstrap
+        for old, newer in ((edges, self._edges), (prefixes, self._prefixes)):
+            for key, (remove_first, data) in newer.iteritems():
+                self._merge(old, key, data, remove_first)
+        nodes.update(self._nodes)
+        prefix_nodes.update(self._prefix_nodes)
+        self._edges, self._nodes = edges, nodes
+        self._prefixes, self._prefix_nodes = prefixes, prefix_nodes
+        self._since = since
+        self._updates += 1
+        self._cond.notify()
+
+    def _send(self, bootstrap, edges, nodes, prefixes, prefix_nodes,
+              version):
+        if bootstrap:
+            self._send_bootstrap(*bootstrap, versioned=version is not None)
+        for (u, v), (remove_first, data) in edges.iteritems():
+            if data is not None:
+                if remove_first:
+                    self.proxy.remove_edge(u, v)
+                self.proxy.add_edge(u, v, data)
+        for (u, v), (_, data) in edges.iteritems():
+            if data is None:
+                self.proxy.remove_edge(u, v)
+        if prefixes or prefix_nodes:
+            # The removals are applied first
+            self.proxy.update_prefixes(
+                added=[(u, p, data) for (u, p), (_, data)
+                       in prefixes.iteritems() if data is not None],
+                removed=[(u, p) for (u, p), (remove_first, data)
+                         in prefixes.iteritems()
+                         if remove_first or data is None],
+                node_properties=prefix_nodes)
+        if nodes:
+            self.proxy.update_node_properties(**nodes)
+        if bootstrap and not edges and not nodes and not prefixes and \
+                not prefix_nodes:
+            return
+        if version is not None:
+            self.proxy.commit(version=version)
+        else:
+            self.proxy.commit()
+
+    def _send_bootstrap(self, graph, node_properties, version, chunks,
+                        versioned):
+        # The versions are only given to the listeners expecting them
+        kw = {'version': version} if versioned else {}
+        if chunks is None:
+            self.proxy.bootstrap_graph(graph=graph,
+                                       node_properties=node_properties, **kw)
+            return
+        self.proxy.bootstrap_begin(**kw)
+        for kind, chunk in chunks:
+            if kind == EDGES:
+                self.proxy.bootstrap_edges(chunk)
+            else:
+                self.proxy.bootstrap_nodes(chunk)
+        self.proxy.bootstrap_end(**kw)
+
+    def lag(self):
+        """:return: how long the oldest pending update has been waiting"""
+        with self._cond:
+            return time.time() - self._since if self._updates else 0
+
+    def wait_idle(self, timeout=None):
+        """
+        Wait until all pushed updates have been sent
+        :param timeout: the maximal time to wait, in seconds
+        :return: whether all updates have been sent
+        """
+        deadline = time.time() + timeout if timeout is not None else None
+        with self._cond:
+            while self._updates or self._sending:
+                remaining = (deadline - time.time() if deadline is not None
+                             else None)
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            return True
+
+    def stop(self, timeout=None):
+        """
+        Stop the sender thread, dropping the pending updates
+        :param timeout: how long to wait for it to finish its current batch,
+                        in seconds, None to wait until it did
+        :return: whether the sender thread has exited
+        """
+        with self._cond:
+            self.running = False
+            self._cond.notify_all()
+        if self._thread is not current_thread():
+            self._thread.join(timeout)
+        return not self._thread.is_alive()
+
+    def stats(self):
+        """:return: the metrics of this listener"""
+        with self._cond:
+            return {'version': self._version,
+                    'pushed': self.pushed,
+                    'sent': self.sent,
+                    'coalesced': self.coalesced,
+                    'elided': self.elided,
+                    'failed': self.failed,
+                    'pending': self._updates,
+                    'lag': time.time() - self._since if self._updates else 0,
+                    'last_lag': self.last_lag,
+                    'max_lag': self.max_lag,
+                    'last_send': self.last_send}
@@ -1,15 +1,20 @@
 from collections import OrderedDict
+from ConfigParser import DEFAULTSECT
 import subprocess
 import sys
 import os
+import time
 
 import fibbingnode
 from lsdb import LSDB
-from fibbingnode.misc.utils import require_cmd, force, ConfigDict
+from binfeed import read_records
+import latency
+from fibbingnode.misc.utils import require_cmd, force, ConfigDict, read_lines
 from fibbingnode.misc.router import QuaggaRouter, RouterConfigDict
 from namespaces import NetworkNamespace, RootNamespace
 
 log = fibbingnode.log
+CFG = fibbingnode.CFG
 
 # Ensures that we have a temp directory to store all configs, ...
 RUN = '/run/quagga'
@@ -265,20 +270,15 @@ class RootRouter(Router):
         force(os.unlink, self.lsdb_log_file_name)
 
     def parse_lsdblog(self):
-        def fifo_readline(f):
-            buf = ''
-            data = True
-            while data:
-                data = f.read(1)
-                buf += data
-                if data == '\n':
-                    yield buf
-                    buf = ''
-
         self.lsdb_log_file = open(self.lsdb_log_file_name, 'r')
-        for line in fifo_readline(self.lsdb_log_file):
+        reader = (read_records if self.lsdb.feed_format == 'binary'
+                  else read_lines)
+        for line in reader(self.lsdb_log_file.fileno(),
+                           CFG.getint(DEFAULTSECT, 'lsdb_read_chunk')):
             try:
-                self.lsdb.commit_change(line[:-1])
+                start = time.time()
+                self.lsdb.commit_change(line)
+                latency.record(latency.COMMIT_CHANGE, time.time() - start)
             except Exception as e:
                 # We do not want to crash the whole node ...
                 # rather log the error
@@ -9,7 +9,10 @@ from link import Link, PhysicalLink
 from entities import Router, RootRouter, Bridge
 from ipaddress import ip_network, ip_interface, ip_address
 from fibbingnode.misc.sjmp import SJMPServer
+from fibbingnode.misc.utils import interface_ip
+from fibbingnode.misc.prefix_trie import PrefixTrie
 from interface import FakeNodeProxy
+import census
 
 
 def gen_physical_ports(port_list):
@@ -72,8 +75,8 @@ class FibbingManager(object):
         # Used to assign unique router-id to each node
         self.next_id = 1
         self.links = []
-        # The fibbing routes
-        self.routes = {}
+        # The fibbing routes, by prefix
+        self.routes = PrefixTrie()
         self.route_mappings = {}
 
     def start(self, phys_ports, nodecount=None):
@@ -184,6 +187,29 @@ class FibbingManager(object):
         for route in self.routes.values():
             log.info(route)
 
+    def shadowing_routes(self, network):
+        """
+        :param network: a prefix, e.g. of an external route
+        :return: the fibbing routes towards that prefix or towards any
+                 prefix it covers
+        """
+        return [route for _, route in self.routes.covered_by(network)]
+
+    def route_for(self, address):
+        """
+        :param address: an address or a prefix
+        :return: the fibbing route of the longest prefix covering it,
+                 None if none
+        """
+        try:
+            return self.routes.longest_match(address)[1]
+        except KeyError:
+            return None
+
+    def census(self):
+        """:return: a census.Census of the LSDB and of the fibbing routes"""
+        return census.take(self.lsdb, self)
+
     def cleanup(self):
         """
         Cleanup all namespaces/links/...
@@ -284,7 +310,7 @@ class FibbingManager(object):
                         fwd_addr = fwd_addr[0]
                     cost = 1
                 try:
-                    fwd_addr = str(ip_interface(fwd_addr).ip)
+                    fwd_addr = interface_ip(fwd_addr)
                 except ValueError:
                     log.debug('Forwarding address for %s-%s has no netmask: %s',
                               src, dst, fwd_addr)
@@ -311,6 +337,13 @@ class FibbingManager(object):
     def proxy_connected(self, session):
         self.root.send_lsdblog_to(session)
 
+    def proxy_resume(self, token, version):
+        """
+        :param token: the token of a northbound session
+        :param version: the graph version the listener has, possibly None
+        """
+        self.lsdb.resume_listener(token, version)
+
     @property
     def lsdb(self):
         return self.root.lsdb
@@ -338,6 +371,9 @@ class FakeNodeProxyImplem(FakeNodeProxy):
     def remove(self, points):
         self.mngr.proxy_remove(self._get_point_list(points, 4))
 
+    def resume(self, token, version):
+        self.mngr.proxy_resume(token, version)
+
     @staticmethod
     def _get_point_list(points, tuple_len):
         if not points:
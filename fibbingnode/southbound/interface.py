@@ -42,6 +42,15 @@ class FakeNodeProxy(object):
                 * prefix: the network prefix corresponding to this route
         """
 
+    @abstractmethod
+    def resume(self, token, version):
+        """
+        Resume a graph session, see ShapeshifterProxy.graph_session
+        :param token: the token of the session
+        :param version: the last graph version received, None to get
+                        the full graph
+        """
+
     @staticmethod
     def exit():
         """Kill the Southbound controller"""
@@ -78,16 +87,84 @@ class ShapeshifterProxy(object):
                             names and the values their property set.
         """
 
+    def update_prefixes(self, added, removed, node_properties):
+        """
+        Update the prefixes attached to the nodes of the graph, the default
+        implementation removes then adds them as edges
+        :param added: a list of added or updated edges (node, prefix,
+                      properties)
+        :param removed: a list of edges (node, prefix) to remove, before
+                        adding the new ones
+        :param node_properties: a dict of prefix: properties
+        """
+        for source, prefix in removed:
+            self.remove_edge(source, prefix)
+        for source, prefix, properties in added:
+            self.add_edge(source, prefix, properties)
+        if node_properties:
+            self.update_node_properties(**node_properties)
+
     @abstractmethod
-    def commit(self):
+    def commit(self, version=None):
         """Signals that all updates have been pushed and that no more
-        add_edge/remove_edge calls will happen"""
+        add_edge/remove_edge calls will happen
+        :param version: the version of the graph, only given to the
+                        listeners that resumed their session"""
 
     @abstractmethod
-    def bootstrap_graph(self, graph, node_properties):
+    def bootstrap_graph(self, graph, node_properties, version=None):
         """
         Instantiate an initial graph
         :param graph: a list of edges for that graph (router-id and/or
                         prefixes) + associated properties
         :param node_properties: a dict of node: properties
+        :param version: the version of the graph, only given to the
+                        listeners that resumed their session
+        """
+
+    def bootstrap_begin(self, version=None):
+        """
+        Start streaming an initial graph, the default implementation
+        collects it and then calls bootstrap_graph
+        :param version: as for bootstrap_graph
+        """
+        self._bootstrap_edges = []
+        self._bootstrap_nodes = {}
+
+    def bootstrap_edges(self, edges):
+        """
+        Receive a chunk of the initial graph
+        :param edges: a list of edges, as for bootstrap_graph
+        """
+        self._bootstrap_edges.extend(edges)
+
+    def bootstrap_nodes(self, node_properties):
+        """
+        Receive the properties of some nodes of the initial graph, once all
+        its edges have been received
+        :param node_properties: a dict of node: properties
+        """
+        self._bootstrap_nodes.update(node_properties)
+
+    def bootstrap_end(self, version=None):
+        """
+        Signals that the whole initial graph has been streamed
+        :param version: as for bootstrap_graph
+        """
+        edges, nodes = self._bootstrap_edges, self._bootstrap_nodes
+        del self._bootstrap_edges, self._bootstrap_nodes
+        if version is not None:
+            self.bootstrap_graph(edges, nodes, version=version)
+        else:
+            self.bootstrap_graph(edges, nodes)
+
+    def graph_session(self, token):
+        """
+        Signals that a new session started. A listener that kept its graph
+        from a previous session can call FakeNodeProxy.resume(token, version)
+        to only receive the updates it missed, the updates and the graph are
+        then versioned. Otherwise, the whole graph is pushed after a delay.
+        This is only called if the fibbing node sets listener_resume_timeout,
+        the whole graph is otherwise pushed right away.
+        :param token: the token identifying this session
         """
@@ -0,0 +1,152 @@
+"""
+Latency histograms for each stage of the LSA pipeline, from the LSDB log
+FIFO to the northbound listeners.
+
+Stages:
+    commit_change       handing a line read by RootRouter.parse_lsdblog over
+                        to the LSDB (LSDB.commit_change)
+    queue_wait          from LSDB.commit_change until the processing thread
+                        picks the line
+    parse               decoding a line and applying it (LSDB.process_line)
+    transaction_commit  Transaction.commit
+    build_graph         bringing the graph up to date with the LSDB
+    diff                computing the graph changes in LSDB.update_graph
+    update              from the oldest line covered by a graph update until
+                        that update is pushed to the listener dispatchers
+    listener_push       sending a batch of updates to a listener
+    listener_lag        from a graph update until its listener received it
+    render              drawing the graph (draw_graph), off the LSA thread
+"""
+import json
+import math
+import threading
+from collections import OrderedDict
+
+COMMIT_CHANGE = 'commit_change'
+QUEUE_WAIT = 'queue_wait'
+PARSE = 'parse'
+TRANSACTION_COMMIT = 'transaction_commit'
+BUILD_GRAPH = 'build_graph'
+DIFF = 'diff'
+UPDATE = 'update'
+LISTENER_PUSH = 'listener_push'
+LISTENER_LAG = 'listener_lag'
+RENDER = 'render'
+
+
+class LatencyHistogram(object):
+    """
+    A histogram of durations with logarithmic buckets, four per power of
+    two from 1us to ~67s, such that percentiles are within 19% of the
+    actual value.
+    """
+    RESOLUTION = 1e-6
+    BUCKETS_PER_OCTAVE = 4
+    BUCKETS = 26 * BUCKETS_PER_OCTAVE
+    _SCALE = BUCKETS_PER_OCTAVE / math.log(2)
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.buckets = [0] * self.BUCKETS
+            self.count = 0
+            self.total = 0.0
+            self.max = 0.0
+
+    def record(self, duration):
+        """:param duration: a duration, in seconds"""
+        if duration > self.RESOLUTION:
+            i = min(int(math.log(duration / self.RESOLUTION) * self._SCALE),
+                    self.BUCKETS - 1)
+        else:
+            i = 0
+        with self.lock:
+            self.buckets[i] += 1
+            self.count += 1
+            self.total += duration
+            if duration > self.max:
+                self.max = duration
+
+    @classmethod
+    def upper_bound(cls, i):
+        """:return: the largest duration counted in bucket i"""
+        return cls.RESOLUTION * 2 ** (float(i + 1) / cls.BUCKETS_PER_OCTAVE)
+
+    def percentile(self, p):
+        """
+        :param p: the percentile, in [0, 100]
+        :return: the upper bound of the bucket holding that percentile,
+                 capped by the maximal duration, 0 if the histogram is empty
+        """
+        with self.lock:
+            rank = self.count * p / 100.
+            seen = 0
+            for i, n in enumerate(self.buckets):
+                seen += n
+                if n and seen >= rank:
+                    return min(self.upper_bound(i), self.max)
+            return self.max
+
+    def to_dict(self):
+        """:return: the summary and the non-empty buckets of the histogram,
+                    durations are in seconds"""
+        summary = {'count': self.count,
+                   'mean': self.total / self.count if self.count else 0,
+                   'max': self.max}
+        for p in (50, 90, 99):
+            summary['p%d' % p] = self.percentile(p)
+        with self.lock:
+            summary['buckets'] = [(self.upper_bound(i), n)
+                                  for i, n in enumerate(self.buckets) if n]
+        return summary
+
+    def __str__(self):
+        if not self.count:
+            return 'no samples'
+        d = self.to_dict()
+        return ('%(count)d samples, mean %(mean).6fs, p50 %(p50).6fs, '
+                'p90 %(p90).6fs, p99 %(p99).6fs, max %(max).6fs' % d)
+
+
+STAGES = OrderedDict((stage, LatencyHistogram())
+                     for stage in (COMMIT_CHANGE, QUEUE_WAIT, PARSE,
+                                   TRANSACTION_COMMIT, BUILD_GRAPH, DIFF,
+                                   UPDATE, LISTENER_PUSH, LISTENER_LAG,
+                                   RENDER))
+# Set by the LSDB when it starts, from its latency_histograms setting
+_enabled = False
+
+
+def enable(enabled=True):
+    """Start or stop recording the latencies"""
+    global _enabled
+    _enabled = enabled
+
+
+def record(stage, duration):
+    """
+    :param stage: the stage name
+    :param duration: how long it took, in seconds
+    """
+    if _enabled:
+        STAGES[stage].record(duration)
+
+
+def reset():
+    """Clear all histograms"""
+    for h in STAGES.itervalues():
+        h.reset()
+
+
+def report():
+    """:return: a dict stage: summary of its histogram, see to_dict()"""
+    return OrderedDict((stage, h.to_dict()) for stage, h in STAGES.iteritems())
+
+
+def dump(path):
+    """Write the histograms of all stages as JSON"""
+    with open(path, 'w') as f:
+        json.dump(report(), f, indent=2)
@@ -0,0 +1,135 @@
+"""
+The bounded queue between the LSDB log reader and the LSA processing thread.
+"""
+from collections import deque
+from Queue import Empty
+from threading import Condition
+import time
+
+# What to do with the lines read while the queue is full
+BLOCK = 'block'  # Wait until the processing thread catches up
+COLLAPSE = 'collapse'  # Replace the pending line of the same LSA, if any
+POLICIES = (BLOCK, COLLAPSE)
+
+
+class LSAQueue(object):
+    """
+    A FIFO of (time queued, line), with the get/put/task_done/join methods
+    of Queue.Queue. Once maxsize lines are pending, putting a line waits
+    until the processing thread takes one, unless the policy is COLLAPSE
+    and a line of the same LSA is pending in the same transaction, i.e.
+    with no line that does not describe an LSA (e.g. BEGIN or COMMIT) put
+    after it. The new line then replaces the pending one, keeping its
+    place and time. The lines are never collapsed while the queue is not
+    full, nor across transaction boundaries, thus the processing thread
+    sees the transactions as they were logged, minus the intermediate
+    states of LSAs within a transaction.
+    """
+
+    def __init__(self, maxsize=0, policy=BLOCK, key=None):
+        """
+        :param maxsize: the maximal number of pending lines, 0 if unbounded
+        :param policy: BLOCK or COLLAPSE
+        :param key: a function giving the LSA identity of a line, None if
+                    the line does not describe an LSA
+        """
+        if policy not in POLICIES:
+            raise ValueError('Unknown queue policy %s, expected one of %s' %
+                             (policy, POLICIES))
+        self.maxsize = maxsize
+        self.collapse = policy == COLLAPSE
+        self.key = key
+        self._cond = Condition()
+        self._lines = deque()  # [time queued, line, key, boundaries]
+        self._pending = {}  # key: the newest entry of that LSA in _lines
+        # How many lines that do not describe an LSA have been put
+        self._boundaries = 0
+        self._unfinished = 0
+        # Metrics
+        self.high_water = 0
+        self.collapsed = 0
+        self.blocked = 0  # How many puts had to wait
+        self.blocked_time = 0.0
+
+    def put(self, item, block=True):
+        """
+        :param item: (time queued, line)
+        :param block: False to ignore maxsize, e.g. to stop the consumer
+        """
+        queued, line = item
+        key = self.key(line) if self.collapse else None
+        with self._cond:
+            if block and self.maxsize and len(self._lines) >= self.maxsize:
+                if key is not None:
+                    old = self._pending.get(key)
+                    if old is not None and old[3] == self._boundaries:
+                        old[1] = line
+                        self.collapsed += 1
+                        return
+                self.blocked += 1
+                start = time.time()
+                while len(self._lines) >= self.maxsize:
+                    self._cond.wait()
+                self.blocked_time += time.time() - start
+            if key is None:
+                self._boundaries += 1
+            entry = [queued, line, key, self._boundaries]
+            self._lines.append(entry)
+            if key is not None:
+                self._pending[key] = entry
+            self._unfinished += 1
+            if len(self._lines) > self.high_water:
+                self.high_water = len(self._lines)
+            self._cond.notify_all()
+
+    def get(self, timeout=None):
+        """
+        :param timeout: how long to wait for a line, in seconds
+        :return: (time queued, line)
+        :raise Empty: if no line was queued before the timeout
+        """
+        with self._cond:
+            if timeout is not None:
+                deadline = time.time() + timeout
+            while not self._lines:
+                if timeout is None:
+                    self._cond.wait()
+                else:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        raise Empty
+                    self._cond.wait(remaining)
+            entry = self._lines.popleft()
+            key = entry[2]
+            if key is not None and self._pending.get(key) is entry:
+                del self._pending[key]
+            self._cond.notify_all()
+            return entry[0], entry[1]
+
+    def task_done(self):
+        with self._cond:
+            self._unfinished -= 1
+            self._cond.notify_all()
+
+    def join(self):
+        """Wait until all lines have been processed"""
+        with self._cond:
+            while self._unfinished > 0:
+                self._cond.wait()
+
+    def qsize(self):
+        return len(self._lines)
+
+    def lag(self):
+        """:return: how long the oldest pending line has been queued"""
+        with self._cond:
+            return time.time() - self._lines[0][0] if self._lines else 0
+
+    def stats(self):
+        """:return: the metrics of the queue"""
+        return {'depth': len(self._lines),
+                'high_water': self.high_water,
+                'lag': self.lag(),
+                'collapsed': self.collapsed,
+                'blocked': self.blocked,
+                'blocked_time': self.blocked_time}
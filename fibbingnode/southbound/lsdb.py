@@ -1,19 +1,32 @@
-from Queue import Queue, Empty
+from Queue import Empty
 from abc import abstractmethod
-from collections import defaultdict
+from collections import defaultdict, Counter, deque
 from itertools import chain
+from operator import itemgetter
 import functools
-from threading import Thread
+from hashlib import md5
+from threading import Thread, Lock, RLock, Timer, current_thread
 import json
+import os
+import time
+import uuid
+from weakref import WeakValueDictionary
 from ConfigParser import DEFAULTSECT
 
 from fibbingnode import log, CFG
 from interface import ShapeshifterProxy
+from dispatch import ListenerDispatcher, EDGES, NODES
+import snapshot
+import latency
+from lsaqueue import LSAQueue
+from render import GraphRenderer
 from fibbingnode.misc.sjmp import ProxyCloner
 from fibbingnode.misc.igp_graph import IGPGraph
-from fibbingnode.misc.utils import is_container
+from fibbingnode.misc.prefix_trie import PrefixTrie
+from fibbingnode.misc.utils import is_container, parse_address, prefix_of,\
+    address_to_int, int_to_address, size_address_caches
 
-from ipaddress import ip_interface, ip_address, ip_network
+from ipaddress import ip_network
 
 ADD = 'ADD'
 FWD_ADDR = 'fwd_addr'
@@ -38,23 +51,77 @@ SEP_INTER_FIELD = ';'
 # for line in ... in parse_lsdblog()
 SEP_LSA = '\n'
 
+# Seconds without LSDB updates after which a pending transaction is split
+TRANSACTION_TIMEOUT = 5
+
+# Seconds to wait for a listener to finish sending its updates when stopping
+LISTENER_STOP_TIMEOUT = 5
+
+# The forwarding address of AS-External routes through their advertizer
+UNSPECIFIED_ADDRESSES = frozenset(('0.0.0.0', 0))
+
+
+def format_fields(names, values):
+    """:return: the fields of an LSDB log line group, e.g. 'rid:1.0.0.1;'"""
+    return ''.join('%s%s%s%s' % (name, SEP_INTRA_FIELD, value, SEP_INTER_FIELD)
+                   for name, value in zip(names, values))
+
+
+def external_address(value):
+    """
+    :return: value with the addresses represented as int converted
+             to their dotted-quad form, lists are converted element-wise.
+             The addresses represented as strings are returned as-is.
+    """
+    if type(value) is int or type(value) is long:
+        return int_to_address(value)
+    if isinstance(value, list):
+        return map(external_address, value)
+    return value
+
 
 class Link(object):
     TYPE = '0'
+    # LSAs and links are numerous, keep their footprint low
+    __slots__ = ('address', 'metric')
+    # Whether the link_data field holds an address
+    DATA_IS_ADDRESS = True
 
     def __init__(self, address=None, metric=0):
         self.address = address
         self.metric = metric
 
+    # The fields describing a link in a Router LSA
+    FIELDS = (LINK_TYPE, LINKID, LINK_DATA, METRIC)
+
     @staticmethod
-    def parse(lsa_prop):
-        for subcls in Link.__subclasses__():
-            if subcls.TYPE == lsa_prop[LINK_TYPE]:
-                return subcls(lsa_prop[LINKID],
-                              lsa_prop[LINK_DATA],
-                              lsa_prop[METRIC])
-        log.error('Couldn''t parse the link %s', lsa_prop)
-        return None
+    def parse(fields, address_id):
+        """
+        Create a new Link from its description in the LSDB log
+        :param fields: the values of Link.FIELDS
+        :param address_id: the representation of the addresses, see
+                           LSDB.address_id
+        :return: a new Link instance or None
+        """
+        link_type, linkid, link_data, metric = fields
+        try:
+            cls = LINK_TYPES[link_type]
+        except KeyError:
+            log.error('Couldn''t parse the link %s', fields)
+            return None
+        return cls(address_id(linkid),
+                   (address_id(link_data) if cls.DATA_IS_ADDRESS
+                    else intern(link_data)),
+                   intern(metric))
+
+    def lsa_info(self):
+        """:return: the description of this link in the LSDB log"""
+        return format_fields(self.FIELDS, (self.TYPE,) + self.log_fields() +
+                             (self.metric,))
+
+    @abstractmethod
+    def log_fields(self):
+        """:return: the link_id and link_data of this link in the LSDB log"""
 
     @abstractmethod
     def endpoints(self, lsdb):
@@ -67,27 +134,36 @@ class Link(object):
         """
 
     def __str__(self):
-        return '%s:%s' % (self.address, self.metric)
+        return '%s:%s' % (external_address(self.address), self.metric)
 
 
 class P2PLink(Link):
     TYPE = '1'
+    __slots__ = ('other_routerid',)
 
     def __init__(self, linkid, link_data, metric):
         super(P2PLink, self).__init__(address=link_data, metric=metric)
         self.other_routerid = linkid
 
+    def log_fields(self):
+        return (external_address(self.other_routerid),
+                external_address(self.address))
+
     def endpoints(self, lsdb):
         return [self.other_routerid]
 
 
 class TransitLink(Link):
     TYPE = '2'
+    __slots__ = ('dr_ip',)
 
     def __init__(self, linkid, link_data, metric):
         super(TransitLink, self).__init__(address=link_data, metric=metric)
         self.dr_ip = linkid
 
+    def log_fields(self):
+        return external_address(self.dr_ip), external_address(self.address)
+
     def endpoints(self, lsdb):
         other_routers = []
         netdb = lsdb.lsdb(NetworkLSA)
@@ -102,6 +178,8 @@ class TransitLink(Link):
 
 class StubLink(Link):
     TYPE = '3'
+    __slots__ = ('mask',)
+    DATA_IS_ADDRESS = False
 
     def __init__(self, linkid, link_data, metric):
         super(StubLink, self).__init__(address=linkid, metric=metric)
@@ -109,7 +187,10 @@ class StubLink(Link):
 
     @property
     def prefix(self):
-        return ip_interface('%s/%s' % (self.address, self.mask)).with_prefixlen
+        return prefix_of(external_address(self.address), self.mask)
+
+    def log_fields(self):
+        return external_address(self.address), self.mask
 
     def endpoints(self, lsdb):
         # return [self.prefix]
@@ -120,16 +201,27 @@ class StubLink(Link):
 
 class VirtualLink(Link):
     TYPE = '4'
+    __slots__ = ()
 
     def __init__(self, *args, **kwargs):
         log.debug('Ignoring virtual links')
         super(VirtualLink, self).__init__()
 
+    def log_fields(self):
+        return '0.0.0.0', '0.0.0.0'
+
     def endpoints(self, lsdb):
         return []
 
 
+LINK_TYPES = {link.TYPE: link
+              for link in (P2PLink, TransitLink, StubLink, VirtualLink)}
+
+
 class LSAHeader(object):
+    __slots__ = ('routerid', 'linkid', 'lsa_type', 'mask')
+    FIELDS = (RID, LINKID, LSA_TYPE, MASK)
+
     def __init__(self, routerid, linkid, lsa_type, mask):
         self.routerid = routerid
         self.linkid = linkid
@@ -137,35 +229,37 @@ class LSAHeader(object):
         self.mask = mask
 
     @staticmethod
-    def parse(prop_dict):
-        try:
-            mask = prop_dict[MASK]
-        except KeyError:
-            mask = None
-        return LSAHeader(prop_dict[RID],
-                         prop_dict[LINKID],
-                         prop_dict[LSA_TYPE],
-                         mask)
+    def parse(fields, address_id):
+        """
+        :param fields: the values of LSAHeader.FIELDS
+        :param address_id: the representation of the addresses, see
+                           LSDB.address_id
+        :return: a new LSAHeader instance
+        """
+        routerid, linkid, lsa_type, mask = fields
+        return LSAHeader(address_id(routerid),
+                         intern(linkid),
+                         lsa_type,
+                         intern(mask) if mask is not None else None)
 
 
 class LSA(object):
     TYPE = '0'
+    __slots__ = ()
+    # The fields needed from each group following the header
+    FIELDS = ()
 
     @staticmethod
-    def parse(lsa_header, lsa_prop):
+    def parse(lsa_header, lsa_prop, address_id):
         """
-        Create a new LSA based on the property dicts given
+        Create a new LSA based on its description in the LSDB log
         :param lsa_header: an LSAHeader instance
-        :param lsa_prop: a property dictionary
+        :param lsa_prop: for each group following the header,
+                         the values of the FIELDS of that LSA type
+        :param address_id: the representation of the addresses, see
+                           LSDB.address_id
         :return: a new LSA instance
         """
-        for subcls in LSA.__subclasses__():
-            if subcls.TYPE == lsa_header.lsa_type:
-                return subcls.parse(lsa_header, lsa_prop)
-        log.debug('Couldn''t parse the LSA type %s [%s]',
-                  lsa_header.lsa_type,
-                  lsa_prop)
-        return UnusedLSA()
 
     @abstractmethod
     def key(self):
@@ -175,6 +269,13 @@ class LSA(object):
         :return: key
         """
 
+    @abstractmethod
+    def lsa_info(self):
+        """
+        :return: the description of this LSA in the LSDB log, without its
+                 action, which parse_lsa reads back as an equal LSA
+        """
+
     @abstractmethod
     def apply(self, graph, lsdb):
         """
@@ -194,6 +295,8 @@ class LSA(object):
 
 
 class UnusedLSA(LSA):
+    __slots__ = ()
+
     def key(self):
         return None
 
@@ -203,6 +306,8 @@ class UnusedLSA(LSA):
 
 class RouterLSA(LSA):
     TYPE = '1'
+    __slots__ = ('routerid', 'links')
+    FIELDS = Link.FIELDS
 
     def __init__(self, routerid, links):
         self.links = links
@@ -212,9 +317,17 @@ class RouterLSA(LSA):
         return self.routerid
 
     @staticmethod
-    def parse(lsa_header, lsa_prop):
+    def parse(lsa_header, lsa_prop, address_id):
+        # The links that could not be parsed are skipped
+        links = [Link.parse(fields, address_id) for fields in lsa_prop]
         return RouterLSA(lsa_header.routerid,
-                         [Link.parse(part) for part in lsa_prop])
+                         tuple(link for link in links if link is not None))
+
+    def lsa_info(self):
+        rid = external_address(self.routerid)
+        return SEP_GROUP.join(
+            [format_fields(LSAHeader.FIELDS, (rid, rid, self.TYPE))] +
+            [link.lsa_info() for link in self.links])
 
     def apply(self, graph, lsdb):
         graph.add_router(self.routerid)
@@ -228,19 +341,27 @@ class RouterLSA(LSA):
                                metric=link.metric,
                                src_address=link.address)
 
-    def contract_graph(self, graph, private_ips):
+    def contracted_addresses(self, private_ips):
+        """
+        Give the list of addresses that belong to this router, and thus
+        must be represented by its router-id in the graph
+        :param private_ips: the private addresses bound to this router
+        :return: list of IPs
+        """
         ips = [link.address for link in self.links
                if link.address != self.routerid]
         ips.extend(private_ips)
-        graph.contract(self.routerid, ips)
+        return ips
 
     def __str__(self):
-        return '[R]<%s: %s>' % (self.routerid,
+        return '[R]<%s: %s>' % (external_address(self.routerid),
                                 ', '.join([str(link) for link in self.links]))
 
 
 class NetworkLSA(LSA):
     TYPE = '2'
+    __slots__ = ('dr_ip', 'mask', 'attached_routers')
+    FIELDS = (RID,)
 
     def __init__(self, dr_ip, mask, attached_routers):
         self.mask = mask
@@ -251,71 +372,124 @@ class NetworkLSA(LSA):
         return self.dr_ip
 
     @staticmethod
-    def parse(lsa_header, lsa_prop):
-        return NetworkLSA(dr_ip=lsa_header.linkid, mask=lsa_header.mask,
-                          attached_routers=[part[RID] for part in lsa_prop])
+    def parse(lsa_header, lsa_prop, address_id):
+        return NetworkLSA(dr_ip=address_id(lsa_header.linkid),
+                          mask=lsa_header.mask,
+                          attached_routers=tuple(address_id(rid)
+                                                 for rid, in lsa_prop))
+
+    def lsa_info(self):
+        dr_ip = external_address(self.dr_ip)
+        return SEP_GROUP.join(
+            [format_fields(LSAHeader.FIELDS,
+                           (dr_ip, dr_ip, self.TYPE, self.mask))] +
+            [format_fields(self.FIELDS, (external_address(rid),))
+             for rid in self.attached_routers])
 
     def apply(self, graph, lsdb):
         # Unused as the RouterLSA should have done the resolution for us
         pass
 
     def __str__(self):
-        return '[N]<%s: %s>' % (self.dr_ip, ', '.join(self.attached_routers))
+        return '[N]<%s: %s>' % (external_address(self.dr_ip),
+                                ', '.join(map(external_address,
+                                              self.attached_routers)))
+
+
+class _SharedRoutes(list):
+    """
+    The routes of AS-External LSAs, shared among the LSAs and thus never
+    modified. Unlike tuples, lists can be weakly referenced.
+    """
+    __slots__ = ('__weakref__',)
 
 
 class ASExtRoute(object):
+    __slots__ = ('metric', 'fwd_addr')
+    # There are few distinct sets of routes, share them among all LSAs.
+    # They are forgotten once no LSA uses them anymore.
+    _shared = WeakValueDictionary()
+
     def __init__(self, metric, fwd_addr):
         self.metric = metric
         self.fwd_addr = fwd_addr
 
+    @staticmethod
+    def shared(routes, address_id):
+        """
+        Give the ASExtRoute instances corresponding to a set of routes
+        :param routes: a list of (metric, forwarding address)
+        :param address_id: the representation of the addresses, see
+                           LSDB.address_id
+        :return: the sequence of ASExtRoute, shared with the other LSAs
+                 having the same routes and address representation
+        """
+        key = address_id, tuple(routes)
+        try:
+            return ASExtRoute._shared[key]
+        except KeyError:
+            r = _SharedRoutes(ASExtRoute(intern(metric), address_id(fwd_addr))
+                              for metric, fwd_addr in key[1])
+            ASExtRoute._shared[key] = r
+            return r
+
 
 class ASExtLSA(LSA):
     TYPE = '5'
+    __slots__ = ('routerid', 'address', 'mask', 'routes', 'prefix')
+    FIELDS = (METRIC, FWD_ADDR)
 
     def __init__(self, routerid, address, mask, routes):
         self.routerid = routerid
         self.address = address
         self.mask = mask
         self.routes = routes
-        self.interface = ip_interface('%s/%s' % (self.address, self.mask))
-
-    @property
-    def prefix(self):
-        return self.interface.with_prefixlen
+        self.prefix = prefix_of(self.address, self.mask)
 
     def key(self):
         return self.routerid, self.prefix
 
     @staticmethod
-    def parse(lsa_header, lsa_prop):
+    def parse(lsa_header, lsa_prop, address_id):
         return ASExtLSA(lsa_header.routerid,
                         address=lsa_header.linkid,
                         mask=lsa_header.mask,
-                        routes=[ASExtRoute(part[METRIC], part[FWD_ADDR])
-                                for part in lsa_prop])
+                        routes=ASExtRoute.shared(lsa_prop, address_id))
+
+    def lsa_info(self):
+        return SEP_GROUP.join(
+            [format_fields(LSAHeader.FIELDS, (external_address(self.routerid),
+                                              self.address, self.TYPE,
+                                              self.mask))] +
+            [format_fields(self.FIELDS, (route.metric,
+                                         external_address(route.fwd_addr)))
+             for route in self.routes])
 
     def apply(self, graph, lsdb):
         for route in self.routes:
             fwd_addr = self.resolve_fwd_addr(route.fwd_addr)
-            if ip_address(self.routerid) in lsdb.BASE_NET:
+            # i.e. if self.routerid is in BASE_NET
+            if lsdb.controller_id(self.routerid) is not None:
                 try:
                     targets = lsdb.private_addresses.targets_for(fwd_addr)
                     method = functools.partial(graph.add_local_route,
                                                targets=targets)
-                except KeyError:
+                except ValueError:
                     method = graph.add_fake_route
             else:
                 method = graph.add_route
             method(fwd_addr, self.prefix, metric=route.metric)
 
     def resolve_fwd_addr(self, fwd_addr):
-        return self.routerid if fwd_addr == '0.0.0.0' else fwd_addr
+        return self.routerid if fwd_addr in UNSPECIFIED_ADDRESSES else fwd_addr
 
     def __str__(self):
         return '[E]<%s: %s>' % \
                (self.prefix,
-                ', '.join(['(%s, %s)' % (self.resolve_fwd_addr(route.fwd_addr),
-                                         route.metric)
+                ', '.join(['(%s, %s)' %
+                           (external_address(
+                               self.resolve_fwd_addr(route.fwd_addr)),
+                            route.metric)
                            for route in self.routes]))
 
     @staticmethod
@@ -323,23 +497,264 @@ class ASExtLSA(LSA):
         return True
 
 
+LSA_TYPES = {lsa.TYPE: lsa for lsa in (RouterLSA, NetworkLSA, ASExtLSA)}
+
+
+def _values_getter(positions):
+    """Return a function extracting the given positions of a list as tuple"""
+    if not positions:
+        return lambda flat: ()
+    if len(positions) == 1:
+        pos = positions[0]
+        return lambda flat: (flat[pos],)
+    return itemgetter(*positions)
+
+
+# What the group separators become in the flattened lines, i.e. a field
+# whose name and value are SEP_GROUP
+_GROUP_FIELD = SEP_INTER_FIELD + SEP_GROUP + SEP_INTRA_FIELD + SEP_GROUP + \
+    SEP_INTER_FIELD
+
+
+class _LineLayout(object):
+    """The position of the fields in the lines having a given layout"""
+
+    def __init__(self, names):
+        """
+        :param names: the field names of the flattened line, in order, the
+                      groups being separated by SEP_GROUP fields
+        """
+        # As for extract_lsa_properties, the empty groups are skipped and
+        # the last occurrence of a field in a group is the one kept
+        groups = []
+        fields = {}
+        self.marks = []  # The positions of the group separators
+        for i, name in enumerate(names):
+            if name == SEP_GROUP:
+                self.marks.append(2 * i + 1)
+                if fields:
+                    groups.append(fields)
+                    fields = {}
+            elif name:
+                fields[name] = 2 * i + 1
+        if fields:
+            groups.append(fields)
+        # An empty field name mis-aligns the names and values that follow
+        self.valid = bool(groups) and '' not in names[:-1]
+        self.separators = (SEP_GROUP,) * len(self.marks)
+        self.marks = _values_getter(self.marks)
+        self.header = _values_getter([groups[0].get(f, -1) if groups else -1
+                                      for f in LSAHeader.FIELDS])
+        self.groups = groups[1:]
+        self.getters = {}  # LSA class : getter of its group fields
+
+    def matches(self, flat):
+        """
+        :return: whether the group separators of a flattened line are where
+                 this layout expects them, i.e. whether no value shifted
+                 the fields, e.g. by holding a separator
+        """
+        return self.marks(flat) == self.separators
+
+    def lsa_groups(self, cls, flat):
+        """
+        :return: for each group, the tuple of values of cls.FIELDS
+        """
+        if not cls.FIELDS:
+            return []
+        try:
+            getter = self.getters[cls]
+        except KeyError:
+            getter = self.getters[cls] = _values_getter(
+                [group.get(f, -1) for group in self.groups
+                 for f in cls.FIELDS])
+        return zip(*[iter(getter(flat))] * len(cls.FIELDS))
+
+
+def extract_lsa_properties(lsa_part):
+    """
+    :param lsa_part: a group of fields of an LSA description
+    :return: the dict field name: value of that group
+    """
+    d = {}
+    for prop in lsa_part.split(SEP_INTER_FIELD):
+        if not prop:
+            continue
+        key, val = prop.split(SEP_INTRA_FIELD)
+        d[key] = val
+    return d
+
+
+class LSAParser(object):
+    """
+    Table-driven parser for the LSA part of the LSDB log lines.
+    The whole line is split at once into a flat list alternating field
+    names and values, the groups being separated by SEP_GROUP fields. The
+    positions of the header fields, and of the fields that the LSA class
+    needs in each of the following groups, are compiled once per distinct
+    line layout (i.e. the tuple of its field names), such that decoding a
+    line only performs a few itemgetter calls and no per-field processing.
+    The fields can be in any order within their group. The lines whose
+    layout cannot be compiled, e.g. with empty field names, are parsed
+    field by field instead, with extract_lsa_properties.
+    """
+    # Bound the number of cached layouts in case of garbage input
+    MAX_LAYOUTS = 1024
+
+    def __init__(self):
+        self.layouts = {}
+
+    def fields(self, lsa_info):
+        """
+        :param lsa_info: the LSA description, without its action
+        :return: the values of LSAHeader.FIELDS, the LSA class (None if the
+                 LSA type is not supported) and, for each group following
+                 the header, the values of the FIELDS of that class
+        """
+        flat = lsa_info.replace(SEP_INTER_FIELD + SEP_GROUP, SEP_GROUP)\
+                       .replace(SEP_GROUP, _GROUP_FIELD)\
+                       .replace(SEP_INTRA_FIELD, SEP_INTER_FIELD)\
+                       .split(SEP_INTER_FIELD)
+        # Missing fields point to that last element
+        flat.append(None)
+        names = tuple(flat[0::2])
+        try:
+            layout = self.layouts[names]
+        except KeyError:
+            if len(self.layouts) >= self.MAX_LAYOUTS:
+                self.layouts.clear()
+            layout = self.layouts[names] = _LineLayout(names)
+        if not layout.valid or not layout.matches(flat):
+            return self.dict_fields(lsa_info)
+        header = layout.header(flat)
+        cls = LSA_TYPES.get(header[2])
+        return header, cls, layout.lsa_groups(cls, flat) if cls else ()
+
+    @staticmethod
+    def dict_fields(lsa_info):
+        """The same as fields(), parsing each field one by one"""
+        groups = [extract_lsa_properties(part)
+                  for part in lsa_info.split(SEP_GROUP) if part]
+        header = tuple(groups[0].get(f) if groups else None
+                       for f in LSAHeader.FIELDS)
+        cls = LSA_TYPES.get(header[2])
+        return header, cls, ([tuple(group.get(f) for f in cls.FIELDS)
+                              for group in groups[1:]] if cls else ())
+
+    def parse(self, lsa_info, address_id=intern):
+        """
+        :param lsa_info: the LSA description, without its action
+        :param address_id: the representation of the addresses, see
+                           LSDB.address_id
+        :return: an LSA instance
+        """
+        header, cls, groups = self.fields(lsa_info)
+        if cls is None:
+            log.debug('Couldn''t parse the LSA type %s [%s]',
+                      header[2], lsa_info)
+            return UnusedLSA()
+        return cls.parse(LSAHeader.parse(header, address_id), groups,
+                         address_id)
+
+
+PARSER = LSAParser()
+
+
 class LSDB(object):
 
     def __init__(self):
         self.BASE_NET = ip_network(CFG.get(DEFAULTSECT, 'base_net'))
-        self.private_addresses = PrivateAddressStore(CFG.get(DEFAULTSECT,
-                                                             'private_ips'))
-        self.last_line = ''
+        self.controller_prefixlen = CFG.getint(DEFAULTSECT,
+                                               'controller_prefixlen')
+        size_address_caches(CFG.getint(DEFAULTSECT, 'address_cache_size'))
+        latency.enable(CFG.getboolean(DEFAULTSECT, 'latency_histograms'))
+        # How the addresses (router ids, link endpoints, DR and forwarding
+        # addresses) are represented in the LSAs, the LSDB tables and the
+        # graph, and how they are converted back to strings for the
+        # listeners. 32-bit ints are cheaper to hash and compare, and make
+        # the graph smaller, than dotted-quad strings.
+        self.integer_ids = CFG.getboolean(DEFAULTSECT, 'integer_router_ids')
+        self.address_id, self.address_str = (
+            (address_to_int, external_address) if self.integer_ids
+            else (intern, str))
+        self.private_addresses = PrivateAddressStore(
+            CFG.get(DEFAULTSECT, 'private_ips'), self.address_id)
         self.leader_watchdog = None
         self.transaction = None
         self.graph = IGPGraph()
+        # Held while the graph is updated and pushed to the listeners
+        self.graph_lock = RLock()
+        # Held by the processing thread while it changes the LSDB and the
+        # structures derived from it, for other threads to copy them. Taken
+        # before the graph lock.
+        self.lsdb_lock = Lock()
         self.routers = {}  # router-id : lsa
         self.networks = {}  # DR IP : lsa
         self.ext_networks = {}  # (router-id, dest) : lsa
+        # The same LSAs, indexed by prefix for the LPM/covering queries
+        self.ext_prefixes = PrefixTrie()  # dest : {router-id: lsa}
+        # The routers with a transit link to a LAN, to re-resolve these
+        # links when the Network LSA of the LAN changes
+        self.transit_routers = defaultdict(set)  # DR IP : router-ids
+        # The addresses contracted in the node of the router owning them
+        self.address_owners = {}  # address : router-ids claiming it
+        self.owned_addresses = {}  # router-id : addresses it claims
         self.controllers = defaultdict(list)  # controller nr : ip_list
+        # The prefixes attached by the AS-External LSAs, apart from the
+        # graph of the routers, which only changes with the Router and
+        # Network LSAs
+        self.prefix_table = PrefixTable(self)
+        self.topology_changed = True
+        self.incremental = None
+        if CFG.getboolean(DEFAULTSECT, 'incremental_graph'):
+            self.incremental = IncrementalGraph(self)
+            # The graph is then updated in place
+            self.graph = self.incremental.graph
+            # The last full rebuild, to cross-check the incremental updates
+            self.check_graph = (IGPGraph() if CFG.getboolean(
+                DEFAULTSECT, 'check_incremental_graph') else None)
+        # How to decode the lines of the LSDB feed
+        self.feed_format = CFG.get(DEFAULTSECT, 'lsdb_feed_format')
+        if self.feed_format == 'binary':
+            from binfeed import decode_record, record_key, record_removes
+            decode_line = decode_record
+            self.line_key = record_key
+            self.line_removes = record_removes
+        else:
+            decode_line = self.decode_text_line
+            self.line_key = self.text_line_key
+            self.line_removes = self.text_line_removes
+        self.decode_line = functools.partial(decode_line,
+                                             address_id=self.address_id)
+        # The digest of the last line of each LSA, to drop the periodic
+        # refreshes of unchanged LSAs, LSA key: digest
+        self.digests = ({} if CFG.getboolean(DEFAULTSECT,
+                                             'lsdb_suppress_refreshes')
+                        else None)
         self.listener = {}
+        # The sessions waiting for their listener to resume, token: listener
+        self.resuming = {}
+        self.resume_timeout = CFG.getfloat(DEFAULTSECT,
+                                           'listener_resume_timeout')
+        # The versions of the graph, the epoch tells apart the LSDB instances
+        self.graph_epoch = uuid.uuid4().hex
+        self.graph_version = 0
+        self.deltas = deque(maxlen=CFG.getint(DEFAULTSECT,
+                                              'graph_delta_history'))
+        self.stats = Counter()
+        # Draws the graph in the background, created once draw_graph is set
+        self.renderer = None
+        # The LSAs restored from a snapshot, not yet confirmed by the feed
+        self.stale = set()  # (lsa type, lsa key)
+        self.reconcile_deadline = None
+        self.snapshot_path = CFG.get(DEFAULTSECT, 'lsdb_snapshot')
+        self.last_snapshot = time.time()
+        if self.snapshot_path:
+            self.load_snapshot()
         self.keep_running = True
-        self.queue = Queue()
+        self.queue = LSAQueue(CFG.getint(DEFAULTSECT, 'lsdb_queue_size'),
+                              CFG.get(DEFAULTSECT, 'lsdb_queue_policy'),
+                              self.line_key)
         self.processing_thread = Thread(target=self.process_lsa,
                                         name="lsa_processing_thread")
         self.processing_thread.setDaemon(True)
@@ -349,13 +764,73 @@ class LSDB(object):
         self.leader_watchdog = wd
 
     def get_leader(self):
-        return min(self.controllers.iterkeys()) if self.controllers else None
+        controllers = (self.incremental.controllers if self.incremental
+                       else self.controllers)
+        return min(controllers.iterkeys()) if controllers else None
 
     def stop(self):
         for l in self.listener.values():
-            l.session.stop()
+            # Its session is only closed once no longer used by the sender
+            if not l.stop(LISTENER_STOP_TIMEOUT):
+                log.warning('The listener %s is still busy, closing its '
+                            'session anyway', l.name)
+            l.proxy.session.stop()
+        if self.renderer:
+            self.renderer.stop()
         self.keep_running = False
-        self.queue.put('')
+        self.queue.put((None, ''), block=False)
+        # It saves the last snapshot once it has processed its last line
+        if self.processing_thread is not current_thread():
+            self.processing_thread.join()
+
+    def load_snapshot(self):
+        """Warm restart from the last snapshot, if any"""
+        lsas = snapshot.load(self.snapshot_path)
+        if not lsas:
+            return
+        with self.graph_lock:
+            restored = set()
+            for lsa_info in lsas:
+                lsa = self.parse_lsa(lsa_info)
+                if lsa.key() is not None:
+                    self.add_lsa(lsa)
+                    restored.add((lsa.TYPE, lsa.key()))
+            self.graph = (self.incremental.update() if self.incremental
+                          else self.build_graph())
+            self.topology_changed = False
+            self.prefix_table.update()
+            # The listeners get the restored graph as their bootstrap
+            if self.incremental:
+                self.incremental.changes()
+            self.prefix_table.changes()
+            self.stale = restored
+
+    def save_snapshot(self):
+        """Write a snapshot of the LSAs, from the processing thread"""
+        try:
+            size = snapshot.save(self, self.snapshot_path)
+            self.stats['snapshots'] += 1
+            self.stats['snapshot_bytes'] = size
+        except (IOError, OSError) as e:
+            log.error('Cannot save the LSDB snapshot to %s: %s',
+                      self.snapshot_path, e)
+        self.last_snapshot = time.time()
+
+    def reconcile_snapshot(self):
+        """
+        Remove the LSAs restored from the snapshot that the live feed did
+        not advertise again
+        :return: whether any LSA was removed
+        """
+        stale, self.stale = self.stale, set()
+        for lsa_type, key in stale:
+            lsa = self.lsdb(LSA_TYPES[lsa_type]).get(key)
+            if lsa is not None:
+                self.remove_lsa(lsa)
+        log.info('Reconciled the LSDB snapshot with the live feed, '
+                 '%d LSAs were stale', len(stale))
+        self.stats['snapshot_stale_lsas'] += len(stale)
+        return bool(stale)
 
     def lsdb(self, lsa):
         if lsa.TYPE == RouterLSA.TYPE:
@@ -367,34 +842,183 @@ class LSDB(object):
 
     def register_change_listener(self, listener):
         try:
-            del self.listener[listener]
+            self.listener.pop(listener).stop(LISTENER_STOP_TIMEOUT)
             log.info('Shapeshifter disconnected.')
         except KeyError:
             log.info('Shapeshifter connected.')
-            l = ProxyCloner(ShapeshifterProxy, listener)
-            self.listener[listener] = l
-            l.bootstrap_graph(graph=[(u, v, d)
-                                     for u, v, d in self.graph.export_edges()
-                                     ],
-                              node_properties={n: data for n, data in
-                                               self.graph.nodes_iter(data=True)
-                                               })
-
-    @staticmethod
-    def extract_lsa_properties(lsa_part):
-        d = {}
-        for prop in lsa_part.split(SEP_INTER_FIELD):
-            if not prop:
-                continue
-            key, val = prop.split(SEP_INTRA_FIELD)
-            d[key] = val
-        return d
+            l = ListenerDispatcher(ProxyCloner(ShapeshifterProxy, listener),
+                                   name=str(len(self.listener)),
+                                   started=False,
+                                   resync=self.resync_listener)
+            if not self.resume_timeout:
+                # The listeners do not implement graph_session, push them
+                # the whole graph right away
+                with self.graph_lock:
+                    self.listener[listener] = l
+                    self.bootstrap(l, versioned=False)
+                return
+            token = uuid.uuid4().hex
+            timer = Timer(self.resume_timeout, self.bootstrap_listener,
+                          (token,))
+            timer.setDaemon(True)
+            with self.graph_lock:
+                self.listener[listener] = l
+                self.resuming[token] = l, timer
+            # The listener can ask to resume from the graph it already has,
+            # otherwise it gets the full graph once the timer expires
+            l.proxy.graph_session(token)
+            timer.start()
+
+    def resume_listener(self, token, version):
+        """
+        Start pushing the graph to the listener of a new session
+        :param token: the token of that session, see register_change_listener
+        :param version: the last graph version that listener received,
+                        None if it has no graph
+        """
+        with self.graph_lock:
+            try:
+                l, timer = self.resuming.pop(token)
+            except KeyError:
+                log.warning('Cannot resume the unknown graph session %s',
+                            token)
+                return
+            timer.cancel()
+            if not l.running:
+                return
+            deltas = self.deltas_since(version)
+            if deltas is None:
+                self.bootstrap(l, versioned=True)
+            else:
+                log.info('Resuming listener %s from version %s with %d '
+                         'graph updates', l.name, version, len(deltas))
+                self.stats['resumed_sessions'] += 1
+                l.resume(deltas)
+
+    def bootstrap_listener(self, token):
+        """Push the full graph to a listener that did not ask to resume"""
+        with self.graph_lock:
+            try:
+                l, _ = self.resuming.pop(token)
+            except KeyError:
+                return  # It resumed in the mean time
+            if l.running:
+                self.bootstrap(l, versioned=False)
+
+    def resync_listener(self, l):
+        """Push the whole graph again to a listener that missed updates"""
+        with self.graph_lock:
+            if l.running:
+                self.stats['resynced_sessions'] += 1
+                self.bootstrap(l, versioned=l.versioned)
+
+    def bootstrap(self, l, versioned):
+        """
+        Push the full graph to a listener
+        :param l: its ListenerDispatcher
+        :param versioned: whether it tracks the graph versions
+        """
+        self.stats['bootstrapped_sessions'] += 1
+        chunk_size = CFG.getint(DEFAULTSECT, 'bootstrap_chunk_size')
+        if chunk_size > 0:
+            l.bootstrap(graph=None, node_properties=None,
+                        version=self.export_version(), versioned=versioned,
+                        chunks=self.bootstrap_chunks(chunk_size))
+            return
+        # The listeners get the prefixes as part of their initial graph
+        table = self.prefix_table
+        l.bootstrap(graph=[self.export_edge(u, v, dict(d)) for u, v, d
+                           in chain(self.graph.export_edges(),
+                                    ((u, v, d) for (u, v), d
+                                     in table.edges.iteritems()))],
+                    node_properties=self.export_nodes(chain(
+                        ((n, dict(d)) for n, d
+                         in self.graph.nodes_iter(data=True)),
+                        table.nodes.iteritems())),
+                    version=self.export_version(),
+                    versioned=versioned)
+
+    def bootstrap_chunks(self, chunk_size):
+        """
+        Export the graph chunk by chunk, the graph lock is only held while
+        each chunk is built
+        :param chunk_size: the number of edges or nodes per chunk
+        :return: an iterator over (EDGES, edges) then (NODES, properties)
+        """
+        with self.graph_lock:
+            nodes = self.graph.nodes()
+            prefix_edges = self.prefix_table.edges.keys()
+            prefixes = self.prefix_table.nodes.keys()
+        i = 0
+        while i < len(nodes):
+            edges = []
+            with self.graph_lock:
+                graph = self.graph
+                while i < len(nodes) and len(edges) < chunk_size:
+                    u = nodes[i]
+                    i += 1
+                    if u in graph:
+                        edges.extend(self.export_edge(
+                            u, v, dict(graph.export_edge_data(u, v)))
+                            for v in graph.successors_iter(u))
+            yield EDGES, edges
+        table = self.prefix_table
+        for i in xrange(0, len(prefix_edges), chunk_size):
+            with self.graph_lock:
+                edges = [self.export_edge(u, v, table.edges[u, v])
+                         for u, v in prefix_edges[i:i + chunk_size]
+                         if (u, v) in table.edges]
+            yield EDGES, edges
+        for i in xrange(0, len(nodes), chunk_size):
+            with self.graph_lock:
+                graph = self.graph
+                node_props = self.export_nodes(
+                    (n, dict(graph.node[n])) for n in nodes[i:i + chunk_size]
+                    if n in graph)
+            yield NODES, node_props
+        for i in xrange(0, len(prefixes), chunk_size):
+            with self.graph_lock:
+                node_props = self.export_nodes(
+                    (n, table.nodes[n]) for n in prefixes[i:i + chunk_size]
+                    if n in table.nodes)
+            yield NODES, node_props
+
+    def export_version(self):
+        """:return: the current graph version, as pushed to the listeners"""
+        return [self.graph_epoch, self.graph_version]
+
+    def deltas_since(self, version):
+        """
+        :param version: a graph version, as pushed to the listeners
+        :return: the list of graph updates since that version, None if
+                 some of them are no longer available
+        """
+        try:
+            epoch, number = version
+        except (TypeError, ValueError):
+            return None
+        if epoch != self.graph_epoch or number > self.graph_version:
+            return None
+        if number == self.graph_version:
+            return []
+        if not self.deltas or self.deltas[0][0][1] > number + 1:
+            return None
+        return [delta for delta in self.deltas if delta[0][1] > number]
 
     def commit_change(self, line):
-        # Check that this is not a duplicate of a previous update ...
-        if self.last_line == line:
-            return
-        self.queue.put(line)
+        # Check that this is not a refresh of an unchanged LSA ...
+        if self.digests is not None:
+            key = self.line_key(line)
+            if key is not None:
+                if self.line_removes(line):
+                    self.digests.pop(key, None)
+                else:
+                    digest = md5(line).digest()
+                    if self.digests.get(key) == digest:
+                        self.stats['suppressed_refreshes'] += 1
+                        return
+                    self.digests[key] = digest
+        self.queue.put((time.time(), line))
 
     def forwarding_address_of(self, src, dst):
         """
@@ -408,80 +1032,377 @@ class LSDB(object):
         """
         # If we have a src address, we want the set of private IPs
         # Otherwise we want any IP of dst
-        u, v, key = ((src, dst, 'dst_address') if src
-                     else (dst, self.graph.neighbors(dst)[0], 'src_address'))
+        if self.integer_ids:
+            src, dst = ((self.address_id(src) if src else src),
+                        self.address_id(dst))
         try:
-            edge = self.graph[u][v]
+            with self.graph_lock:
+                u, v, key = ((src, dst, 'dst_address') if src
+                             else (dst, self.graph.neighbors(dst)[0],
+                                   'src_address'))
+                edge = dict(self.graph[u][v])
         except KeyError:
             log.error('%s-%s not found in graph when resolving '
                       'forwarding address of (%s,%s)', u, v, src, dst)
             return None
         try:
-            return edge[key]
+            return external_address(edge[key])
         except KeyError:
             log.error('%s not found in the properties of edge %s-%s '
                       'when resolving forwarding address of (%s, %s)\n%s',
                       key, u, v, src, dst, edge)
             return None
 
+    def index_transit_links(self, rlsa, remove=False):
+        """
+        Record (or forget) the LANs a router is attached to
+        :param rlsa: the RouterLSA of that router
+        :param remove: whether that RouterLSA is being removed
+        """
+        for link in rlsa.links:
+            if not isinstance(link, TransitLink):
+                continue
+            if not remove:
+                self.transit_routers[link.dr_ip].add(rlsa.routerid)
+                continue
+            routers = self.transit_routers.get(link.dr_ip)
+            if routers:
+                routers.discard(rlsa.routerid)
+                if not routers:
+                    del self.transit_routers[link.dr_ip]
+
+    def index_prefix(self, lsa, remove=False):
+        """
+        Record (or forget) the prefix of an AS-External LSA
+        :param lsa: the ASExtLSA
+        :param remove: whether that LSA is being removed
+        """
+        lsas = self.ext_prefixes.get(lsa.prefix)
+        if not remove:
+            if lsas is None:
+                lsas = self.ext_prefixes[lsa.prefix] = {}
+            lsas[lsa.routerid] = lsa
+        elif lsas is not None:
+            lsas.pop(lsa.routerid, None)
+            if not lsas:
+                del self.ext_prefixes[lsa.prefix]
+
+    def ext_lsas_for(self, prefix):
+        """
+        :param prefix: a prefix or an address, see parse_prefix
+        :return: the AS-External LSAs of the longest prefix covering it,
+                 as a dict router-id: lsa, empty if none
+        """
+        try:
+            return dict(self.ext_prefixes.longest_match(prefix)[1])
+        except KeyError:
+            return {}
+
+    def claim_addresses(self, routerid):
+        """
+        Update the addresses contracted into a router, once its RouterLSA
+        or its private addresses changed
+        :param routerid: the router-id
+        :return: the set of addresses whose owners changed
+        """
+        rlsa = self.routers.get(routerid)
+        old = self.owned_addresses.pop(routerid, frozenset())
+        new = frozenset(rlsa.contracted_addresses(
+            self.private_addresses.addresses_of(routerid))
+            if rlsa else ())
+        if new:
+            self.owned_addresses[routerid] = new
+        for address in old - new:
+            owners = self.address_owners[address]
+            owners.discard(routerid)
+            if not owners:
+                del self.address_owners[address]
+        for address in new - old:
+            self.address_owners.setdefault(address, set()).add(routerid)
+        changed = old ^ new
+        if changed:
+            self.prefix_table.addresses_changed(changed)
+            if self.incremental:
+                self.incremental.addresses_changed(changed)
+        return changed
+
+    def reload_private_addresses(self):
+        """
+        Reload the private addresses binding file if it changed, and
+        invalidate the parts of the graph depending on the bindings that
+        changed
+        :return: whether the graph must be updated
+        """
+        changes = self.private_addresses.reload()
+        if changes is None:
+            return False
+        routers, ips = changes
+        log.info('Reloaded the private addresses, the bindings of %d '
+                 'routers changed', len(routers))
+        self.stats['private_ips_reloads'] += 1
+        if not routers and not ips:
+            return False
+        for rid in routers:
+            self.claim_addresses(rid)
+        if routers:
+            self.topology_changed = True
+            if self.incremental:
+                self.incremental.bindings_changed(routers)
+        # The routes of the controllers towards private addresses
+        for lsa in self.ext_networks.itervalues():
+            if self.controller_id(lsa.routerid) is not None and any(
+                    lsa.resolve_fwd_addr(route.fwd_addr) in ips
+                    for route in lsa.routes):
+                self.prefix_table.lsa_changed(lsa)
+        return True
+
+    def owner_of(self, node):
+        """:return: the node of the graph in which a node is contracted"""
+        owners = self.address_owners.get(node)
+        return min(owners) if owners else node
+
+    def contracted_name(self, node):
+        """:return: the name of a node in the graph, i.e. its owner or the
+                    controller owning it"""
+        node = self.owner_of(node)
+        cid = self.controller_id(node)
+        return node if cid is None else 'C_%s' % cid
+
+    def lsa_changed(self, lsa):
+        """Record that an LSA has been added, replaced or removed"""
+        if lsa.TYPE == ASExtLSA.TYPE:
+            self.prefix_table.lsa_changed(lsa)
+            return
+        self.topology_changed = True
+        if self.incremental:
+            self.incremental.lsa_changed(lsa)
+
     def remove_lsa(self, lsa):
         lsdb = self.lsdb(lsa)
         try:
-            del lsdb[lsa.key()]
+            old = lsdb.pop(lsa.key())
         except KeyError:
             pass
-        except TypeError:
+        except AttributeError:
             pass  # LSDB is None
+        else:
+            if old.TYPE == RouterLSA.TYPE:
+                self.index_transit_links(old, remove=True)
+                self.claim_addresses(old.routerid)
+            elif old.TYPE == ASExtLSA.TYPE:
+                self.index_prefix(old, remove=True)
+            self.lsa_changed(lsa)
+            if self.stale:
+                self.stale.discard((lsa.TYPE, lsa.key()))
 
     def add_lsa(self, lsa):
         lsdb = self.lsdb(lsa)
+        key = lsa.key()
         try:
-            lsdb[lsa.key()] = lsa
-        except TypeError:
+            old = lsdb.get(key)
+        except AttributeError:
             pass  # LSDB is None
+        else:
+            lsdb[key] = lsa
+            if lsa.TYPE == RouterLSA.TYPE:
+                if old:
+                    self.index_transit_links(old, remove=True)
+                self.index_transit_links(lsa)
+                self.claim_addresses(lsa.routerid)
+            elif lsa.TYPE == ASExtLSA.TYPE:
+                self.index_prefix(lsa)
+            self.lsa_changed(lsa)
+            if self.stale:
+                self.stale.discard((lsa.TYPE, lsa.key()))
+
+    def parse_lsa(self, lsa_info):
+        """
+        Parse the LSA part of an LSDB log line
+        :param lsa_info: the LSA description, without its action
+        :return: an LSA instance
+        """
+        return PARSER.parse(lsa_info, self.address_id)
+
+    @staticmethod
+    def decode_text_line(line, address_id=intern):
+        """
+        :param line: an LSDB log line, without its trailing separator
+        :param address_id: the representation of the addresses, see
+                           LSDB.address_id
+        :return: the action of that line and its LSA, if any
+        """
+        action, lsa_info = line.split(SEP_ACTION)
+        if action == BEGIN or action == COMMIT:
+            return action, None
+        return action, PARSER.parse(lsa_info, address_id)
+
+    @staticmethod
+    def text_line_key(line):
+        """
+        :param line: an LSDB log line
+        :return: the LSA header of that line, None if it has no LSA
+        """
+        action, _, lsa_info = line.partition(SEP_ACTION)
+        if action != ADD and action != REM:
+            return None
+        return lsa_info.split(SEP_GROUP, 1)[0]
+
+    @staticmethod
+    def text_line_removes(line):
+        """
+        :param line: an LSDB log line
+        :return: whether that line removes an LSA
+        """
+        return line.startswith(REM + SEP_ACTION)
+
+    def process_line(self, line):
+        """
+        Apply an LSDB log line
+        :param line: the line, without its trailing separator
+                     (a record if the feed is binary)
+        :return: whether the graph needs to be updated
+        """
+        action, lsa = self.decode_line(line)
+        if action == BEGIN:
+            self.transaction = Transaction()
+        elif action == COMMIT:
+            if self.transaction:
+                self.transaction.commit(self)
+                self.transaction = None
+                return True
+        else:
+            log.debug('Parsed %s: %s', action, lsa)
+            provider = self.transaction if self.transaction else self
+            if action == REM:
+                provider.remove_lsa(lsa)
+            elif action == ADD:
+                provider.add_lsa(lsa)
+            return lsa.push_update_on_remove() or not action == REM
+        return False
+
+    def read_commit_policy(self):
+        """(Re)load the settings controlling how changes are coalesced"""
+        self.commit_min_interval = CFG.getfloat(DEFAULTSECT,
+                                                'commit_min_interval')
+        self.commit_max_delay = CFG.getfloat(DEFAULTSECT, 'commit_max_delay')
+        self.commit_max_batch = CFG.getint(DEFAULTSECT, 'commit_max_batch')
+        self.snapshot_interval = CFG.getfloat(DEFAULTSECT,
+                                              'lsdb_snapshot_interval')
+        self.snapshot_reconcile = CFG.getfloat(DEFAULTSECT,
+                                               'lsdb_snapshot_reconcile')
+        self.private_ips_interval = CFG.getfloat(
+            DEFAULTSECT, 'private_ips_reload_interval')
 
     def process_lsa(self):
-        while self.keep_running:
-            commit = False
+        self.read_commit_policy()
+        batch = 0  # Lines processed since the last graph update
+        first_change = None  # When the first pending change was seen
+        first_line = None  # When the oldest line of the batch was queued
+        last_line = last_update = time.time()
+        next_private_ips = last_line + self.private_ips_interval
+        # Until stop() queues its empty line, after the lines to process
+        while True:
+            idle = False
+            if first_change is None:
+                timeout = TRANSACTION_TIMEOUT
+            else:
+                # Wait for more changes until the hold-down has elapsed,
+                # but never delay a pending change more than max_delay
+                timeout = max(0, min(first_change + self.commit_max_delay,
+                                     last_update + self.commit_min_interval)
+                              - time.time())
+            if self.private_ips_interval:
+                timeout = max(0, min(timeout, next_private_ips - time.time()))
             try:
-                line = self.queue.get(timeout=5)
+                queued, line = self.queue.get(timeout=timeout)
                 if not line:
                     self.queue.task_done()
+                    if not self.keep_running:
+                        break
                     continue
-                # Start parsing the LSA log
-                action, lsa_info = line.split(SEP_ACTION)
-                if action == BEGIN:
-                    self.transaction = Transaction()
-                elif action == COMMIT:
-                    if self.transaction:
-                        self.transaction.commit(self)
-                        self.transaction = None
-                        commit = True
-                else:
-                    lsa_parts = [self.extract_lsa_properties(part)
-                                 for part in lsa_info.split(SEP_GROUP) if part]
-                    lsa = LSA.parse(LSAHeader.parse(lsa_parts.pop(0)),
-                                    lsa_parts)
-                    log.debug('Parsed %s: %s', action, lsa)
-                    provider = self.transaction if self.transaction else self
-                    if action == REM:
-                        provider.remove_lsa(lsa)
-                    elif action == ADD:
-                        provider.add_lsa(lsa)
-                    if lsa.push_update_on_remove() or not action == REM:
-                        commit = True
+                last_line = time.time()
+                latency.record(latency.QUEUE_WAIT, last_line - queued)
+                if first_line is None:
+                    first_line = queued
+                batch += 1
+                with self.lsdb_lock:
+                    changed = self.process_line(line)
+                if changed and first_change is None:
+                    first_change = last_line
+                latency.record(latency.PARSE, time.time() - last_line)
                 self.queue.task_done()
+                if self.stale and self.reconcile_deadline is None:
+                    # The live feed started, give it some time to
+                    # advertise the whole database again
+                    self.reconcile_deadline = (last_line +
+                                               self.snapshot_reconcile)
             except Empty:
-                if self.transaction:
+                idle = True
+                if self.transaction and \
+                        time.time() - last_line >= TRANSACTION_TIMEOUT:
                     log.debug('Splitting transaction due to timeout')
-                    self.transaction.commit(self)
-                    self.transaction = Transaction()
-                    commit = True
-            if commit:
-                # Update graph accordingly
+                    split, self.transaction = self.transaction, Transaction()
+                    with self.lsdb_lock:
+                        split.commit(self)
+                    if split.changes and first_change is None:
+                        first_change = time.time()
+            if self.private_ips_interval and \
+                    time.time() >= next_private_ips:
+                next_private_ips = time.time() + self.private_ips_interval
+                with self.lsdb_lock:
+                    changed = self.reload_private_addresses()
+                if changed and first_change is None:
+                    first_change = time.time()
+            if self.reconcile_deadline is not None and \
+                    time.time() >= self.reconcile_deadline:
+                self.reconcile_deadline = None
+                with self.lsdb_lock:
+                    changed = self.reconcile_snapshot()
+                if changed and first_change is None:
+                    first_change = time.time()
+            if first_change is None:
+                continue
+            now = time.time()
+            if (batch >= self.commit_max_batch or
+                    now >= first_change + self.commit_max_delay or
+                    (idle and now >= last_update + self.commit_min_interval)):
+                log.debug('Updating the graph after %d lines', batch)
+                self.stats['graph_updates'] += 1
+                self.stats['coalesced_lines'] += batch
+                self.stats['max_coalesced_lines'] = max(
+                    batch, self.stats['max_coalesced_lines'])
+                with self.lsdb_lock:
+                    self.refresh_graph()
+                batch = 0
+                first_change = None
+                last_update = time.time()
+                if first_line is not None:
+                    latency.record(latency.UPDATE, last_update - first_line)
+                    first_line = None
+                self.read_commit_policy()
+                if self.snapshot_path and \
+                        last_update >= (self.last_snapshot +
+                                        self.snapshot_interval):
+                    self.save_snapshot()
+        if self.snapshot_path:
+            self.save_snapshot()
+
+    def refresh_graph(self):
+        """Bring the graph up to date with the LSDB, and push the changes"""
+        with self.graph_lock:
+            # Update graph accordingly
+            start = time.time()
+            if self.incremental:
+                new_graph = self.incremental.update()
+            elif self.topology_changed:
                 new_graph = self.build_graph()
-                # Compute graph difference and update it
-                self.update_graph(new_graph)
+            else:
+                new_graph = self.graph  # Only prefixes changed
+            self.topology_changed = False
+            self.prefix_table.update()
+            latency.record(latency.BUILD_GRAPH, time.time() - start)
+            # Compute graph difference and update it
+            self.update_graph(new_graph)
 
     def __str__(self):
         strs = [str(lsa) for lsa in chain(self.routers.values(),
@@ -493,159 +1414,797 @@ class LSDB(object):
     def build_graph(self):
         self.controllers.clear()
         new_graph = IGPGraph()
-        # Rebuild the graph from the LSDB
-        for lsa in chain(self.routers.itervalues(),
-                         self.networks.itervalues(),
-                         self.ext_networks.itervalues()):
-            lsa.apply(new_graph, self)
-        # Contract all IPs to their respective router-id
-        for rlsa in self.routers.itervalues():
-            rlsa.contract_graph(new_graph,
-                                self.private_addresses
-                                .addresses_of(rlsa.routerid))
-        # Figure out the controllers layout
-        controller_prefix = CFG.getint(DEFAULTSECT, 'controller_prefixlen')
-        # Group by controller and log them
-        for ip in new_graph.nodes_iter():
-            try:
-                addr = ip_address(ip)
-            except ValueError:
-                continue  # Have a prefix
-            if addr in self.BASE_NET:
-                """1. Compute address diff to remove base_net
-                   2. Right shift to remove host bits
-                   3. Mask with controller mask"""
-                cid = (((int(addr) - int(self.BASE_NET.network_address)) >>
-                        self.BASE_NET.max_prefixlen - controller_prefix) &
-                       ((1 << controller_prefix) - 1))
-                self.controllers[cid].append(ip)
-        # Contract them on the graph
-        for id, ips in self.controllers.iteritems():
-            cname = 'C_%s' % id
-            new_graph.add_controller(cname)
-            new_graph.contract(cname, ips)
-        # Remove generated self loops
-        new_graph.remove_edges_from(new_graph.selfloop_edges())
+        # Rebuild the graph of the routers from the LSDB, each node being
+        # added under its contracted identity. The prefixes are in the
+        # prefix table. The LSAs are applied in the (type, key) order, as
+        # by the IncrementalGraph, for the same parallel links to win.
+        contracting = _ContractingGraph(new_graph, self)
+        for db in (self.routers, self.networks):
+            for key in sorted(db):
+                db[key].apply(contracting, self)
         self.apply_secondary_addresses(new_graph)
         return new_graph
 
+    def controller_id(self, ip):
+        """
+        Return the id of the controller owning a node
+        :param ip: a node of the graph
+        :return: the controller id or None if ip is not a controller address
+        """
+        if type(ip) is not int and type(ip) is not long:
+            if self.integer_ids:
+                return None  # All addresses are ints, e.g. a prefix
+            ip = parse_address(ip)
+            if ip is None:  # e.g. a prefix
+                return None
+            ip = int(ip)
+        base = int(self.BASE_NET.network_address)
+        if ip & int(self.BASE_NET.netmask) != base:
+            return None
+        controller_prefix = self.controller_prefixlen
+        """1. Compute address diff to remove base_net
+           2. Right shift to remove host bits
+           3. Mask with controller mask"""
+        return (((ip - base) >>
+                 self.BASE_NET.max_prefixlen - controller_prefix) &
+                ((1 << controller_prefix) - 1))
+
+    @staticmethod
+    def graph_difference(new_graph, old_graph):
+        """
+        Compute the changes between two graphs, as the IncrementalGraph
+        does: the edges whose properties changed are only added again
+        :return: added (or updated) edges, removed edges,
+                 node properties changes
+        """
+        return ([(u, v) for u, v, data in new_graph.edges_iter(data=True)
+                 if not old_graph.has_edge(u, v) or old_graph[u][v] != data],
+                [(u, v) for u, v in old_graph.edges_iter()
+                 if not new_graph.has_edge(u, v)],
+                {n: data for n, data in new_graph.nodes_iter(data=True)
+                 if n not in old_graph or
+                 (data.viewitems() - old_graph.node[n].viewitems())})
+
     def update_graph(self, new_graph):
         self.leader_watchdog.check_leader(self.get_leader())
-        added_edges = new_graph.difference(self.graph)
-        removed_edges = self.graph.difference(new_graph)
-        node_prop_diff = {n: data
-                          for n, data in new_graph.nodes_iter(data=True)
-                          if n not in self.graph or
-                          (data.viewitems() - self.graph.node[n].viewitems())}
+        start = time.time()
+        if self.incremental:
+            # new_graph is self.graph, updated in place
+            (added_edges, removed_edges,
+             node_prop_diff) = self.incremental.changes()
+            if self.check_graph is not None:
+                self.check_incremental_changes(added_edges, removed_edges,
+                                               node_prop_diff)
+        elif new_graph is not self.graph:
+            (added_edges, removed_edges,
+             node_prop_diff) = self.graph_difference(new_graph, self.graph)
+        else:
+            # Only the prefix table changed
+            added_edges, removed_edges, node_prop_diff = (), (), {}
+        p_added, p_removed, p_props = self.prefix_table.changes()
+        latency.record(latency.DIFF, time.time() - start)
         # Propagate differences
         if added_edges or removed_edges or node_prop_diff:
             log.debug('Pushing changes')
-            for u, v in added_edges:
-                self.for_all_listeners('add_edge', u, v,
-                                       new_graph.export_edge_data(u, v))
-            for u, v in removed_edges:
-                self.for_all_listeners('remove_edge', u, v)
-            if node_prop_diff:
-                self.for_all_listeners('update_node_properties',
-                                       **node_prop_diff)
+            added = [self.export_edge(u, v,
+                                      dict(new_graph.export_edge_data(u, v)))
+                     for u, v in added_edges]
+            removed = [self.export_edge(u, v)[:2] for u, v in removed_edges]
+            node_props = self.export_nodes((n, dict(d)) for n, d
+                                           in node_prop_diff.iteritems())
+        else:
+            added, removed, node_props = [], [], {}
+        if p_added or p_removed or p_props:
+            prefixes = ([self.export_edge(*e) for e in p_added],
+                        [self.export_edge(u, v)[:2] for u, v in p_removed],
+                        self.export_nodes(p_props.iteritems()))
+        else:
+            prefixes = None
+        if added or removed or node_props or prefixes:
+            self.graph_version += 1
+            self.deltas.append((self.export_version(), added, removed,
+                                node_props, prefixes))
+            self.for_all_listeners('push', added, removed, node_props,
+                                   self.export_version(), prefixes=prefixes)
             if CFG.getboolean(DEFAULTSECT, 'draw_graph'):
-                new_graph.draw(CFG.get(DEFAULTSECT, 'graph_loc'))
-            self.graph = new_graph
+                self.draw_graph(CFG.get(DEFAULTSECT, 'graph_loc'))
             log.info('LSA update yielded +%d -%d edges changes, '
-                     '%d node property changes', len(added_edges),
-                     len(removed_edges), len(node_prop_diff))
-            self.for_all_listeners('commit')
+                     '%d node property changes, +%d -%d prefix changes',
+                     len(added_edges), len(removed_edges),
+                     len(node_prop_diff), len(p_added), len(p_removed))
+        self.graph = new_graph
+
+    def draw_graph(self, path):
+        """Draw the latest graph in the background"""
+        if self.renderer is None:
+            self.renderer = GraphRenderer(
+                self.rendered_graph,
+                CFG.getfloat(DEFAULTSECT, 'draw_graph_interval'))
+        self.renderer.changed(path)
+
+    def rendered_graph(self):
+        """:return: the current graph, as drawn by the renderer, and its
+                    version"""
+        with self.graph_lock:
+            # The drawing shows the prefixes with the routers
+            graph = self.graph.copy()
+            self.prefix_table.apply(graph)
+            return graph, self.graph_version
+
+    def check_incremental_changes(self, added_edges, removed_edges,
+                                  node_prop_diff):
+        """
+        Debug helper, compare the incremental graph and its changes
+        with the ones obtained by a full rebuild and diff
+        """
+        old_graph, full_graph = self.check_graph, self.build_graph()
+        self.check_graph = full_graph
+        added, removed, node_prop = self.graph_difference(full_graph,
+                                                          old_graph)
+        errors = []
+        if (sorted(self.graph.nodes(data=True)) !=
+                sorted(full_graph.nodes(data=True)) or
+                sorted(self.graph.edges(data=True)) !=
+                sorted(full_graph.edges(data=True))):
+            errors.append('the graph differs from a full rebuild')
+        if set(removed_edges) != set(removed):
+            errors.append('removed edges %s instead of %s' %
+                          (removed_edges, removed))
+        # Edges whose properties changed are also pushed again
+        if set(added) - set(added_edges) or \
+                any(not old_graph.has_edge(u, v) or
+                    old_graph[u][v] == full_graph[u][v]
+                    for u, v in set(added_edges) - set(added)):
+            errors.append('added edges %s instead of %s' %
+                          (added_edges, added))
+        if set(node_prop_diff) != set(node_prop):
+            errors.append('node properties %s instead of %s' %
+                          (node_prop_diff, node_prop))
+        for error in errors:
+            log.error('Incremental graph mismatch: %s', error)
+
+    def export_edge(self, u, v, data=None):
+        """
+        :return: an edge of the graph, as pushed to the listeners
+        """
+        if not self.integer_ids:
+            return u, v, data
+        return (self.address_str(u), self.address_str(v),
+                {key: external_address(val) for key, val in data.iteritems()}
+                if data else data)
+
+    def export_nodes(self, nodes):
+        """
+        :param nodes: an iterable of (node, properties)
+        :return: the dict of node properties, as pushed to the listeners
+        """
+        if not self.integer_ids:
+            return dict(nodes)
+        return {self.address_str(n): data for n, data in nodes}
 
     def for_all_listeners(self, funcname, *args, **kwargs):
-        """Apply funcname to all listeners"""
+        """Apply funcname to the dispatchers of all listeners"""
         for i in self.listener.itervalues():
             getattr(i, funcname)(*args, **kwargs)
 
+    def listener_stats(self):
+        """:return: the fan-out metrics, per listener"""
+        return {l.name: l.stats() for l in self.listener.values()}
+
     def apply_secondary_addresses(self, graph):
         for src, dst in graph.router_links:
             try:
                 graph[src][dst]['dst_address'] = self.private_addresses\
                                                 .addresses_of(dst, src)
-            except KeyError:
+            except (KeyError, ValueError):
                 log.debug('%(src)-%(dst)s does not yet exists on the graph'
                           ', ignoring private addresses.', locals())
                 pass
 
 
+class _ContractingGraph(object):
+    """
+    Apply LSAs on an IGPGraph under the contracted identity of their nodes,
+    i.e. the router-id owning their address and then the controller owning
+    that router-id. Only uncontracted nodes keep their attributes.
+    """
+
+    def __init__(self, graph, lsdb):
+        self.graph = graph
+        self.lsdb = lsdb
+        self._names = {}  # node : contracted node
+
+    def _name(self, n):
+        try:
+            return self._names[n]
+        except KeyError:
+            pass
+        name = self.lsdb.owner_of(n)
+        cid = self.lsdb.controller_id(name)
+        if cid is not None:
+            # Group by controller and log them
+            self.lsdb.controllers[cid].append(name)
+            name = 'C_%s' % cid
+            if name not in self.graph:
+                self.graph.add_controller(name)
+        elif name != n and name not in self.graph:
+            self.graph.add_node(name)
+        self._names[n] = name
+        return name
+
+    def add_router(self, n, **kw):
+        if self._name(n) == n:
+            self.graph.add_router(n, **kw)
+
+    def add_edge(self, u, v, **kw):
+        u, v = self._name(u), self._name(v)
+        if u != v:  # Contraction can create self loops
+            self.graph.add_edge(u, v, **kw)
+
+
+class _Contribution(object):
+    """The nodes and edges that a single LSA adds to the IGP graph"""
+
+    def __init__(self, lsa, lsdb):
+        graph = IGPGraph()
+        lsa.apply(graph, lsdb)
+        self.nodes = graph.nodes(data=True)
+        self.edges = graph.edges(data=True)
+        # Their contracted counterparts, as last merged in the graph
+        self.merged_nodes = {}  # node: attributes or None
+        self.merged_edges = ()  # (u, v)
+        self.members = ()  # (controller id, ip)
+
+
+class IncrementalGraph(object):
+    """
+    Maintain the IGP graph of an LSDB by only applying the LSAs that
+    changed since the last update, instead of rebuilding it from scratch.
+
+    Each LSA is applied on its own scratch graph, which gives its
+    contribution to the IGP graph. Every node of that contribution is then
+    merged in the IGP graph under its contracted identity (see
+    LSDB.owner_of), i.e. the router-id owning that address and then the
+    controller owning that router-id, which yields the same graph than
+    LSDB.build_graph. Nodes and edges are reference-counted per
+    contributing LSA. Conflicting attributes (e.g. parallel links between
+    contracted nodes) are merged in the LSA (type, key) order, as in
+    LSDB.build_graph.
+    """
+
+    def __init__(self, lsdb):
+        self.lsdb = lsdb
+        self.graph = IGPGraph()
+        self.controllers = {}  # controller nr : {ip: refcount}
+        self._pending = set()  # (lsa type, lsa key)
+        self._reclaimed = set()  # The addresses whose owners changed
+        self._rebound = set()  # The routers whose private addresses changed
+        self._contributions = {}  # (lsa type, lsa key) : _Contribution
+        self._users = defaultdict(set)  # node : (lsa type, lsa key)
+        self._node_refs = defaultdict(int)  # node : contribution count
+        self._node_attrs = defaultdict(dict)  # node : {lsa id: attributes}
+        self._edge_refs = defaultdict(dict)  # (u, v) : {lsa id: attributes}
+        # The state of the nodes/edges changed since the last call to
+        # changes(), None if they were absent
+        self._old_nodes = {}  # node : attributes
+        self._old_edges = {}  # (u, v) : attributes
+
+    def lsa_changed(self, lsa):
+        """Record that an LSA has been added, replaced or removed"""
+        self._pending.add((lsa.TYPE, lsa.key()))
+
+    def addresses_changed(self, addresses):
+        """Record that addresses are contracted in other nodes"""
+        self._reclaimed.update(addresses)
+
+    def bindings_changed(self, routers):
+        """Record that the private addresses of routers changed"""
+        self._rebound.update(routers)
+
+    def changes(self):
+        """
+        Give the changes made to the graph since the last call, in the same
+        form than LSDB.graph_difference
+        :return: added (or updated) edges, removed edges,
+                 node properties changes
+        """
+        added, removed, node_props = [], [], {}
+        for (u, v), old in self._old_edges.iteritems():
+            if self.graph.has_edge(u, v):
+                if old != self.graph[u][v]:
+                    added.append((u, v))
+            elif old is not None:
+                removed.append((u, v))
+        for n, old in self._old_nodes.iteritems():
+            if n in self.graph:
+                data = self.graph.node[n]
+                if old is None or data.viewitems() - old.viewitems():
+                    node_props[n] = data
+        self._old_nodes.clear()
+        self._old_edges.clear()
+        return added, removed, node_props
+
+    def _touch_node(self, n):
+        if n not in self._old_nodes:
+            self._old_nodes[n] = (dict(self.graph.node[n])
+                                  if n in self.graph else None)
+
+    def _touch_edge(self, u, v):
+        if (u, v) not in self._old_edges:
+            self._old_edges[u, v] = (dict(self.graph[u][v])
+                                     if self.graph.has_edge(u, v) else None)
+
+    def update(self):
+        """
+        Apply all pending LSA changes on the graph
+        :return: the updated graph
+        """
+        pending, self._pending = self._pending, set()
+        # Transit links are resolved through the Network LSA of their DR
+        transit_routers = self.lsdb.transit_routers
+        for dr_ip in [key for lsa_type, key in pending
+                      if lsa_type == NetworkLSA.TYPE]:
+            pending.update((RouterLSA.TYPE, rid)
+                           for rid in transit_routers.get(dr_ip, ()))
+        reclaimed, self._reclaimed = self._reclaimed, set()
+        for lsa_id in pending:
+            old = self._contributions.pop(lsa_id, None)
+            if old:
+                self._unmerge(lsa_id, old)
+            lsa = self.lsdb.lsdb(LSA_TYPES[lsa_id[0]]).get(lsa_id[1])
+            if lsa:
+                self._contributions[lsa_id] = _Contribution(lsa, self.lsdb)
+        # Addresses that changed owner must be re-contracted
+        affected = set()
+        for address in reclaimed:
+            affected.update(self._users.get(address, ()))
+        for lsa_id in affected:
+            self._unmerge(lsa_id, self._contributions[lsa_id])
+        for lsa_id in chain(pending, affected):
+            try:
+                self._merge(lsa_id, self._contributions[lsa_id])
+            except KeyError:
+                pass  # The LSA was removed
+        # The secondary addresses of the links of rebound routers
+        rebound, self._rebound = self._rebound, set()
+        for rid in rebound:
+            if rid in self.graph:
+                for u, v in chain(self.graph.in_edges(rid),
+                                  self.graph.out_edges(rid)):
+                    self._refresh_edge(u, v)
+        return self.graph
+
+    def _resolve(self, node):
+        """
+        :return: the contracted identity of a node, and the id of the
+                controller it belongs to (None if any)
+        """
+        node = self.lsdb.owner_of(node)
+        cid = self.lsdb.controller_id(node)
+        return (node, None) if cid is None else ('C_%s' % cid, (cid, node))
+
+    def _merge(self, lsa_id, contrib):
+        """Add the contribution of an LSA to the graph"""
+        names = {}
+        members = []
+        for n, attrs in contrib.nodes:
+            self._users[n].add(lsa_id)
+            name, member = self._resolve(n)
+            names[n] = name
+            if member:
+                members.append(member)
+            # Only uncontracted nodes keep their attributes
+            if name == n:
+                contrib.merged_nodes[name] = attrs or None
+            else:
+                contrib.merged_nodes.setdefault(name, None)
+        edges = {}
+        for u, v, attrs in contrib.edges:
+            u, v = names[u], names[v]
+            if u != v:  # Contraction can create self loops
+                edges.setdefault((u, v), {}).update(attrs)
+        contrib.merged_edges = edges.keys()
+        contrib.members = members
+        for cid, ip in members:
+            ips = self.controllers.setdefault(cid, defaultdict(int))
+            ips[ip] += 1
+        controllers = set('C_%s' % cid for cid, _ in members)
+        for name, attrs in contrib.merged_nodes.iteritems():
+            self._node_refs[name] += 1
+            if name not in self.graph:
+                self._touch_node(name)
+                if name in controllers:
+                    self.graph.add_controller(name)
+                else:
+                    self.graph.add_node(name)
+            if attrs:
+                self._node_attrs[name][lsa_id] = attrs
+                self._refresh_node(name)
+        for (u, v), attrs in edges.iteritems():
+            self._edge_refs[u, v][lsa_id] = attrs
+            self._refresh_edge(u, v)
+
+    def _unmerge(self, lsa_id, contrib):
+        """Remove the contribution of an LSA from the graph"""
+        for n, _ in contrib.nodes:
+            users = self._users[n]
+            users.discard(lsa_id)
+            if not users:
+                del self._users[n]
+        for u, v in contrib.merged_edges:
+            refs = self._edge_refs[u, v]
+            del refs[lsa_id]
+            if refs:
+                self._refresh_edge(u, v)
+            else:
+                del self._edge_refs[u, v]
+                self._touch_edge(u, v)
+                self.graph.remove_edge(u, v)
+        for cid, ip in contrib.members:
+            ips = self.controllers[cid]
+            ips[ip] -= 1
+            if not ips[ip]:
+                del ips[ip]
+                if not ips:
+                    del self.controllers[cid]
+        for name, attrs in contrib.merged_nodes.iteritems():
+            self._node_refs[name] -= 1
+            if not self._node_refs[name]:
+                del self._node_refs[name]
+                self._node_attrs.pop(name, None)
+                self._touch_node(name)
+                self.graph.remove_node(name)
+            elif attrs:
+                del self._node_attrs[name][lsa_id]
+                self._refresh_node(name)
+        contrib.merged_nodes = {}
+        contrib.merged_edges = ()
+        contrib.members = ()
+
+    def _refresh_node(self, n):
+        self._touch_node(n)
+        was_router = self.graph.is_router(n)
+        data = self.graph.node[n]
+        data.clear()
+        attrs = self._node_attrs[n]
+        for lsa_id in sorted(attrs):
+            data.update(attrs[lsa_id])
+        if not attrs:
+            del self._node_attrs[n]
+        if was_router != self.graph.is_router(n):
+            # Secondary addresses are only set on links between routers
+            for u, v in chain(self.graph.in_edges(n), self.graph.out_edges(n)):
+                self._refresh_edge(u, v)
+
+    def _refresh_edge(self, u, v):
+        data = {}
+        refs = self._edge_refs[u, v]
+        for lsa_id in sorted(refs):
+            data.update(refs[lsa_id])
+        if self.graph.is_router(u) and self.graph.is_router(v):
+            try:
+                data['dst_address'] = self.lsdb.private_addresses\
+                                          .addresses_of(v, u)
+            except ValueError:
+                pass  # No private addresses on that link
+        self._touch_edge(u, v)
+        if self.graph.has_edge(u, v):
+            edge = self.graph[u][v]
+            edge.clear()
+            edge.update(data)
+        else:
+            self.graph.add_edge(u, v, data)
+
+
+class _Attachments(object):
+    """The prefixes that a single AS-External LSA attaches to the graph"""
+
+    def __init__(self, lsa, lsdb):
+        graph = IGPGraph()
+        lsa.apply(graph, lsdb)
+        self.edges = [(u, v, dict(graph.export_edge_data(u, v)))
+                      for u, v in graph.edges_iter()]
+        self.nodes = [(n, attrs) for n, attrs in graph.nodes_iter(data=True)
+                      if attrs]
+        # Their contracted counterparts, as last merged in the table
+        self.merged = ()  # (u, v)
+
+
+class PrefixTable(object):
+    """
+    The prefixes attached to the IGP graph by the AS-External LSAs, kept
+    apart from the router topology, such that the churn of the external
+    prefixes neither rebuilds nor diffs the graph of the routers.
+
+    Each LSA is applied on its own scratch graph, which gives its
+    attachments, i.e. edges from a node of the graph towards a prefix.
+    Their sources are named after their contracted identity
+    (LSDB.contracted_name), and are named again once their owner changes.
+    Attachments are reference-counted per LSA, conflicting attributes are
+    merged in the LSA key order.
+    """
+
+    def __init__(self, lsdb):
+        self.lsdb = lsdb
+        self._pending = set()  # lsa key
+        self._reclaimed = set()  # The addresses whose owners changed
+        self._attachments = {}  # lsa key : _Attachments
+        self._users = defaultdict(set)  # source : lsa keys
+        self._edge_refs = defaultdict(dict)  # (u, prefix) : {lsa key: attrs}
+        self._node_refs = defaultdict(dict)  # prefix : {lsa key: attrs}
+        # The merged attributes, as pushed to the listeners
+        self.edges = {}  # (u, prefix) : attributes
+        self.nodes = {}  # prefix : attributes
+        # The state of the edges/nodes changed since the last call to
+        # changes(), None if they were absent
+        self._old_edges = {}
+        self._old_nodes = {}
+
+    def __len__(self):
+        return len(self.edges)
+
+    def lsa_changed(self, lsa):
+        """Record that an AS-External LSA has been added or removed"""
+        self._pending.add(lsa.key())
+
+    def addresses_changed(self, addresses):
+        """Record that addresses are contracted in other nodes"""
+        self._reclaimed.update(addresses)
+
+    def update(self):
+        """Apply all pending LSA changes on the table"""
+        pending, self._pending = self._pending, set()
+        reclaimed, self._reclaimed = self._reclaimed, set()
+        for address in reclaimed:
+            pending.update(self._users.get(address, ()))
+        for key in pending:
+            old = self._attachments.pop(key, None)
+            if old:
+                self._unmerge(key, old)
+            lsa = self.lsdb.ext_networks.get(key)
+            if lsa:
+                attachments = _Attachments(lsa, self.lsdb)
+                self._attachments[key] = attachments
+                self._merge(key, attachments)
+
+    def changes(self):
+        """
+        Give the changes made to the table since the last call
+        :return: added (or updated) edges (u, prefix, attributes),
+                 removed edges (u, prefix), node properties changes
+        """
+        added, removed, node_props = [], [], {}
+        for edge, old in self._old_edges.iteritems():
+            data = self.edges.get(edge)
+            if data is None:
+                if old is not None:
+                    removed.append(edge)
+            elif data != old:
+                added.append(edge + (data,))
+        for n, old in self._old_nodes.iteritems():
+            data = self.nodes.get(n)
+            if data is not None and data != old:
+                node_props[n] = data
+        self._old_edges.clear()
+        self._old_nodes.clear()
+        return added, removed, node_props
+
+    def apply(self, graph):
+        """Add the attachments to a graph, e.g. to draw it"""
+        for (u, v), data in self.edges.iteritems():
+            graph.add_edge(u, v, data)
+        for n, data in self.nodes.iteritems():
+            graph.add_node(n, data)
+
+    def _merge(self, key, attachments):
+        merged = set()
+        for u, v, attrs in attachments.edges:
+            self._users[u].add(key)
+            edge = self.lsdb.contracted_name(u), v
+            self._edge_refs[edge].setdefault(key, {}).update(attrs)
+            merged.add(edge)
+        attachments.merged = merged
+        for edge in merged:
+            self._refresh(edge, self._edge_refs, self.edges, self._old_edges)
+        for n, attrs in attachments.nodes:
+            self._node_refs[n][key] = attrs
+            self._refresh(n, self._node_refs, self.nodes, self._old_nodes)
+
+    def _unmerge(self, key, attachments):
+        for u, _, _ in attachments.edges:
+            users = self._users[u]
+            users.discard(key)
+            if not users:
+                del self._users[u]
+        for edge in attachments.merged:
+            del self._edge_refs[edge][key]
+            self._refresh(edge, self._edge_refs, self.edges, self._old_edges)
+        attachments.merged = ()
+        for n, _ in attachments.nodes:
+            del self._node_refs[n][key]
+            self._refresh(n, self._node_refs, self.nodes, self._old_nodes)
+
+    @staticmethod
+    def _refresh(item, refs, merged, old):
+        """Merge again the attributes of an edge or node of the table"""
+        if item not in old:
+            # The merged attributes are replaced, never updated in place
+            old[item] = merged.get(item)
+        attrs = refs[item]
+        if not attrs:
+            del refs[item]
+            merged.pop(item, None)
+            return
+        data = {}
+        for key in sorted(attrs):
+            data.update(attrs[key])
+        merged[item] = data
+
+
 class Transaction(object):
+    """
+    The LSA changes between a BEGIN and a COMMIT. Only the last change of
+    each LSA is kept, e.g. an LSA added then removed is only removed, and
+    an LSA refreshed several times is only added once.
+    """
+
     def __init__(self):
         log.debug('Initiating new LSA transaction')
-        self.add = []
-        self.rem = []
+        self.changes = {}  # (lsa type, lsa key): (lsa, whether it is added)
+        self.elided = 0  # Changes superseded by a later one
+
+    def _change(self, lsa, added):
+        key = lsa.key()
+        if key is None:
+            return  # e.g. UnusedLSA
+        lsa_id = lsa.TYPE, key
+        if lsa_id in self.changes:
+            self.elided += 1
+        self.changes[lsa_id] = lsa, added
 
     def add_lsa(self, lsa):
-        self.add.append(lsa)
+        self._change(lsa, True)
 
     def remove_lsa(self, lsa):
-        self.rem.append(lsa)
+        self._change(lsa, False)
 
     def commit(self, lsdb):
         log.debug('Committing LSA transaction')
-        for lsa in self.rem:
-            lsdb.remove_lsa(lsa)
-        for lsa in self.add:
-            lsdb.add_lsa(lsa)
+        start = time.time()
+        for lsa, added in self.changes.itervalues():
+            if not added:
+                lsdb.remove_lsa(lsa)
+        for lsa, added in self.changes.itervalues():
+            if added:
+                lsdb.add_lsa(lsa)
+        lsdb.stats['transaction_elided_changes'] += self.elided
+        latency.record(latency.TRANSACTION_COMMIT, time.time() - start)
+
+
+class _PrivateAddressIndex(object):
+    """The indexes of a private addresses binding file, never modified"""
+
+    def __init__(self, bindings=None, address_id=intern):
+        """
+        :param bindings: the content of the binding file
+                         {subnet: {router-id: ip or [ips]}}
+        :param address_id: the representation of the addresses, see
+                           LSDB.address_id
+        """
+        self.bindings = defaultdict(dict)  # router-id: {neighbor: [ips]}
+        self.bdomains = {}  # ip: the other router-ids of its subnet
+        self.routers = {}  # ip: router-id
+        for subnets in (bindings or {}).itervalues():
+            # Use the same address representation as the LSAs
+            subnets = {address_id(str(rid)):
+                       ([address_id(str(i)) for i in ip]
+                        if is_container(ip) else [address_id(str(ip))])
+                       for rid, ip in subnets.iteritems()}
+            sub = subnets.keys()
+            for rid, ips in subnets.iteritems():
+                # Log private addresses adjacencies
+                other = [s for s in sub if s != rid]
+                for s in other:
+                    self.bindings[rid][s] = ips
+                for i in ips:
+                    # Register the broadcast domain and owner of each ip
+                    self.bdomains[i] = other
+                    self.routers[i] = rid
+        self.bindings = dict(self.bindings)
+        # The flattened private addresses of each router
+        self.addresses = {rid: tuple(i for ips in neighbors.itervalues()
+                                     for i in ips)
+                          for rid, neighbors in self.bindings.iteritems()}
+
+    def changes(self, other):
+        """
+        :param other: another index
+        :return: the router-ids whose bindings differ in the other index,
+                 and the ips whose broadcast domains differ
+        """
+        routers = set(rid for rid in chain(self.bindings, other.bindings)
+                      if self.bindings.get(rid) != other.bindings.get(rid))
+        ips = set(ip for ip in chain(self.bdomains, other.bdomains)
+                  if self.bdomains.get(ip) != other.bdomains.get(ip))
+        return routers, ips
 
 
 class PrivateAddressStore(object):
     """A wrapper to serve as database to help cope with the private addresses
-    madness"""
+    madness. Its indexes are replaced as a whole when the binding file
+    is reloaded."""
 
-    def __init__(self, filename):
-        (self._address_bindings,
-         self._bdomains) = self.__read_private_ips(filename)
-
-    def __read_private_ips(self, filename):
-        router_private_address = defaultdict(dict)
-        ip_to_bd = defaultdict(list)
+    def __init__(self, filename, address_id=intern):
+        """
+        :param filename: the private addresses binding file
+        :param address_id: the representation of the addresses, see
+                           LSDB.address_id
+        """
+        self.filename = filename
+        self.address_id = address_id
+        self._stat = self.__stat()
         try:
-            with open(filename, 'r') as f:
-                private_address_binding = json.load(f)
-                for subnets in private_address_binding.itervalues():
-                    # Log router id in broadcast domain
-                    sub = subnets.keys()
-                    for rid, ip in subnets.iteritems():
-                        # Enable single private address as string
-                        if not is_container(ip):
-                            ip = [ip]
-                        # Log private addresses adjacencies
-                        other = sub[:]
-                        other.remove(rid)
-                        for s in other:
-                            router_private_address[rid][s] = ip
-                        for i in ip:
-                            # Register the broadcast domain for each ip
-                            ip_to_bd[i] = other
+            self._index = self.__read_private_ips()
         except ValueError as e:
             log.error('Incorrect private IP addresses binding file')
             log.error(str(e))
-            ip_to_bd.clear()
-            router_private_address.clear()
-        return router_private_address, ip_to_bd
+            self._index = _PrivateAddressIndex(address_id=address_id)
+
+    def __stat(self):
+        try:
+            st = os.stat(self.filename)
+        except OSError:
+            return None
+        return st.st_mtime, st.st_size, st.st_ino
+
+    def __read_private_ips(self):
+        with open(self.filename, 'r') as f:
+            return _PrivateAddressIndex(json.load(f), self.address_id)
+
+    def reload(self):
+        """
+        Reload the binding file if it changed since it was last read
+        :return: the router-ids whose bindings changed and the ips whose
+                 broadcast domains changed, None if the file did not change
+        """
+        stat = self.__stat()
+        if stat == self._stat or stat is None:
+            return None
+        self._stat = stat
+        try:
+            index = self.__read_private_ips()
+        except (IOError, ValueError) as e:
+            log.error('Cannot reload the private IP addresses binding file '
+                      '%s, keeping the previous one: %s', self.filename, e)
+            return None
+        old, self._index = self._index, index
+        return old.changes(index)
 
     def addresses_of(self, rid, f=None):
         """Return the list of private ip addresses for router id if f is None,
         else the list of forwarding addresses from f to rid"""
+        index = self._index
+        if not f:
+            return index.addresses.get(rid, ())
         try:
-            return ([i for l in self._address_bindings[rid].itervalues()
-                     for i in l]
-                    if not f
-                    else self._address_bindings[rid][f])
+            return index.bindings[rid][f]
         except KeyError:
             raise ValueError('No private address for %s from %s' % (rid, f))
 
+    def router_of(self, ip):
+        """Return the router id owning the given private ip"""
+        try:
+            return self._index.routers[ip]
+        except KeyError:
+            raise ValueError('No such private IP %s' % ip)
+
     def targets_for(self, ip):
         """Return the list of router ids able to reach the given private ip"""
         try:
-            return self._bdomains[ip]
+            return self._index.bdomains[ip]
         except KeyError:
             raise ValueError('No such private IP %s' % ip)
 
     def __repr__(self):
         return 'bindings: %s\nbdomains: %s' %\
-               (self._address_bindings, self._bdomains)
+               (self._index.bindings, self._index.bdomains)
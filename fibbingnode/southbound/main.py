@@ -7,7 +7,9 @@ import argparse
 import datetime
 from fibbing import FibbingManager
 import fibbingnode
-from fibbingnode.misc.utils import dump_threads
+from fibbingnode.misc.utils import dump_threads, ADDRESS_CACHES
+import latency
+import census
 import signal
 
 log = fibbingnode.log
@@ -19,6 +21,8 @@ class FibbingCLI(Cmd):
 
     def __init__(self, mngr, *args, **kwargs):
         self.fibbing = mngr
+        # The census printed last, to print the changes since then
+        self.last_census = None
         Cmd.__init__(self, *args, **kwargs)
 
     def do_add_node(self, line=''):
@@ -28,9 +32,62 @@ class FibbingCLI(Cmd):
     def do_show_lsdb(self, line=''):
         log.info(self.fibbing.root.lsdb)
 
+    def do_show_stats(self, line=''):
+        """Print the LSDB processing counters"""
+        stats = self.fibbing.root.lsdb.stats
+        for key, val in sorted(stats.iteritems()):
+            log.info('%s: %s', key, val)
+        if stats['graph_updates']:
+            log.info('lines per graph update: %.2f',
+                     float(stats['coalesced_lines']) / stats['graph_updates'])
+        for name, cache in sorted(ADDRESS_CACHES.iteritems()):
+            log.info('%s cache: %s', name, cache)
+        q = self.fibbing.root.lsdb.queue.stats()
+        log.info('LSDB queue: %d lines pending (high-water mark %d), lag '
+                 '%.3fs, %d lines collapsed, %d blocked reads (%.3fs)',
+                 q['depth'], q['high_water'], q['lag'], q['collapsed'],
+                 q['blocked'], q['blocked_time'])
+        for name, l in sorted(self.fibbing.root.lsdb.listener_stats()
+                              .iteritems()):
+            log.info('listener %s: %d updates sent in %d batches, '
+                     '%d pending, lag %.3fs (max %.3fs), %d ops elided',
+                     name, l['pushed'], l['sent'], l['pending'], l['lag'],
+                     l['max_lag'], l['elided'])
+        renderer = self.fibbing.root.lsdb.renderer
+        if renderer:
+            r = renderer.stats()
+            log.info('graph renderer: %d drawings of %d changes, last one '
+                     'of version %s took %.3fs (max %.3fs)', r['rendered'],
+                     r['requested'], r['version'], r['last_render'],
+                     r['max_render'])
+
+    def do_show_latency(self, line=''):
+        """Print the latency histograms of the LSA processing stages"""
+        for stage, h in latency.STAGES.iteritems():
+            log.info('%s: %s', stage, h)
+
+    def do_dump_latency(self, line):
+        """Write the latency histograms as JSON in the given file"""
+        if not line:
+            log.error('dump_latency takes a file name')
+            return
+        latency.dump(line)
+
+    def do_reset_latency(self, line=''):
+        """Clear the latency histograms"""
+        latency.reset()
+
+    def do_record_latency(self, line):
+        """Start (on) or stop (off) recording the latency histograms"""
+        if line not in ('on', 'off'):
+            log.error('record_latency takes on or off')
+            return
+        latency.enable(line == 'on')
+
     def do_draw_network(self, line):
         """Draw the network as pdf in the given file"""
-        self.fibbing.root.lsdb.graph.draw(line)
+        graph, _ = self.fibbing.root.lsdb.rendered_graph()
+        graph.draw(line)
 
     def do_print_graph(self, line=''):
         log.info('Current network graph: %s',
@@ -44,6 +101,51 @@ class FibbingCLI(Cmd):
         """Print information about the fibbing routes"""
         self.fibbing.print_routes()
 
+    def do_print_prefix(self, line=''):
+        """Print the external LSAs and the fibbing routes matching the given
+        prefix or address"""
+        if not line:
+            log.error('print_prefix takes a prefix or an address')
+            return
+        try:
+            lsas = self.fibbing.lsdb.ext_lsas_for(line)
+            route = self.fibbing.route_for(line)
+            shadowing = self.fibbing.shadowing_routes(line)
+        except ValueError as e:
+            log.error('Invalid prefix %s: %s', line, e)
+            return
+        log.info('External LSAs: %s', ', '.join(map(str, lsas.values())))
+        log.info('Fibbing route: %s', route)
+        log.info('Fibbing routes within %s: %d', line, len(shadowing))
+        for r in shadowing:
+            log.info(r)
+
+    def do_census(self, line=''):
+        """Print the object counts and approximate sizes of the LSDB, its
+        graphs and the fibbing routes, and their changes since the previous
+        census"""
+        c = self.fibbing.census()
+        for l in c.report():
+            log.info(l)
+        if self.last_census:
+            for l in c.diff_report(self.last_census):
+                log.info(l)
+        self.last_census = c
+
+    def do_census_trace(self, line=''):
+        """Trace the memory allocations for the next censuses, with the
+        given number of frames per allocation (default 1), or stop tracing
+        them: census_trace off"""
+        if line == 'off':
+            census.stop_tracing()
+            return
+        try:
+            frames = int(line) if line else 1
+        except ValueError:
+            log.error('census_trace takes a number of frames or off')
+            return
+        census.start_tracing(frames)
+
     def do_exit(self, line=''):
         """Exit the prompt"""
         return True
@@ -197,6 +299,9 @@ def handle_args():
 
 def main():
     phys_ports, name, cli = handle_args()
+    frames = CFG.getint(DEFAULTSECT, 'census_trace_frames')
+    if frames > 0:
+        census.start_tracing(frames)
     if not cli:
         fibbingnode.log_to_file('%s.log' % name)
     mngr = FibbingManager(name)
@@ -0,0 +1,118 @@
+"""
+Background rendering of the IGP graph (draw_graph), such that laying out a
+large topology does not stall the LSA processing.
+"""
+from threading import Thread, Condition
+import time
+
+import fibbingnode
+import latency
+
+log = fibbingnode.log
+
+
+class GraphRenderer(object):
+    """
+    Draw the graph from its own thread, at most once per min_interval.
+    Only the latest graph is drawn, the changes made meanwhile are merged
+    into a single rendering.
+    """
+
+    def __init__(self, get_graph, min_interval=0):
+        """
+        :param get_graph: a function returning the graph to draw and its
+                          version, the graph must not change while drawn
+        :param min_interval: the minimal time between two renderings,
+                             in seconds
+        """
+        self.get_graph = get_graph
+        self.min_interval = min_interval
+        self._cond = Condition()
+        self._path = None  # Where to draw the graph, None if unchanged
+        self._rendering = False
+        self.running = True
+        # Metrics
+        self.requested = self.rendered = self.skipped = 0
+        self.version = None  # The last version drawn
+        self.last_render = self.max_render = 0
+        self._last_start = 0
+        self._thread = Thread(target=self._run, name='graph_renderer')
+        self._thread.setDaemon(True)
+        self._thread.start()
+
+    def changed(self, path):
+        """
+        Draw the graph once the minimal interval has elapsed
+        :param path: where to draw it
+        """
+        with self._cond:
+            if self._path is not None:
+                self.skipped += 1
+            self._path = path
+            self.requested += 1
+            self._cond.notify()
+
+    def _run(self):
+        while self.running:
+            with self._cond:
+                while self.running and self._path is None:
+                    self._cond.wait()
+                delay = self._last_start + self.min_interval - time.time()
+                while self.running and delay > 0:
+                    self._cond.wait(delay)
+                    delay = (self._last_start + self.min_interval -
+                             time.time())
+                if not self.running:
+                    return
+                path, self._path = self._path, None
+                self._rendering = True
+            start = self._last_start = time.time()
+            try:
+                graph, version = self.get_graph()
+                graph.draw(path)
+            except Exception as e:
+                log.error('Failed to draw the graph to %s: %s', path, e)
+                log.exception(e)
+                version = None
+            with self._cond:
+                self._rendering = False
+                self.last_render = time.time() - start
+                self.max_render = max(self.max_render, self.last_render)
+                latency.record(latency.RENDER, self.last_render)
+                if version is not None:
+                    self.rendered += 1
+                    self.version = version
+                self._cond.notify_all()
+
+    def wait_idle(self, timeout=None):
+        """
+        Wait until the last change has been drawn
+        :param timeout: the maximal time to wait, in seconds
+        :return: whether the last change has been drawn
+        """
+        deadline = time.time() + timeout if timeout is not None else None
+        with self._cond:
+            while self._path is not None or self._rendering:
+                remaining = (deadline - time.time() if deadline is not None
+                             else None)
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            return True
+
+    def stop(self):
+        """Stop the rendering thread, dropping the pending change"""
+        with self._cond:
+            self.running = False
+            self._cond.notify_all()
+
+    def stats(self):
+        """:return: the metrics of the renderer"""
+        with self._cond:
+            return {'requested': self.requested,
+                    'rendered': self.rendered,
+                    'skipped': self.skipped,
+                    'pending': self._path is not None,
+                    'version': self.version,
+                    'last_render': self.last_render,
+                    'max_render': self.max_render}
@@ -0,0 +1,437 @@
+"""
+Record and replay the LSDB log (ospfd --log_lsdb) outside of a fibbing node.
+The replayed lines are fed straight into LSDB.commit_change, with a stub
+leader watchdog and northbound listener, such that changes to lsdb.py can be
+benchmarked without root, namespaces or ospfd.
+
+Captures are plain LSDB logs, possibly prefixed by the time at which each
+line was received followed by a tab, which is what the record command writes.
+Usage:
+    python -m fibbingnode.southbound.replay record FIFO CAPTURE
+    python -m fibbingnode.southbound.replay replay [--timed] CAPTURE
+    python -m fibbingnode.southbound.replay synthetic [--routers N]
+                                                      [--prefixes M] ...
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+from ConfigParser import DEFAULTSECT
+
+import fibbingnode
+from fibbingnode.misc.utils import read_lines, ADDRESS_CACHES
+from lsdb import LSDB, ADD, REM, SEP_ACTION
+from dispatch import ListenerDispatcher
+from interface import ShapeshifterProxy
+import latency
+
+log = fibbingnode.log
+CFG = fibbingnode.CFG
+
+# Separates the reception time from the line in the captures
+SEP_TIME = '\t'
+
+
+def record(fifo, capture):
+    """
+    Copy the LSDB log written to a FIFO into a capture, timestamping each line
+    :param fifo: the path to the LSDB log FIFO
+    :param capture: the path of the capture to write
+    :return: the number of recorded lines
+    """
+    count = 0
+    with open(capture, 'w') as out:
+        fd = os.open(fifo, os.O_RDONLY)
+        try:
+            for line in read_lines(fd):
+                out.write('%.6f%s%s\n' % (time.time(), SEP_TIME, line))
+                count += 1
+        finally:
+            os.close(fd)
+    return count
+
+
+def read_capture(capture):
+    """
+    :param capture: the path to a (possibly timestamped) LSDB log
+    :return: an iterator over (timestamp or None, line)
+    """
+    with open(capture, 'r') as f:
+        for line in f:
+            line = line.rstrip('\n')
+            if not line:
+                continue
+            ts, sep, rest = line.partition(SEP_TIME)
+            yield (float(ts), rest) if sep else (None, line)
+
+
+def ip(n, base=10 << 24):
+    """:return: the n-th IPv4 address after base"""
+    n += base
+    return '%d.%d.%d.%d' % (n >> 24, (n >> 16) & 255, (n >> 8) & 255, n & 255)
+
+
+def _router_lsa(r, router_count, metric=10):
+    """The Router LSA of the r-th router of a ring"""
+    rid = ip(r, 1 << 24)
+    links = ['link_type:1;link_id:%s;link_data:%s;link_metric:%d;' %
+             (ip(n, 1 << 24), ip(2 * r + (n > r)), metric)
+             for n in ((r - 1) % router_count, (r + 1) % router_count)]
+    links.append('link_type:3;link_id:%s;link_data:255.255.255.255;'
+                 'link_metric:0;' % rid)
+    return 'rid:%s;link_id:%s;lsa_type:1; %s' % (rid, rid, ' '.join(links))
+
+
+def _ext_lsa(p, router_count):
+    """The AS-External LSA of the p-th prefix"""
+    return ('rid:%s;link_id:%s;lsa_type:5;link_mask:255.255.255.0; '
+            'link_metric:%d;fwd_addr:0.0.0.0;' %
+            (ip(p % router_count, 1 << 24), ip(p << 8, 100 << 24), 1 + p % 3))
+
+
+def synthetic_log(router_count, prefix_count, updates=0, interval=.01,
+                  refreshes=0):
+    """
+    Generate the LSDB log of a ring of routers, each having a stub link and
+    two p2p links, with external prefixes spread across them. The initial
+    LSDB is followed by updates, alternating between a metric change on
+    a router and the withdrawal or re-announcement of a prefix, then by
+    periodic refreshes re-announcing every LSA unchanged.
+    :param router_count: the number of routers
+    :param prefix_count: the number of external prefixes
+    :param updates: the number of updates following the initial LSDB
+    :param interval: the time between two updates
+    :param refreshes: how many times the final LSDB is refreshed
+    :return: an iterator over (timestamp, line)
+    """
+    lsas = {}  # The lines of the LSAs currently announced
+    for r in xrange(router_count):
+        lsas['r', r] = line = ADD + SEP_ACTION + _router_lsa(r, router_count)
+        yield 0, line
+    for p in xrange(prefix_count):
+        lsas['p', p] = line = ADD + SEP_ACTION + _ext_lsa(p, router_count)
+        yield 0, line
+    ts = 0
+    for u in xrange(updates):
+        ts = (u + 1) * interval
+        if u % 2 or not prefix_count:
+            r = u % router_count
+            lsas['r', r] = line = ADD + SEP_ACTION + _router_lsa(
+                r, router_count, metric=10 + u % 7)
+        else:
+            p = (u / 2) % prefix_count
+            # Withdrawn on the first pass, re-announced on the next one
+            action = REM if (u / 2 / prefix_count) % 2 == 0 else ADD
+            line = action + SEP_ACTION + _ext_lsa(p, router_count)
+            if action == REM:
+                lsas.pop(('p', p), None)
+            else:
+                lsas['p', p] = line
+        yield ts, line
+    for _ in xrange(refreshes):
+        ts += interval
+        for key in sorted(lsas):
+            yield ts, lsas[key]
+
+
+def percentile(samples, p):
+    """:return: the p-th percentile (nearest rank) of sorted samples"""
+    if not samples:
+        return float('nan')
+    return samples[min(len(samples) - 1, int(len(samples) * p / 100.))]
+
+
+class StubListener(ShapeshifterProxy):
+    """
+    A northbound listener counting what it receives, and keeping the edges
+    added by the updates
+    """
+
+    def __init__(self):
+        self.added = self.removed = self.node_updates = self.commits = 0
+        self.prefixes_added = self.prefixes_removed = 0
+        self.edges = set()
+
+    def add_edge(self, source, destination, properties=None):
+        self.added += 1
+        self.edges.add((source, destination))
+
+    def remove_edge(self, source, destination):
+        self.removed += 1
+        self.edges.discard((source, destination))
+
+    def update_node_properties(self, **properties):
+        self.node_updates += len(properties)
+
+    def update_prefixes(self, added, removed, node_properties):
+        self.prefixes_added += len(added)
+        self.prefixes_removed += len(removed)
+        self.node_updates += len(node_properties)
+
+    def commit(self, version=None):
+        self.commits += 1
+
+    def bootstrap_graph(self, graph, node_properties, version=None):
+        pass
+
+
+class StubWatchdog(object):
+    """A leader watchdog recording the elected leaders"""
+
+    def __init__(self):
+        self.leader = None
+        self.elections = 0
+
+    def check_leader(self, instance):
+        if instance != self.leader:
+            self.leader = instance
+            self.elections += 1
+
+
+class Replay(object):
+    """Feed LSDB log lines into an LSDB and measure how it copes with them"""
+
+    def __init__(self, lsdb):
+        """
+        :param lsdb: the LSDB instance to feed, its processing thread
+                     must not have handled any line yet
+        """
+        self.lsdb = lsdb
+        # The reports hold the latencies, whatever the LSDB settings
+        latency.reset()
+        latency.enable()
+        self.listener = StubListener()
+        self.watchdog = StubWatchdog()
+        lsdb.set_leader_watchdog(self.watchdog)
+        # Bypass the SJMP proxy used for actual northbound sessions
+        self.dispatcher = ListenerDispatcher(self.listener, name='replay')
+        lsdb.listener[self.listener] = self.dispatcher
+        self.fed = []  # The time at which each line was fed
+        self.parse_time = 0
+        self.rebuilds = []  # The duration of each graph update
+        self.lags = []  # The time between feeding a line and its update
+        self._flushed = 0  # Lines covered by the graph updates so far
+        self._processed = 0  # Lines processed by the LSDB so far
+        self._refreshed = 0  # Lines processed until the last graph update
+        self._refreshing = False
+        self._last_refresh = 0
+        self._process_line = lsdb.process_line
+        self._refresh_graph = lsdb.refresh_graph
+        lsdb.process_line = self.process_line
+        lsdb.refresh_graph = self.refresh_graph
+
+    def process_line(self, line):
+        start = time.time()
+        self._processed += 1
+        try:
+            return self._process_line(line)
+        finally:
+            self.parse_time += time.time() - start
+
+    def refresh_graph(self):
+        start = time.time()
+        self._refreshing = True
+        try:
+            self._refresh_graph()
+        finally:
+            self._refreshing = False
+        now = time.time()
+        self.rebuilds.append(now - start)
+        # The update covers the lines fed so far, but those still queued,
+        # including the lines collapsed in the queue or suppressed
+        self._refreshed = self._processed
+        covered = max(self._flushed, len(self.fed) - self.lsdb.queue.qsize())
+        self.lags.extend(now - t for t in self.fed[self._flushed:covered])
+        self._flushed = covered
+        self._last_refresh = now
+
+    def unflushed(self):
+        """:return: how many processed lines are not covered by a graph
+                    update yet"""
+        return self._processed - self._refreshed
+
+    def run(self, lines, timed=False, speed=1.0, settle=None):
+        """
+        Feed lines into the LSDB, then wait until they have been processed
+        :param lines: an iterable of (timestamp or None, line)
+        :param timed: whether to wait between lines as in the timestamps
+        :param speed: the replay speed factor, for timed replays
+        :param settle: how long to wait for a last graph update once all
+                       lines are processed, defaults to commit_max_delay
+        :return: the report, see report()
+        """
+        if settle is None:
+            settle = CFG.getfloat(DEFAULTSECT, 'commit_max_delay') + .1
+        first_ts = None
+        start = time.time()
+        for ts, line in lines:
+            if timed and ts is not None:
+                if first_ts is None:
+                    first_ts = ts
+                delay = start + (ts - first_ts) / speed - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+            self.fed.append(time.time())
+            self.lsdb.commit_change(line)
+        self.lsdb.queue.join()
+        processed = time.time()
+        # Wait for the pending changes to be pushed, as long as the graph
+        # updates keep making progress
+        while self.unflushed() and (
+                self._refreshing or
+                time.time() < max(processed, self._last_refresh) + settle):
+            time.sleep(.01)
+        self.dispatcher.wait_idle(settle)
+        return self.report(time.time() - start, processed - start)
+
+    def report(self, elapsed, processing):
+        """
+        :param elapsed: the total duration of the replay
+        :param processing: the time spent until all lines were processed
+        :return: a dict of measurements, durations are in milliseconds
+        """
+        rebuilds = sorted(self.rebuilds)
+        lags = sorted(self.lags)
+        ms = 1000.
+        lines = len(self.fed)
+        report = {
+            'lines': lines,
+            'elapsed': elapsed * ms,
+            'lines_per_sec': lines / processing if processing else 0,
+            'parse_rate': lines / self.parse_time if self.parse_time else 0,
+            'rebuilds': len(rebuilds),
+            'rebuild_p50': percentile(rebuilds, 50) * ms,
+            'rebuild_p90': percentile(rebuilds, 90) * ms,
+            'rebuild_p99': percentile(rebuilds, 99) * ms,
+            'rebuild_max': rebuilds[-1] * ms if rebuilds else 0,
+            'lag_p50': percentile(lags, 50) * ms,
+            'lag_p99': percentile(lags, 99) * ms,
+            'lag_max': lags[-1] * ms if lags else 0,
+            'unflushed_lines': self.unflushed(),
+            'suppressed_refreshes': self.lsdb.stats['suppressed_refreshes'],
+            'edges_added': self.listener.added,
+            'edges_removed': self.listener.removed,
+            'prefixes_added': self.listener.prefixes_added,
+            'prefixes_removed': self.listener.prefixes_removed,
+            'node_updates': self.listener.node_updates,
+            'listener_commits': self.listener.commits,
+            'listener_lag_max': self.dispatcher.max_lag * ms,
+            'listener_coalesced': self.dispatcher.coalesced,
+            'leader_elections': self.watchdog.elections,
+            'nodes': self.lsdb.graph.number_of_nodes(),
+            'edges': self.lsdb.graph.number_of_edges(),
+            'prefixes': len(self.lsdb.prefix_table),
+        }
+        for name, cache in ADDRESS_CACHES.iteritems():
+            report['%s_cache_hit_rate' % name] = cache.hit_rate()
+        for key, val in self.lsdb.queue.stats().iteritems():
+            report['queue_%s' % key] = val
+        report['latency'] = latency.report()
+        return report
+
+
+def print_report(report):
+    print('Fed %(lines)d lines in %(elapsed).1fms, processed at '
+          '%(lines_per_sec).0f lines/s (parsing and applying: '
+          '%(parse_rate).0f lines/s)' % report)
+    print('%(rebuilds)d graph updates, latency p50 %(rebuild_p50).2fms '
+          'p90 %(rebuild_p90).2fms p99 %(rebuild_p99).2fms '
+          'max %(rebuild_max).2fms' % report)
+    print('End-to-end lag p50 %(lag_p50).2fms p99 %(lag_p99).2fms '
+          'max %(lag_max).2fms, %(unflushed_lines)d lines not pushed' %
+          report)
+    print('Pushed +%(edges_added)d -%(edges_removed)d edges, '
+          '+%(prefixes_added)d -%(prefixes_removed)d prefixes, '
+          '%(node_updates)d node updates, %(leader_elections)d leader '
+          'elections; final graph: %(nodes)d nodes, %(edges)d edges, '
+          '%(prefixes)d prefixes' % report)
+    print('Listener received %(listener_commits)d commits, '
+          '%(listener_coalesced)d graph updates coalesced, '
+          'max lag %(listener_lag_max).2fms' % report)
+    print('%(suppressed_refreshes)d unchanged LSA refreshes suppressed' %
+          report)
+    print('Queue high-water mark %(queue_high_water)d lines, '
+          '%(queue_collapsed)d collapsed, %(queue_blocked)d blocked reads '
+          '(%(queue_blocked_time).3fs)' % report)
+    print('Address caches hit rates: ' + ', '.join(
+        '%s %.1f%%' % (name, 100 * report['%s_cache_hit_rate' % name])
+        for name in sorted(ADDRESS_CACHES)))
+    for stage, h in report['latency'].iteritems():
+        if h['count']:
+            print('  %-20s %8d samples, p50 %.3fms p99 %.3fms max %.3fms' % (
+                stage, h['count'], h['p50'] * 1e3, h['p99'] * 1e3,
+                h['max'] * 1e3))
+
+
+def handle_args():
+    parser = argparse.ArgumentParser(description='Record or replay the '
+                                                 'LSDB log of ospfd.')
+    parser.add_argument('--cfg', help='Use specified config file',
+                        default=None)
+    sub = parser.add_subparsers(dest='command')
+    rec = sub.add_parser('record', help='Timestamp and save a live LSDB log')
+    rec.add_argument('fifo', help='The LSDB log FIFO')
+    rec.add_argument('capture', help='Where to save the capture')
+    for name, help_str in (('replay', 'Replay a captured LSDB log'),
+                           ('synthetic', 'Replay a synthetic LSDB log')):
+        p = sub.add_parser(name, help=help_str)
+        if name == 'replay':
+            p.add_argument('capture', help='The captured LSDB log')
+        else:
+            p.add_argument('--routers', type=int, default=100)
+            p.add_argument('--prefixes', type=int, default=1000)
+            p.add_argument('--updates', type=int, default=1000)
+            p.add_argument('--interval', type=float, default=.01,
+                           help='Seconds between updates, for --timed')
+            p.add_argument('--refreshes', type=int, default=0,
+                           help='How many times to refresh the final LSDB')
+        p.add_argument('--timed', action='store_true', default=False,
+                       help='Replay at the recorded timings instead of '
+                            'at full speed')
+        p.add_argument('--speed', type=float, default=1.0,
+                       help='Speed factor of timed replays')
+        p.add_argument('--private-ips', default=None,
+                       help='The private IP addresses binding file')
+        p.add_argument('--json', action='store_true', default=False,
+                       help='Print the report as JSON')
+    return parser.parse_args()
+
+
+def main():
+    args = handle_args()
+    if args.cfg:
+        CFG.read(args.cfg)
+    if args.command == 'record':
+        log.info('Recorded %d lines', record(args.fifo, args.capture))
+        return
+    CFG.set(DEFAULTSECT, 'draw_graph', '0')
+    private_ips = args.private_ips
+    if not private_ips:
+        fd, private_ips = tempfile.mkstemp(suffix='.json')
+        os.write(fd, '{}')
+        os.close(fd)
+    CFG.set(DEFAULTSECT, 'private_ips', private_ips)
+    try:
+        lsdb = LSDB()
+    finally:
+        if not args.private_ips:
+            os.unlink(private_ips)
+    if args.command == 'replay':
+        lines = read_capture(args.capture)
+    else:
+        lines = synthetic_log(args.routers, args.prefixes,
+                              args.updates, args.interval, args.refreshes)
+    replay = Replay(lsdb)
+    report = replay.run(lines, timed=args.timed, speed=args.speed)
+    replay.dispatcher.stop()
+    lsdb.listener.clear()
+    lsdb.stop()
+    if args.json:
+        print(json.dumps(report, sort_keys=True))
+    else:
+        print_report(report)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""
+Snapshots of the LSDB content, such that a restarted fibbing node can serve
+a graph to its northbound controllers immediately, instead of waiting for
+OSPF to flood the whole database again.
+
+A snapshot is a JSON document holding the description of each LSA as in
+the LSDB log, i.e. only data, independent of the LSA classes and of how
+the addresses are represented. The LSDB parses them back and rebuilds its
+graph and prefix table: a warm restart thus skips the feed and its
+coalescing delays, but still parses every LSA, which dominates its time
+(see tests/manual/bench_lsdb_snapshot.py). It is written to a temporary
+file which then atomically replaces the previous snapshot.
+"""
+import json
+import os
+import tempfile
+import time
+
+import fibbingnode
+
+log = fibbingnode.log
+
+# Bump when the format of the snapshot changes
+SNAPSHOT_VERSION = 3
+
+
+def save(lsdb, path):
+    """
+    Atomically write a snapshot of an LSDB. This must be called from the
+    thread processing the LSAs, or once it has stopped, as the LSDB tables
+    are only modified by that thread.
+    :param lsdb: the LSDB to save
+    :param path: where to write the snapshot
+    :return: the size of the snapshot, in bytes
+    """
+    start = time.time()
+    lsas = [lsa.lsa_info() for db in (lsdb.routers, lsdb.networks,
+                                      lsdb.ext_networks)
+            for lsa in db.itervalues()]
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)),
+                               prefix='.%s.' % os.path.basename(path))
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            json.dump({'version': SNAPSHOT_VERSION,
+                       'time': time.time(),
+                       'lsas': lsas}, f, separators=(',', ':'))
+            size = f.tell()
+            f.flush()
+            os.fsync(f.fileno())
+        os.rename(tmp, path)
+    except:
+        os.unlink(tmp)
+        raise
+    log.debug('Saved a snapshot of %d LSAs (%d bytes) to %s in %.3fs',
+              len(lsas), size, path, time.time() - start)
+    return size
+
+
+def load(path):
+    """
+    Read a snapshot
+    :param path: the snapshot to load
+    :return: the descriptions of the LSAs of the snapshot, None if it
+             could not be loaded
+    """
+    try:
+        with open(path, 'rb') as f:
+            state = json.load(f)
+    except IOError as e:
+        log.info('No LSDB snapshot to load from %s: %s', path, e)
+        return None
+    except ValueError as e:
+        log.warning('Cannot load the LSDB snapshot %s: %s', path, e)
+        return None
+    if not isinstance(state, dict) or \
+            state.get('version') != SNAPSHOT_VERSION:
+        log.warning('Ignoring the LSDB snapshot %s, its version is %s',
+                    path, state.get('version')
+                    if isinstance(state, dict) else None)
+        return None
+    lsas = [str(lsa) for lsa in state.get('lsas', ())]
+    log.info('Loaded %d LSAs from the snapshot %s, taken %.1fs ago',
+             len(lsas), path, time.time() - state.get('time', 0))
+    return lsas
@@ -0,0 +1,51 @@
+import json
+import pytest
+from ConfigParser import DEFAULTSECT
+from itertools import product
+
+from fibbingnode import CFG
+from fibbingnode.southbound.lsdb import LSDB
+
+
+def pytest_configure(config):
+    config.addinivalue_line('markers', 'incremental: the test checks the '
+                            'incremental graph updates, skipped without them')
+
+
+@pytest.fixture(scope="function",
+                params=list(product(['0', '1'], repeat=2)),
+                ids=lambda p: 'incremental%s-integer_ids%s' % p)
+def lsdb_options(request):
+    """The settings of the lsdb fixture, test modules can override them"""
+    incremental, integer_ids = request.param
+    return {'incremental_graph': incremental,
+            'integer_router_ids': integer_ids}
+
+
+@pytest.fixture(scope="function")
+def lsdb(request, tmpdir, lsdb_options):
+    if request.node.get_closest_marker('incremental') and \
+            lsdb_options.get('incremental_graph') != '1':
+        pytest.skip('needs the incremental graph updates')
+    private_ips = str(tmpdir.join('private_ips.json'))
+    with open(private_ips, 'w') as f:
+        json.dump({"10.0.0.0/30": {"1.0.0.1": "10.0.0.1/30",
+                                   "1.0.0.2": "10.0.0.2/30"}}, f)
+    options = {'private_ips': private_ips,
+               # The tests reload the private addresses themselves
+               'private_ips_reload_interval': '0'}
+    options.update(lsdb_options)
+    old = {k: CFG.get(DEFAULTSECT, k) for k in options}
+    for k, v in options.iteritems():
+        CFG.set(DEFAULTSECT, k, v)
+    db = LSDB()
+
+    def __teardown():
+        for l in db.listener.values():
+            l.stop()
+        db.listener.clear()
+        db.stop()
+        for k, v in old.iteritems():
+            CFG.set(DEFAULTSECT, k, v)
+    request.addfinalizer(__teardown)
+    return db
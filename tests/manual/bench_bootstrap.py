@@ -0,0 +1,133 @@
+"""
+Compare pushing the whole graph to a new northbound listener in a single
+bootstrap_graph call, and streaming it in chunks: peak memory, bootstrap
+time, largest message and longest wait for the graph lock.
+Usage: python bench_bootstrap.py [router_count] [prefix_count] [chunk_size]
+"""
+import gc
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from ConfigParser import DEFAULTSECT
+from threading import Thread
+
+from fibbingnode import CFG
+from fibbingnode.southbound.dispatch import ListenerDispatcher
+from fibbingnode.southbound.lsdb import LSDB
+from fibbingnode.southbound.replay import StubListener, synthetic_log
+from bench_lsdb_memory import rss
+
+
+def peak_rss():
+    """Return the peak resident set size of this process, in bytes"""
+    with open('/proc/self/status', 'r') as f:
+        for line in f:
+            if line.startswith('VmHWM:'):
+                return int(line.split()[1]) * 1024
+
+
+class JSONListener(StubListener):
+    """Serialize every call as an RPC would, and rebuild the graph"""
+
+    def __init__(self):
+        super(JSONListener, self).__init__()
+        self.edges = self.nodes = 0
+        self.largest = 0
+
+    def _receive(self, *args):
+        msg = json.dumps(args)
+        self.largest = max(self.largest, len(msg))
+        return json.loads(msg)
+
+    def bootstrap_graph(self, graph, node_properties):
+        graph, node_properties = self._receive(graph, node_properties)
+        self.edges, self.nodes = len(graph), len(node_properties)
+
+    def bootstrap_edges(self, edges):
+        self.edges += len(self._receive(edges)[0])
+
+    def bootstrap_nodes(self, node_properties):
+        self.nodes += len(self._receive(node_properties)[0])
+
+    def bootstrap_begin(self):
+        pass
+
+    def bootstrap_end(self):
+        pass
+
+
+def measure(router_count, prefix_count):
+    """Print the measurements as JSON, with the chunk size set in the CFG"""
+    lsdb = LSDB()
+    for ts, line in synthetic_log(router_count, prefix_count):
+        lsdb.add_lsa(lsdb.parse_lsa(line.split('|')[1]))
+    lsdb.graph = lsdb.build_graph()
+    listener = JSONListener()
+    dispatcher = ListenerDispatcher(listener, started=False)
+    lsdb.listener[listener] = dispatcher
+    waits = [0]
+
+    def probe():
+        # How long would the processing thread wait for the graph lock
+        while not done:
+            start = time.time()
+            with lsdb.graph_lock:
+                waits[0] = max(waits[0], time.time() - start)
+            time.sleep(.001)
+    done = False
+    prober = Thread(target=probe)
+    prober.start()
+    time.sleep(.1)
+    gc.collect()
+    before = rss()
+    start = time.time()
+    with lsdb.graph_lock:
+        lsdb.bootstrap(dispatcher, versioned=False)
+    dispatcher.wait_idle()
+    elapsed = time.time() - start
+    done = True
+    prober.join()
+    dispatcher.stop()
+    lsdb.listener.clear()
+    lsdb.stop()
+    lsdb.processing_thread.join()
+    print(json.dumps({'peak': peak_rss() - before,
+                      'time': elapsed,
+                      'largest': listener.largest,
+                      'lock_wait': waits[0],
+                      'edges': listener.edges,
+                      'nodes': listener.nodes}))
+
+
+def main(router_count=5000, prefix_count=50000, chunk_size=1000):
+    fd, private_ips = tempfile.mkstemp(suffix='.json')
+    os.write(fd, '{}')
+    os.close(fd)
+    try:
+        for size in (0, chunk_size):
+            # One process per mode, for unbiased memory measurements
+            out = subprocess.check_output(
+                [sys.executable, __file__, 'measure',
+                 str(router_count), str(prefix_count), str(size),
+                 private_ips])
+            r = json.loads(out.splitlines()[-1])
+            print('%s: %d edges, %d nodes in %.3fs, peak memory +%.1fMB, '
+                  'largest message %.1fKB, graph lock wait %.1fms' %
+                  ('chunks of %d' % size if size else 'single call',
+                   r['edges'], r['nodes'], r['time'], r['peak'] / 1e6,
+                   r['largest'] / 1e3, r['lock_wait'] * 1e3))
+    finally:
+        os.unlink(private_ips)
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['measure']:
+        router_count, prefix_count, chunk_size, private_ips = sys.argv[2:6]
+        CFG.set(DEFAULTSECT, 'bootstrap_chunk_size', chunk_size)
+        CFG.set(DEFAULTSECT, 'private_ips', private_ips)
+        CFG.set(DEFAULTSECT, 'draw_graph', '0')
+        measure(int(router_count), int(prefix_count))
+    else:
+        main(*[int(x) for x in sys.argv[1:4]])
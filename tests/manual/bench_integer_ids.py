@@ -0,0 +1,71 @@
+"""
+Compare the LSDB with string and integer router ids: memory used by a large
+synthetic LSDB and its graph, and the time to rebuild that graph.
+Usage: python bench_integer_ids.py [router_count] [prefix_count]
+"""
+import gc
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from ConfigParser import DEFAULTSECT
+
+from fibbingnode import CFG
+from fibbingnode.southbound.lsdb import LSDB
+from fibbingnode.southbound.replay import synthetic_log
+from bench_lsdb_memory import rss
+
+
+def measure(router_count, prefix_count):
+    """Print the measurements as JSON, with the mode set in the CFG"""
+    lines = [line.split('|')[1] for ts, line
+             in synthetic_log(router_count, prefix_count)]
+    gc.collect()
+    before = rss()
+    lsdb = LSDB()
+    for line in lines:
+        lsdb.add_lsa(lsdb.parse_lsa(line))
+    del lines
+    gc.collect()
+    lsdb_size = rss() - before
+    rebuilds = []
+    for _ in xrange(3):
+        start = time.time()
+        lsdb.graph = lsdb.build_graph()
+        rebuilds.append(time.time() - start)
+    gc.collect()
+    lsdb.stop()
+    print(json.dumps({'lsdb': lsdb_size,
+                      'graph': rss() - before - lsdb_size,
+                      'rebuild': min(rebuilds)}))
+
+
+def main(router_count=10000, prefix_count=100000):
+    fd, private_ips = tempfile.mkstemp(suffix='.json')
+    os.write(fd, '{}')
+    os.close(fd)
+    try:
+        for integer_ids in ('0', '1'):
+            # One process per mode, for unbiased memory measurements
+            out = subprocess.check_output(
+                [sys.executable, __file__, 'measure',
+                 str(router_count), str(prefix_count), integer_ids,
+                 private_ips])
+            r = json.loads(out.splitlines()[-1])
+            print('%s router ids: LSDB %.1fMB, graph %.1fMB, rebuild %.3fs' %
+                  ('integer' if integer_ids == '1' else 'string',
+                   r['lsdb'] / 1e6, r['graph'] / 1e6, r['rebuild']))
+    finally:
+        os.unlink(private_ips)
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['measure']:
+        router_count, prefix_count, integer_ids, private_ips = sys.argv[2:6]
+        CFG.set(DEFAULTSECT, 'integer_router_ids', integer_ids)
+        CFG.set(DEFAULTSECT, 'private_ips', private_ips)
+        CFG.set(DEFAULTSECT, 'draw_graph', '0')
+        measure(int(router_count), int(prefix_count))
+    else:
+        main(*[int(x) for x in sys.argv[1:3]])
@@ -0,0 +1,30 @@
+"""
+Measure the LSA parsing throughput over a recorded LSDB log (as produced by
+ospfd --log_lsdb), or over a synthetic one if no log is given.
+Usage: python bench_lsa_parser.py [lsdb.log]
+"""
+import sys
+import time
+
+from fibbingnode.southbound.lsdb import PARSER, SEP_ACTION, BEGIN, COMMIT
+from bench_lsdb_memory import synthetic_lsdb
+
+
+def main(filename=None):
+    if filename:
+        with open(filename, 'r') as f:
+            lines = [line.rstrip('\n') for line in f]
+    else:
+        lines = list(synthetic_lsdb(100000, 1000))
+    infos = [lsa_info for action, lsa_info in
+             (line.split(SEP_ACTION) for line in lines)
+             if action not in (BEGIN, COMMIT)]
+    start = time.time()
+    for lsa_info in infos:
+        PARSER.parse(lsa_info)
+    elapsed = time.time() - start
+    print('Parsed %d LSAs in %.3fs: %.0f LSA/s' %
+          (len(infos), elapsed, len(infos) / elapsed))
+
+if __name__ == '__main__':
+    main(*sys.argv[1:2])
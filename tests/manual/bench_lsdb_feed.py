@@ -0,0 +1,35 @@
+"""
+Compare the decoding of the text and binary LSDB feeds, over a recorded
+text LSDB log (converted to binary records) or over a synthetic one.
+Usage: python bench_lsdb_feed.py [lsdb.log]
+"""
+import sys
+import time
+
+from fibbingnode.southbound.binfeed import text_to_record, decode_record,\
+    LENGTH
+from fibbingnode.southbound.lsdb import LSDB
+from fibbingnode.southbound.replay import read_capture, synthetic_log
+
+
+def bench(name, decode, lines, size):
+    start = time.time()
+    for line in lines:
+        decode(line)
+    elapsed = time.time() - start
+    print('%s: %d lines (%.1f bytes/line) in %.3fs: %.0f lines/s' %
+          (name, len(lines), float(size) / len(lines), elapsed,
+           len(lines) / elapsed))
+
+
+def main(filename=None):
+    lines = [line for ts, line in (read_capture(filename) if filename
+                                   else synthetic_log(1000, 99000))]
+    records = [text_to_record(line)[LENGTH.size:] for line in lines]
+    bench('text', LSDB.decode_text_line, lines,
+          sum(len(line) + 1 for line in lines))
+    bench('binary', decode_record, records,
+          sum(len(record) + LENGTH.size for record in records))
+
+if __name__ == '__main__':
+    main(*sys.argv[1:2])
@@ -0,0 +1,46 @@
+"""
+Load a synthetic LSDB in memory and report its resident size per LSA.
+Usage: python bench_lsdb_memory.py [lsa_count] [router_count]
+"""
+import gc
+import os
+import sys
+
+from fibbingnode.southbound.lsdb import PARSER, SEP_ACTION
+from fibbingnode.southbound.replay import synthetic_log
+
+
+def rss():
+    """Return the resident set size of this process, in bytes"""
+    with open('/proc/self/statm', 'r') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+
+def synthetic_lsdb(lsa_count, router_count):
+    """Generate the LSDB log lines of router_count routers and
+    lsa_count - router_count external prefixes"""
+    return (line for ts, line in synthetic_log(router_count,
+                                               lsa_count - router_count))
+
+
+def load(lines):
+    db = {}
+    for line in lines:
+        action, lsa_info = line.split(SEP_ACTION)
+        lsa = PARSER.parse(lsa_info)
+        db[lsa.TYPE, lsa.key()] = lsa
+    return db
+
+
+def main(lsa_count=100000, router_count=1000):
+    lines = list(synthetic_lsdb(lsa_count, router_count))
+    gc.collect()
+    before = rss()
+    db = load(lines)
+    gc.collect()
+    used = rss() - before
+    print('%d LSAs (%d routers): %d bytes, %.1f bytes/LSA' %
+          (len(db), router_count, used, float(used) / len(db)))
+
+if __name__ == '__main__':
+    main(*[int(x) for x in sys.argv[1:3]])
@@ -0,0 +1,61 @@
+"""
+Replay a recorded LSDB log (as produced by ospfd --log_lsdb) through the
+legacy byte-per-byte FIFO reader and through the buffered one, and report
+the throughput of both.
+Usage: python bench_lsdb_reader.py <lsdb.log> [chunk_size]
+"""
+import os
+import sys
+import time
+
+from fibbingnode.misc.utils import read_lines
+
+
+def legacy_readline(f):
+    """The reader used by RootRouter.parse_lsdblog before read_lines"""
+    buf = ''
+    data = True
+    while data:
+        data = f.read(1)
+        buf += data
+        if data == '\n':
+            yield buf[:-1]
+            buf = ''
+
+
+def bench(name, filename, reader):
+    start = time.time()
+    count = 0
+    for _ in reader(filename):
+        count += 1
+    elapsed = time.time() - start
+    print('%-10s %10d lines in %8.3fs: %12.0f lines/s' %
+          (name, count, elapsed, count / elapsed if elapsed else 0))
+    return count
+
+
+def main(filename, chunk_size=65536):
+    def legacy(fname):
+        with open(fname, 'r') as f:
+            for line in legacy_readline(f):
+                yield line
+
+    def buffered(fname):
+        fd = os.open(fname, os.O_RDONLY)
+        try:
+            for line in read_lines(fd, chunk_size):
+                yield line
+        finally:
+            os.close(fd)
+
+    print('Replaying %s (%d bytes)' % (filename, os.path.getsize(filename)))
+    old = bench('legacy', filename, legacy)
+    new = bench('buffered', filename, buffered)
+    if old != new:
+        print('Line count mismatch: %d vs %d!' % (old, new))
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+    main(sys.argv[1], *[int(x) for x in sys.argv[2:3]])
@@ -0,0 +1,50 @@
+"""
+Compare the time to the first graph of a restarted LSDB, when it has to
+process the whole feed again or when it loads a snapshot of it.
+Usage: python bench_lsdb_snapshot.py [router_count] [prefix_count]
+"""
+import os
+import sys
+import tempfile
+import time
+from ConfigParser import DEFAULTSECT
+
+from fibbingnode import CFG
+from fibbingnode.southbound.lsdb import LSDB
+from fibbingnode.southbound.replay import Replay, synthetic_log
+
+
+def main(router_count=1000, prefix_count=10000):
+    fd, path = tempfile.mkstemp(suffix='.snapshot')
+    os.close(fd)
+    os.unlink(path)
+    try:
+        db = LSDB()
+        replay = Replay(db)
+        report = replay.run(synthetic_log(router_count, prefix_count))
+        replay.dispatcher.stop()
+        db.listener.clear()
+        print('Feed: %d lines, first graph after %.0fms' %
+              (report['lines'], report['elapsed']))
+        start = time.time()
+        CFG.set(DEFAULTSECT, 'lsdb_snapshot', path)
+        db.snapshot_path = path
+        db.save_snapshot()
+        print('Snapshot: %d bytes, saved in %.0fms' %
+              (os.path.getsize(path), (time.time() - start) * 1000))
+        db.stop()
+        start = time.time()
+        restarted = LSDB()
+        print('Warm restart: %d nodes, %d edges after %.0fms' %
+              (restarted.graph.number_of_nodes(),
+               restarted.graph.number_of_edges(),
+               (time.time() - start) * 1000))
+        restarted.snapshot_path = ''
+        restarted.stop()
+    finally:
+        CFG.set(DEFAULTSECT, 'lsdb_snapshot', '')
+        if os.path.exists(path):
+            os.unlink(path)
+
+if __name__ == '__main__':
+    main(*[int(x) for x in sys.argv[1:3]])
@@ -0,0 +1,105 @@
+"""
+Compare the PrefixTrie with a dict scanned for the longest-prefix-match and
+covered-by queries, for growing numbers of random prefixes.
+Usage: python bench_prefix_trie.py [max_prefix_count]
+"""
+import gc
+import random
+import sys
+import time
+
+from fibbingnode.misc.prefix_trie import PrefixTrie, parse_prefix
+from bench_lsdb_memory import rss
+
+QUERIES = 1000
+# Scanning a dict is only timed on that many queries
+SCANS = 10
+
+
+def random_prefixes(count, rnd):
+    """:return: count distinct 'address/prefixlen' strings, /8 to /32"""
+    prefixes = set()
+    while len(prefixes) < count:
+        length = rnd.choice((16, 20, 22, 24, 24, 24, 28, 32, 8))
+        bits = rnd.getrandbits(length) << (32 - length)
+        prefixes.add('%d.%d.%d.%d/%d' % (bits >> 24, bits >> 16 & 255,
+                                         bits >> 8 & 255, bits & 255, length))
+    return list(prefixes)
+
+
+def scan_longest_match(table, address):
+    _, bits, _ = parse_prefix(address)
+    best = None
+    for prefix in table:
+        _, pbits, length = parse_prefix(prefix)
+        if not (pbits ^ bits) >> (32 - length) and \
+                (best is None or length > best[1]):
+            best = prefix, length
+    return best
+
+
+def scan_covered_by(table, prefix):
+    _, bits, length = parse_prefix(prefix)
+    return [p for p in table
+            if parse_prefix(p)[2] >= length and
+            not (parse_prefix(p)[1] ^ bits) >> (32 - length)]
+
+
+def timed(f, args):
+    start = time.time()
+    for a in args:
+        f(a)
+    return (time.time() - start) / len(args)
+
+
+def measure(count, rnd):
+    prefixes = random_prefixes(count, rnd)
+    addresses = ['%d.%d.%d.%d' % tuple(rnd.randint(0, 255) for _ in xrange(4))
+                 for _ in xrange(QUERIES)]
+    gc.collect()
+    before = rss()
+    start = time.time()
+    trie = PrefixTrie()
+    for p in prefixes:
+        trie[p] = p
+    insert = (time.time() - start) / count
+    gc.collect()
+    size = rss() - before
+    table = dict.fromkeys(prefixes)
+
+    def lpm(a):
+        try:
+            trie.longest_match(a)
+        except KeyError:
+            pass
+    exact = timed(trie.__getitem__, prefixes[:QUERIES])
+    trie_lpm = timed(lpm, addresses)
+    trie_covered = timed(lambda p: list(trie.covered_by(p)),
+                         [p.split('.')[0] + '.0.0.0/12' for p in
+                          prefixes[:QUERIES]])
+    scan_lpm = timed(lambda a: scan_longest_match(table, a),
+                     addresses[:SCANS])
+    scan_covered = timed(lambda p: scan_covered_by(table, p),
+                         [p.split('.')[0] + '.0.0.0/12' for p in
+                          prefixes[:SCANS]])
+    start = time.time()
+    for p in prefixes:
+        del trie[p]
+    delete = (time.time() - start) / count
+    us = 1e6
+    print('%8d prefixes: %.0fB/prefix, insert %.1fus, delete %.1fus, exact '
+          '%.1fus, LPM %.1fus (scan %.0fus), covered-by %.1fus (scan %.0fus)'
+          % (count, float(size) / count, insert * us, delete * us,
+             exact * us, trie_lpm * us, scan_lpm * us, trie_covered * us,
+             scan_covered * us))
+
+
+def main(max_count=1000000):
+    rnd = random.Random(1)
+    count = 1000
+    while count <= max_count:
+        measure(count, rnd)
+        count *= 10
+
+if __name__ == '__main__':
+    main(*[int(x) for x in sys.argv[1:2]])
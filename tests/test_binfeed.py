@@ -0,0 +1,89 @@
+import os
+import pytest
+from threading import Thread
+
+from fibbingnode.southbound.binfeed import (text_to_record, decode_record,
+                                            read_records, record_key,
+                                            record_removes, LENGTH)
+from fibbingnode.southbound.lsaqueue import LSAQueue, COLLAPSE
+from fibbingnode.southbound.lsdb import LSDB, SEP_ACTION
+from fibbingnode.southbound.replay import synthetic_log
+
+
+LINES = [
+    'BEGIN|',
+    'ADD|rid:1.0.0.1;link_id:1.0.0.1;lsa_type:1; '
+    'link_type:1;link_id:1.0.0.2;link_data:10.0.0.1;link_metric:10; '
+    'link_type:2;link_id:10.0.1.1;link_data:10.0.1.2;link_metric:5; '
+    'link_type:3;link_id:1.0.0.1;link_data:255.255.255.255;link_metric:0;',
+    'ADD|rid:1.0.0.3;link_id:10.0.1.1;lsa_type:2;link_mask:255.255.255.0; '
+    'rid:1.0.0.1; rid:1.0.0.3;',
+    'REM|rid:1.0.0.1;link_id:100.0.0.0;lsa_type:5;link_mask:255.255.255.0; '
+    'link_metric:3;link_metrictype:1;fwd_addr:0.0.0.0;',
+    'ADD|rid:1.0.0.1;link_id:0.0.0.0;lsa_type:3;link_mask:0.0.0.0;',
+    'COMMIT|',
+]
+
+
+def _record(line):
+    # Strip the length prefix
+    return text_to_record(line)[LENGTH.size:]
+
+
+@pytest.mark.parametrize('line', LINES + [line for ts, line
+                                          in synthetic_log(3, 5, updates=4)])
+def test_same_as_text(line):
+    text_action, text_lsa = LSDB.decode_text_line(line)
+    action, lsa = decode_record(_record(line))
+    assert action == text_action == line.split(SEP_ACTION)[0]
+    assert type(lsa) == type(text_lsa)
+    if lsa is not None:
+        assert lsa.key() == text_lsa.key()
+        # UnusedLSA have no key, nor content
+        if lsa.key() is not None:
+            assert str(lsa) == str(text_lsa)
+
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 3, 7, 4096])
+def test_split_across_chunks(chunk_size):
+    r, w = os.pipe()
+    os.write(w, ''.join(text_to_record(line) for line in LINES) + '\x00')
+    os.close(w)
+    try:
+        assert list(read_records(r, chunk_size)) == map(_record, LINES)
+    finally:
+        os.close(r)
+
+
+def test_record_key():
+    keys = [record_key(_record(line)) for line in LINES]
+    text_keys = [LSDB.text_line_key(line) for line in LINES]
+    assert [k is None for k in keys] == [k is None for k in text_keys]
+    assert keys[1] != keys[3]
+    assert record_key('') is None
+
+
+def test_record_key_mask():
+    # AS-External LSAs of the same router and address, but other prefixes
+    lines = ['ADD|rid:1.0.0.1;link_id:10.0.0.0;lsa_type:5;'
+             'link_mask:255.0.0.0; link_metric:1;fwd_addr:0.0.0.0;',
+             'ADD|rid:1.0.0.1;link_id:10.0.0.0;lsa_type:5;'
+             'link_mask:255.255.0.0; link_metric:1;fwd_addr:0.0.0.0;']
+    records = map(_record, lines)
+    assert record_key(records[0]) != record_key(records[1])
+    assert LSDB.text_line_key(lines[0]) != LSDB.text_line_key(lines[1])
+    q = LSAQueue(1, COLLAPSE, record_key)
+    q.put((0, records[0]))
+    # The queue is full, but the second prefix must not replace the first
+    t = Thread(target=q.put, args=((1, records[1]),))
+    t.start()
+    assert q.get() == (0, records[0])
+    t.join(1)
+    assert q.get(timeout=1) == (1, records[1])
+    assert q.stats()['collapsed'] == 0
+
+
+def test_record_removes():
+    removes = [record_removes(_record(line)) for line in LINES]
+    assert removes == [LSDB.text_line_removes(line) for line in LINES]
+    assert any(removes)
@@ -0,0 +1,59 @@
+import pytest
+
+from ConfigParser import DEFAULTSECT
+
+from fibbingnode import CFG
+from fibbingnode.misc.utils import BoundedCache, parse_address, prefix_of,\
+    size_address_caches, ADDRESS_CACHES
+from fibbingnode.southbound.lsdb import LSDB
+
+
+def test_memoize_and_bound():
+    calls = []
+
+    def square(x):
+        calls.append(x)
+        return x * x
+
+    cache = BoundedCache(square, maxsize=2)
+    assert [cache(1), cache(2), cache(1)] == [1, 4, 1]
+    assert calls == [1, 2]
+    assert (cache.hits, cache.misses) == (1, 2)
+    cache(3)  # Full, start over
+    assert len(cache.cache) == 1
+    assert cache(1) == 1
+    assert calls == [1, 2, 3, 1]
+    assert cache.hit_rate() == 1 / 5.
+
+
+def test_exceptions_are_not_cached():
+    def fail(x):
+        raise ValueError(x)
+
+    cache = BoundedCache(fail)
+    for _ in range(2):
+        with pytest.raises(ValueError):
+            cache(1)
+    assert cache.misses == 2 and not cache.cache
+
+
+def test_address_caches():
+    assert parse_address('10.0.0.0/8') is None
+    assert parse_address('10.0.0.1') is parse_address('10.0.0.1')
+    assert prefix_of('10.0.0.1', '255.0.0.0') == '10.0.0.1/8'
+
+
+def test_address_caches_sized_by_lsdb(lsdb):
+    size = CFG.get(DEFAULTSECT, 'address_cache_size')
+    assert all(c.maxsize == int(size) for c in ADDRESS_CACHES.itervalues())
+    CFG.set(DEFAULTSECT, 'address_cache_size', '2')
+    try:
+        LSDB().stop()
+        assert all(c.maxsize == 2 for c in ADDRESS_CACHES.itervalues())
+        parse_address('10.0.0.1')
+        parse_address('10.0.0.2')
+        parse_address('10.0.0.3')
+        assert len(parse_address.cache) <= 2
+    finally:
+        CFG.set(DEFAULTSECT, 'address_cache_size', size)
+        size_address_caches(int(size))
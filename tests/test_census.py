@@ -0,0 +1,81 @@
+from collections import OrderedDict
+from threading import Thread
+
+from fibbingnode.misc.prefix_trie import PrefixTrie
+from fibbingnode.southbound import census
+from test_lsdb import topology, ext_lsa, updated_graph
+
+
+def test_deep_sizeof():
+    shared = 'x' * 1000
+    seen = set()
+    first = census.deep_sizeof([shared, (shared, 1)], seen)
+    assert first > 1000
+    # Shared objects are counted once, the other ones are not traversed
+    assert census.deep_sizeof({'a': shared}, seen) < 1000
+    assert census.deep_sizeof(shared, seen) == 0
+    assert census.deep_sizeof(Stub(shared), set([id(shared)])) < 1000
+
+
+class Stub(object):
+    def __init__(self, value):
+        self.value = value
+
+
+class StubPoint(Stub):
+    pass
+
+
+class StubRoute(object):
+    def __init__(self, *points):
+        self.attraction_points = OrderedDict((p.value, p) for p in points)
+
+
+class StubManager(object):
+    def __init__(self):
+        self.nodes = {}
+        self.root = None
+        self.routes = PrefixTrie()
+        self.route_mappings = {}
+
+
+def test_census(lsdb):
+    lsas = topology()
+    for lsa in lsas:
+        lsdb.add_lsa(lsdb.parse_lsa(lsa))
+    lsdb.graph = updated_graph(lsdb)
+    lsdb.prefix_table.update()
+    mngr = StubManager()
+    mngr.routes['8.8.8.0/24'] = StubRoute(StubPoint('10.0.0.1'),
+                                          StubPoint('10.0.0.2'))
+    first = census.take(lsdb, mngr)
+    c = first.categories
+    assert c['RouterLSA'][0] == 6
+    assert c['NetworkLSA'][0] == 1
+    assert c['ASExtLSA'][0] == 3
+    assert c['graph.edges'][0] == lsdb.graph.number_of_edges()
+    assert c['prefix_table'][0] == 3
+    assert c['AttractionPoint'][0] == 2
+    assert c['FibbingRoute'][0] == 1
+    assert all(size > 0 for _, size in c.itervalues())
+    assert first.total() == sum(size for _, size in c.itervalues())
+    assert len(first.report()) == len(c) + 1
+    lsdb.add_lsa(lsdb.parse_lsa(ext_lsa('1.0.0.2', '7.7.7.0/24')))
+    changes, sites = census.take(lsdb).diff(first)
+    assert changes['ASExtLSA'][0] == 1
+    assert changes['ASExtLSA'][1] > 0
+    assert changes['FibbingRoute'] == (-1, -c['FibbingRoute'][1])
+    assert changes['graph.nodes'] == (0, 0)
+    assert sites == [] or census.is_tracing()
+
+
+def test_census_waits_for_processing(lsdb):
+    lsdb.add_lsa(lsdb.parse_lsa(ext_lsa('1.0.0.2', '7.7.7.0/24')))
+    taken = []
+    with lsdb.lsdb_lock:
+        t = Thread(target=lambda: taken.append(census.take(lsdb)))
+        t.start()
+        t.join(.2)
+        assert not taken
+    t.join()
+    assert taken[0].categories['ASExtLSA'][0] == 1
@@ -0,0 +1,162 @@
+import time
+from threading import Event
+
+from fibbingnode.southbound import dispatch
+from fibbingnode.southbound.dispatch import ListenerDispatcher
+from fibbingnode.southbound.interface import ShapeshifterProxy
+from fibbingnode.southbound.replay import StubListener
+
+
+class SlowListener(StubListener):
+    """A listener recording its calls, blocked until released"""
+
+    def __init__(self):
+        super(SlowListener, self).__init__()
+        self.calls = []
+        self.release = Event()
+
+    def add_edge(self, source, destination, properties=None):
+        self.release.wait()
+        self.calls.append(('add', source, destination, properties))
+
+    def remove_edge(self, source, destination):
+        self.release.wait()
+        self.calls.append(('remove', source, destination))
+
+    def update_node_properties(self, **properties):
+        self.release.wait()
+        self.calls.append(('nodes', properties))
+
+    # Recorded as the edges they translate to
+    update_prefixes = ShapeshifterProxy.update_prefixes.im_func
+
+    def commit(self):
+        self.release.wait()
+        self.calls.append(('commit',))
+
+
+def test_coalesced_while_blocked():
+    listener = SlowListener()
+    d = ListenerDispatcher(listener)
+    try:
+        # The sender thread is blocked on the first update
+        d.push([('a', 'b', {'metric': 1})], [], {})
+        time.sleep(.05)
+        start = time.time()
+        for i in xrange(100):
+            d.push([('a', 'c', {'metric': i})], [], {'a': {'n': i}})
+        d.push([('b', 'c', {'metric': 1})], [], {})
+        d.push([], [('b', 'c')], {})
+        d.push([], [('c', 'd')], {})
+        d.push([('c', 'd', {'metric': 2})], [], {})
+        # Pushing does not wait for the listener
+        assert time.time() - start < .5
+        assert d.stats()['pending'] == 104
+        listener.release.set()
+        assert d.wait_idle(5)
+    finally:
+        d.stop()
+    assert listener.calls == [
+        ('add', 'a', 'b', {'metric': 1}), ('commit',),
+        ('add', 'a', 'c', {'metric': 99}),
+        ('remove', 'c', 'd'), ('add', 'c', 'd', {'metric': 2}),
+        ('remove', 'b', 'c'),
+        ('nodes', {'a': {'n': 99}}), ('commit',)]
+    stats = d.stats()
+    assert stats['sent'] == 2
+    assert stats['coalesced'] == 103
+    assert stats['pending'] == 0
+    assert stats['max_lag'] > 0
+
+
+def test_prefixes_coalesced():
+    listener = SlowListener()
+    d = ListenerDispatcher(listener)
+    try:
+        d.push([], [], {}, prefixes=([('a', 'p', {'metric': 1})], [],
+                                     {'p': {'prefix': True}}))
+        time.sleep(.05)
+        d.push([], [], {}, prefixes=([('a', 'p', {'metric': 2})], [], {}))
+        d.push([], [], {}, prefixes=([], [('a', 'p')], {}))
+        d.push([], [], {}, prefixes=([('a', 'p', {'metric': 3})], [], {}))
+        d.push([], [], {}, prefixes=([('b', 'q', {'metric': 1})], [],
+                                     {'q': {'prefix': True}}))
+        d.push([], [], {}, prefixes=([], [('b', 'q')], {}))
+        listener.release.set()
+        assert d.wait_idle(5)
+    finally:
+        d.stop()
+    # Sent through the default update_prefixes, removals first
+    assert listener.calls == [
+        ('add', 'a', 'p', {'metric': 1}), ('nodes', {'p': {'prefix': True}}),
+        ('commit',),
+        ('remove', 'a', 'p'), ('remove', 'b', 'q'),
+        ('add', 'a', 'p', {'metric': 3}), ('nodes', {'q': {'prefix': True}}),
+        ('commit',)]
+    assert d.stats()['elided'] == 3
+
+
+def test_bootstrap_supersedes_pending():
+    listener = StubListener()
+    d = ListenerDispatcher(listener)
+    try:
+        d.bootstrap([('a', 'b', {})], {'a': {}})
+        assert d.wait_idle(5)
+        assert listener.commits == 0
+    finally:
+        d.stop()
+
+
+class FlakyListener(StubListener):
+    """A listener failing to add its first edges"""
+
+    def __init__(self, failures=1):
+        super(FlakyListener, self).__init__()
+        self.failures = failures
+        self.edges = {}
+        self.bootstraps = 0
+
+    def add_edge(self, source, destination, properties=None):
+        if self.failures:
+            self.failures -= 1
+            raise IOError('Connection reset')
+        self.edges[source, destination] = properties
+
+    def remove_edge(self, source, destination):
+        self.edges.pop((source, destination), None)
+
+    def bootstrap_graph(self, graph, node_properties, version=None):
+        self.bootstraps += 1
+        self.edges = {(u, v): d for u, v, d in graph}
+
+
+def test_failed_batch_requeued(monkeypatch):
+    monkeypatch.setattr(dispatch, 'RETRY_DELAY', .05)
+    listener = FlakyListener()
+    d = ListenerDispatcher(listener)
+    try:
+        d.push([('a', 'b', {'metric': 1}), ('b', 'c', {'metric': 1})], [], {})
+        time.sleep(.01)
+        # Pushed while the failed batch waits to be sent again
+        d.push([('a', 'b', {'metric': 2})], [('b', 'c')], {})
+        assert d.wait_idle(5)
+    finally:
+        assert d.stop(1)
+    assert listener.edges == {('a', 'b'): {'metric': 2}}
+    assert d.stats()['failed'] == 1
+
+
+def test_failed_listener_resynced(monkeypatch):
+    monkeypatch.setattr(dispatch, 'RETRY_DELAY', .05)
+    listener = FlakyListener()
+    graph = [('a', 'b', {'metric': 3})]
+    d = ListenerDispatcher(listener,
+                           resync=lambda l: l.bootstrap(graph, {}))
+    try:
+        d.push([('a', 'b', {'metric': 1})], [], {})
+        assert d.wait_idle(5)
+    finally:
+        assert d.stop(1)
+    # The whole graph was pushed again
+    assert listener.bootstraps == 1
+    assert listener.edges == {('a', 'b'): {'metric': 3}}
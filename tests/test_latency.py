@@ -0,0 +1,59 @@
+import json
+from ConfigParser import DEFAULTSECT
+
+from fibbingnode import CFG
+from fibbingnode.southbound import latency
+from fibbingnode.southbound.lsdb import LSDB
+from fibbingnode.southbound.latency import LatencyHistogram
+
+
+def test_percentiles():
+    h = LatencyHistogram()
+    assert h.percentile(50) == 0
+    for i in xrange(1, 101):
+        h.record(i * 1e-3)
+    assert h.count == 100
+    assert h.max == .1
+    # The buckets are at most 19% wide
+    for p in (50, 90, 99):
+        assert p * 1e-3 <= h.percentile(p) <= p * 1e-3 * 1.19
+    assert h.percentile(100) == .1
+    h.record(0)
+    h.record(1e6)
+    assert h.to_dict()['buckets'][0] == (LatencyHistogram.upper_bound(0), 1)
+    assert h.max == 1e6
+    h.reset()
+    assert h.count == 0 and h.max == 0
+
+
+def test_dump(tmpdir):
+    latency.reset()
+    latency.enable()
+    latency.record(latency.PARSE, .002)
+    latency.enable(False)
+    latency.record(latency.PARSE, .002)
+    path = str(tmpdir.join('latency.json'))
+    latency.dump(path)
+    with open(path) as f:
+        report = json.load(f)
+    assert sorted(report) == sorted(latency.STAGES)
+    assert report[latency.PARSE]['count'] == 1
+    assert report[latency.DIFF]['count'] == 0
+    latency.reset()
+
+
+def test_enabled_when_lsdb_starts(lsdb):
+    parse = latency.STAGES[latency.PARSE]
+    latency.reset()
+    latency.record(latency.PARSE, .002)
+    assert parse.count == 0
+    old = CFG.get(DEFAULTSECT, 'latency_histograms')
+    CFG.set(DEFAULTSECT, 'latency_histograms', '1')
+    try:
+        LSDB().stop()
+    finally:
+        CFG.set(DEFAULTSECT, 'latency_histograms', old)
+    latency.record(latency.PARSE, .002)
+    assert parse.count == 1
+    latency.enable(False)
+    latency.reset()
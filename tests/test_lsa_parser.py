@@ -0,0 +1,50 @@
+import random
+
+from fibbingnode.southbound.lsdb import PARSER, LSAParser, RouterLSA,\
+    SEP_GROUP, SEP_INTER_FIELD
+from test_lsdb import topology
+
+
+def shuffled(lsa_info, rnd):
+    """:return: lsa_info with the fields of each group in a random order"""
+    groups = []
+    for group in lsa_info.split(SEP_GROUP):
+        fields = [f for f in group.split(SEP_INTER_FIELD) if f]
+        rnd.shuffle(fields)
+        if rnd.random() < .3:
+            fields.append('opaque_data:%d' % rnd.randint(0, 9))
+        groups.append(SEP_INTER_FIELD.join(fields) +
+                      (SEP_INTER_FIELD if rnd.random() < .8 else ''))
+    return (SEP_GROUP * rnd.randint(1, 2)).join(groups)
+
+
+def test_same_as_dict_parsing():
+    rnd = random.Random(3)
+    parser = LSAParser()
+    for _ in xrange(500):
+        lsa_info = rnd.choice(topology())
+        reordered = shuffled(lsa_info, rnd)
+        # The same fields as extract_lsa_properties gives
+        assert parser.fields(reordered) == LSAParser.dict_fields(reordered)
+        assert str(parser.parse(reordered)) == \
+            str(PARSER.parse(lsa_info))
+
+
+def test_links_reordered():
+    parser = LSAParser()
+    lsa = parser.parse('rid:1.0.0.1;link_id:1.0.0.1;lsa_type:1; '
+                       'link_type:1;link_id:1.0.0.2;link_data:10.0.0.1;'
+                       'link_metric:1; link_id:1.0.0.3;link_type:1;'
+                       'link_data:10.0.0.5;link_metric:2;')
+    assert isinstance(lsa, RouterLSA)
+    assert [(l.other_routerid, l.metric) for l in lsa.links] == [
+        ('1.0.0.2', '1'), ('1.0.0.3', '2')]
+
+
+def test_fallback():
+    parser = LSAParser()
+    # An empty field, and a link type that is not supported
+    lsa_info = ('rid:1.0.0.1;;link_id:1.0.0.1;lsa_type:1; link_type:9;'
+                'link_id:1.0.0.2;link_data:10.0.0.1;link_metric:1;')
+    assert parser.fields(lsa_info) == LSAParser.dict_fields(lsa_info)
+    assert parser.parse(lsa_info).links == ()
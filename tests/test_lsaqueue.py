@@ -0,0 +1,88 @@
+import time
+from Queue import Empty
+from threading import Thread
+
+import pytest
+
+from fibbingnode.southbound.lsaqueue import LSAQueue, BLOCK, COLLAPSE
+from fibbingnode.southbound.lsdb import LSDB
+
+
+def key(line):
+    return LSDB.text_line_key(line)
+
+
+def test_collapse():
+    q = LSAQueue(4, COLLAPSE, key)
+    q.put((1, 'BEGIN|'))
+    q.put((2, 'ADD|rid:1.0.0.1;link_id:1.0.0.1;lsa_type:1; a'))
+    q.put((3, 'ADD|rid:1.0.0.2;link_id:1.0.0.2;lsa_type:1; b'))
+    # Not collapsed while the queue is not full
+    q.put((4, 'REM|rid:1.0.0.2;link_id:1.0.0.2;lsa_type:1; c'))
+    assert q.stats()['collapsed'] == 0
+    # Full, the newest line of an LSA replaces the pending one in place
+    q.put((5, 'ADD|rid:1.0.0.1;link_id:1.0.0.1;lsa_type:1; d'))
+    q.put((6, 'ADD|rid:1.0.0.2;link_id:1.0.0.2;lsa_type:1; e'))
+    assert q.qsize() == 4
+    assert q.stats()['collapsed'] == 2
+    assert q.stats()['high_water'] == 4
+    assert [q.get() for _ in xrange(4)] == [
+        (1, 'BEGIN|'),
+        (2, 'ADD|rid:1.0.0.1;link_id:1.0.0.1;lsa_type:1; d'),
+        (3, 'ADD|rid:1.0.0.2;link_id:1.0.0.2;lsa_type:1; b'),
+        (4, 'ADD|rid:1.0.0.2;link_id:1.0.0.2;lsa_type:1; e')]
+    with pytest.raises(Empty):
+        q.get(timeout=.01)
+
+
+def test_no_collapse_across_transactions():
+    q = LSAQueue(3, COLLAPSE, key)
+    q.put((1, 'ADD|rid:1.0.0.1;link_id:1.0.0.1;lsa_type:1; a'))
+    q.put((2, 'COMMIT|'))
+    q.put((3, 'BEGIN|'))
+    # The pending line of that LSA belongs to the previous transaction
+    t = Thread(target=q.put,
+               args=((4, 'REM|rid:1.0.0.1;link_id:1.0.0.1;lsa_type:1; b'),))
+    t.start()
+    time.sleep(.05)
+    assert t.is_alive()
+    assert q.get() == (1, 'ADD|rid:1.0.0.1;link_id:1.0.0.1;lsa_type:1; a')
+    t.join(1)
+    assert not t.is_alive()
+    assert q.stats()['collapsed'] == 0
+    assert q.stats()['blocked'] == 1
+    assert [q.get() for _ in xrange(3)] == [
+        (2, 'COMMIT|'), (3, 'BEGIN|'),
+        (4, 'REM|rid:1.0.0.1;link_id:1.0.0.1;lsa_type:1; b')]
+
+
+def test_block():
+    q = LSAQueue(2, BLOCK, key)
+    q.put((0, 'BEGIN|'))
+    q.put((0, 'COMMIT|'))
+    t = Thread(target=q.put, args=((0, 'BEGIN|'),))
+    t.start()
+    time.sleep(.05)
+    # The reader waits for the processing thread
+    assert t.is_alive()
+    assert q.qsize() == 2
+    q.get()
+    t.join(1)
+    assert not t.is_alive()
+    assert q.stats()['blocked'] == 1
+    # Unless told not to
+    q.put((0, ''), block=False)
+    assert q.qsize() == 3
+
+
+def test_join():
+    q = LSAQueue()
+    q.put((0, 'BEGIN|'))
+    q.get()
+    t = Thread(target=q.join)
+    t.start()
+    time.sleep(.01)
+    assert t.is_alive()
+    q.task_done()
+    t.join(1)
+    assert not t.is_alive()
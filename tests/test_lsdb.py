@@ -0,0 +1,498 @@
+import os
+import json
+import random
+import time
+import weakref
+import pytest
+from ConfigParser import DEFAULTSECT
+
+from fibbingnode import CFG
+from fibbingnode.southbound.lsdb import LSDB, ASExtRoute
+from fibbingnode.southbound.dispatch import EDGES, NODES
+from fibbingnode.southbound import snapshot
+from fibbingnode.southbound.replay import StubWatchdog, StubListener
+
+
+def router_lsa(rid, p2p=(), transit=()):
+    """p2p: (neighbor rid, local address), transit: (dr ip, local address)"""
+    links = ['link_type:1;link_id:%s;link_data:%s;link_metric:1;' % l
+             for l in p2p]
+    links.extend('link_type:2;link_id:%s;link_data:%s;link_metric:5;' % l
+                 for l in transit)
+    links.append('link_type:3;link_id:%s;link_data:255.255.255.255;'
+                 'link_metric:0;' % rid)
+    return 'rid:%s;link_id:%s;lsa_type:1; %s' % (rid, rid, ' '.join(links))
+
+
+def network_lsa(dr_ip, dr, routers):
+    return 'rid:%s;link_id:%s;lsa_type:2;link_mask:255.255.255.0; %s' % (
+        dr, dr_ip, ' '.join('rid:%s;' % r for r in routers))
+
+
+def ext_lsa(rid, prefix, fwd_addr='0.0.0.0', metric=1):
+    address, mask = prefix.split('/')
+    return ('rid:%s;link_id:%s;lsa_type:5;link_mask:%s; '
+            'link_metric:%s;fwd_addr:%s;' % (rid, address, mask,
+                                              metric, fwd_addr))
+
+
+def topology():
+    """A few routers, with a LAN, two controllers and some prefixes"""
+    return [
+        router_lsa('1.0.0.1', p2p=[('1.0.0.2', '10.0.0.1'),
+                                   ('1.0.0.3', '10.0.1.1')]),
+        router_lsa('1.0.0.2', p2p=[('1.0.0.1', '10.0.0.2')],
+                   transit=[('10.0.2.1', '10.0.2.2')]),
+        router_lsa('1.0.0.3', p2p=[('1.0.0.1', '10.0.1.3')],
+                   transit=[('10.0.2.1', '10.0.2.1')]),
+        router_lsa('1.0.0.4', transit=[('10.0.2.1', '10.0.2.4')]),
+        router_lsa('192.168.0.1', transit=[('10.0.2.1', '192.168.0.1')]),
+        router_lsa('192.168.1.1', transit=[('10.0.2.1', '192.168.1.1')]),
+        network_lsa('10.0.2.1', '1.0.0.3', ['1.0.0.2', '1.0.0.3',
+                                            '1.0.0.4', '192.168.0.1',
+                                            '192.168.1.1']),
+        ext_lsa('1.0.0.4', '8.8.8.0/24'),
+        ext_lsa('1.0.0.1', '8.8.8.0/24', fwd_addr='10.0.1.3', metric=3),
+        ext_lsa('192.168.0.1', '9.9.9.0/24', fwd_addr='10.0.2.4'),
+    ]
+
+
+def assert_same_graph(g1, g2):
+    assert dict(g1.nodes(data=True)) == dict(g2.nodes(data=True))
+    assert ({(u, v): d for u, v, d in g1.edges(data=True)} ==
+            {(u, v): d for u, v, d in g2.edges(data=True)})
+
+
+def updated_graph(lsdb):
+    """:return: the graph of the LSDB, updated incrementally if enabled"""
+    return (lsdb.incremental.update() if lsdb.incremental
+            else lsdb.build_graph())
+
+
+@pytest.mark.incremental
+def test_incremental_matches_rebuild(lsdb):
+    # Parallel links from routers contracted in C_0, with different
+    # attributes, are merged in the order of the router-ids
+    parallel = [router_lsa('192.168.0.%d' % i, p2p=[('1.0.0.3',
+                                                     '192.168.0.%d' % i)])
+                for i in (3, 2)]
+    lsas = topology() + parallel
+    rnd = random.Random(42)
+    present = []
+    for _ in xrange(200):
+        if present and rnd.random() < .4:
+            lsa = present.pop(rnd.randrange(len(present)))
+            lsdb.remove_lsa(lsdb.parse_lsa(lsa))
+        else:
+            lsa = rnd.choice(lsas)
+            if lsa not in present:
+                present.append(lsa)
+            lsdb.add_lsa(lsdb.parse_lsa(lsa))
+        graph = lsdb.incremental.update()
+        assert_same_graph(graph, lsdb.build_graph())
+        assert set(lsdb.incremental.controllers) == set(lsdb.controllers)
+    for lsa in lsas:
+        lsdb.add_lsa(lsdb.parse_lsa(lsa))
+    dr = lsdb.parse_lsa(lsas[2]).routerid
+    last = lsdb.parse_lsa(parallel[0]).routerid
+    for graph in (lsdb.incremental.update(), lsdb.build_graph()):
+        assert graph['C_0'][dr] == {'metric': '1', 'src_address': last}
+
+
+@pytest.mark.incremental
+def test_incremental_changes(lsdb):
+    # With another version of 1.0.0.1, changing the address of a link
+    lsas = topology() + [router_lsa('1.0.0.1',
+                                    p2p=[('1.0.0.2', '10.0.0.5'),
+                                         ('1.0.0.3', '10.0.1.1')])]
+    rnd = random.Random(7)
+    old = lsdb.build_graph()
+    for _ in xrange(200):
+        lsa = rnd.choice(lsas)
+        if rnd.random() < .4:
+            lsdb.remove_lsa(lsdb.parse_lsa(lsa))
+        else:
+            lsdb.add_lsa(lsdb.parse_lsa(lsa))
+        graph = lsdb.incremental.update()
+        added, removed, node_prop = lsdb.incremental.changes()
+        new = lsdb.build_graph()
+        assert set(removed) == set(old.edges()) - set(new.edges())
+        assert set(added) == set((u, v) for u, v, d in new.edges(data=True)
+                                 if not old.has_edge(u, v) or
+                                 old[u][v] != d)
+        full_added, full_removed, full_props = LSDB.graph_difference(new,
+                                                                     old)
+        assert set(full_added) == set(added)
+        assert set(full_removed) == set(removed)
+        assert node_prop == full_props
+        assert_same_graph(graph, new)
+        old = new
+
+
+def _exported_graph(integer_ids):
+    CFG.set(DEFAULTSECT, 'integer_router_ids', integer_ids)
+    db = LSDB()
+    try:
+        for lsa in topology():
+            db.add_lsa(db.parse_lsa(lsa))
+        db.graph = db.build_graph()
+        return (sorted(db.export_edge(u, v, d)
+                       for u, v, d in db.graph.edges(data=True)),
+                db.export_nodes(db.graph.nodes_iter(data=True)),
+                db.forwarding_address_of(None, '1.0.0.1'),
+                db.forwarding_address_of('1.0.0.2', '1.0.0.1'))
+    finally:
+        db.stop()
+
+
+def test_integer_router_ids(lsdb):
+    text, integer = _exported_graph('0'), _exported_graph('1')
+    assert text == integer
+    assert text[2] == '10.0.0.1'
+    assert text[3] == ['10.0.0.1/30']
+
+
+def test_integer_ids_per_lsdb(lsdb):
+    # An LSDB using the other representation does not affect this one
+    CFG.set(DEFAULTSECT, 'integer_router_ids',
+            '0' if lsdb.integer_ids else '1')
+    other = LSDB()
+    try:
+        for lsa_info in (topology()[0], ext_lsa('1.0.0.1', '8.8.8.0/24',
+                                                fwd_addr='10.0.1.3')):
+            lsa = lsdb.parse_lsa(lsa_info)
+            other_lsa = other.parse_lsa(lsa_info)
+            assert isinstance(lsa.routerid, str) != lsdb.integer_ids
+            assert isinstance(other_lsa.routerid, str) == lsdb.integer_ids
+            assert lsa.lsa_info() == other_lsa.lsa_info()
+        assert isinstance(lsa.routes[0].fwd_addr, str) != lsdb.integer_ids
+        assert isinstance(other_lsa.routes[0].fwd_addr, str) == \
+            lsdb.integer_ids
+    finally:
+        other.stop()
+
+
+def test_snapshot_warm_restart(lsdb, tmpdir):
+    path = str(tmpdir.join('lsdb.snapshot'))
+    lsas = topology()
+    for lsa in lsas:
+        lsdb.add_lsa(lsdb.parse_lsa(lsa))
+    lsdb.set_leader_watchdog(StubWatchdog())
+    lsdb.refresh_graph()
+    snapshot.save(lsdb, path)
+    CFG.set(DEFAULTSECT, 'lsdb_snapshot', path)
+    try:
+        db = LSDB()
+    finally:
+        CFG.set(DEFAULTSECT, 'lsdb_snapshot', '')
+    try:
+        assert_same_graph(db.graph, lsdb.graph)
+        assert len(db.stale) == len(lsas)
+        # The live feed no longer advertises the last prefix
+        for lsa in lsas[:-1]:
+            db.add_lsa(db.parse_lsa(lsa))
+        assert len(db.stale) == 1
+        assert db.reconcile_snapshot()
+        assert not db.stale
+        db.set_leader_watchdog(StubWatchdog())
+        db.refresh_graph()
+        if db.incremental:
+            assert db.graph is db.incremental.graph
+        assert_same_graph(db.graph, db.build_graph())
+        assert '9.9.9.0/24' not in db.graph
+    finally:
+        db.stop()
+
+
+def test_lsa_info_round_trip(lsdb):
+    for lsa_info in topology():
+        lsa = lsdb.parse_lsa(lsa_info)
+        again = lsdb.parse_lsa(lsa.lsa_info())
+        assert again.lsa_info() == lsa.lsa_info()
+        assert str(again) == str(lsa)
+        assert again.key() == lsa.key()
+
+
+def test_shared_routes(lsdb):
+    first = lsdb.parse_lsa(ext_lsa('1.0.0.1', '7.7.7.0/24', metric=77))
+    second = lsdb.parse_lsa(ext_lsa('1.0.0.2', '7.7.8.0/24', metric=77))
+    assert first.routes is second.routes
+    routes = weakref.ref(first.routes)
+    # The routes are forgotten with the last LSA using them
+    del first
+    assert routes() is not None
+    del second
+    assert routes() is None
+    assert not [r for r in ASExtRoute._shared.values()
+                if r[0].metric == '77']
+
+
+def test_snapshot_saved_on_stop(lsdb, tmpdir):
+    path = str(tmpdir.join('lsdb.snapshot'))
+    CFG.set(DEFAULTSECT, 'lsdb_snapshot', path)
+    try:
+        db = LSDB()
+    finally:
+        CFG.set(DEFAULTSECT, 'lsdb_snapshot', '')
+    db.set_leader_watchdog(StubWatchdog())
+    lsas = topology()
+    for lsa in lsas:
+        db.queue.put((time.time(), 'ADD|' + lsa))
+    # The last snapshot is taken once the queued lines are processed
+    db.stop()
+    assert not db.processing_thread.is_alive()
+    with open(path) as f:
+        assert json.load(f)['version'] == snapshot.SNAPSHOT_VERSION
+    assert sorted(snapshot.load(path)) == sorted(
+        db.parse_lsa(lsa).lsa_info() for lsa in lsas)
+
+
+class VersionedListener(StubListener):
+    """A listener resuming its sessions from the last version it got"""
+
+    def __init__(self, lsdb, version=None):
+        super(VersionedListener, self).__init__()
+        self.lsdb = lsdb
+        self.version = version
+        self.bootstraps = 0
+
+    def graph_session(self, token):
+        self.lsdb.resume_listener(token, self.version)
+
+    def bootstrap_graph(self, graph, node_properties, version=None):
+        self.bootstraps += 1
+        self.version = version
+
+    def commit(self, version=None):
+        super(VersionedListener, self).commit(version)
+        self.version = version
+
+
+def _session(lsdb, listener):
+    lsdb.register_change_listener(listener)
+    assert lsdb.listener[listener].wait_idle(5)
+    lsdb.register_change_listener(listener)
+
+
+def test_bootstrap_without_session(lsdb):
+    lsdb.set_leader_watchdog(StubWatchdog())
+    for lsa in topology():
+        lsdb.add_lsa(lsdb.parse_lsa(lsa))
+    lsdb.refresh_graph()
+    listener = VersionedListener(lsdb)
+    listener.graph_session = None  # Never called
+    lsdb.register_change_listener(listener)
+    # The whole graph is pushed right away, without any version
+    assert not lsdb.resuming
+    assert lsdb.listener[listener].wait_idle(5)
+    assert listener.bootstraps == 1
+    assert listener.version is None
+    lsdb.register_change_listener(listener)
+
+
+def test_resume_session(lsdb):
+    lsdb.set_leader_watchdog(StubWatchdog())
+    lsdb.resume_timeout = 1
+    lsas = topology()
+    for lsa in lsas[:3]:
+        lsdb.add_lsa(lsdb.parse_lsa(lsa))
+    lsdb.refresh_graph()
+    first = VersionedListener(lsdb)
+    _session(lsdb, first)
+    assert first.bootstraps == 1
+    assert first.version == lsdb.export_version()
+    for lsa in lsas[3:]:
+        lsdb.add_lsa(lsdb.parse_lsa(lsa))
+        lsdb.refresh_graph()
+    # Only the missed updates are pushed
+    second = VersionedListener(lsdb, first.version)
+    _session(lsdb, second)
+    assert second.bootstraps == 0
+    assert second.commits == 1
+    assert second.added > 0
+    assert second.version == lsdb.export_version()
+    # Unless they are no longer available
+    lsdb.add_lsa(lsdb.parse_lsa(ext_lsa('1.0.0.2', '7.7.7.0/24')))
+    lsdb.refresh_graph()
+    lsdb.deltas.clear()
+    third = VersionedListener(lsdb, second.version)
+    _session(lsdb, third)
+    assert third.bootstraps == 1
+    assert third.version == lsdb.export_version()
+    # Or taken from another LSDB instance
+    fourth = VersionedListener(lsdb, ['other', third.version[1]])
+    _session(lsdb, fourth)
+    assert fourth.bootstraps == 1
+
+
+def test_bootstrap_chunks(lsdb):
+    for lsa in topology():
+        lsdb.add_lsa(lsdb.parse_lsa(lsa))
+    lsdb.graph = updated_graph(lsdb)
+    chunks = list(lsdb.bootstrap_chunks(2))
+    edges = [e for kind, chunk in chunks if kind == EDGES for e in chunk]
+    nodes = {}
+    for kind, chunk in chunks:
+        if kind == NODES:
+            assert len(chunk) <= 2
+            nodes.update(chunk)
+    # All edges come before the nodes
+    assert [kind for kind, _ in chunks] == sorted(kind for kind, _ in chunks)
+    assert sorted(edges) == sorted(lsdb.export_edge(u, v, d) for u, v, d
+                                   in lsdb.graph.edges(data=True))
+    assert nodes == lsdb.export_nodes(lsdb.graph.nodes_iter(data=True))
+
+
+def test_transaction_keeps_last_change(lsdb):
+    lsdb.set_leader_watchdog(StubWatchdog())
+    prefix = ext_lsa('1.0.0.1', '8.8.8.0/24')
+    lines = ['BEGIN|',
+             'ADD|' + router_lsa('1.0.0.1'),
+             'ADD|' + prefix,
+             'REM|' + prefix,
+             'REM|' + router_lsa('1.0.0.2'),
+             'ADD|' + router_lsa('1.0.0.2'),
+             'ADD|' + ext_lsa('1.0.0.1', '9.9.9.0/24', metric=1),
+             'ADD|' + ext_lsa('1.0.0.1', '9.9.9.0/24', metric=2)]
+    for line in lines:
+        lsdb.process_line(line)
+    assert len(lsdb.transaction.changes) == 4
+    assert lsdb.process_line('COMMIT|')
+    assert lsdb.stats['transaction_elided_changes'] == 3
+    assert len(lsdb.routers) == 2
+    assert [lsa.routes[0].metric for lsa
+            in lsdb.ext_networks.itervalues()] == ['2']
+
+
+def test_suppress_refreshes(lsdb):
+    lsdb.set_leader_watchdog(StubWatchdog())
+    prefix = ext_lsa('1.0.0.1', '8.8.8.0/24')
+    lines = ['ADD|' + router_lsa('1.0.0.1'),
+             'ADD|' + prefix,
+             'ADD|' + prefix,
+             'ADD|' + router_lsa('1.0.0.1'),
+             'ADD|' + ext_lsa('1.0.0.1', '8.8.8.0/24', metric=2),
+             'REM|' + prefix,
+             'ADD|' + prefix]
+    for line in lines:
+        lsdb.commit_change(line)
+    lsdb.queue.join()
+    assert lsdb.stats['suppressed_refreshes'] == 2
+    assert len(lsdb.routers) == 1
+    assert len(lsdb.ext_networks) == 1
+
+
+def test_transit_routers_index(lsdb):
+    lan = '10.0.2.1'
+    routers = topology()[1:6]
+    for lsa in routers:
+        lsdb.add_lsa(lsdb.parse_lsa(lsa))
+    dr_ip = lsdb.parse_lsa(network_lsa(lan, '1.0.0.3', [])).key()
+    assert len(lsdb.transit_routers[dr_ip]) == 5
+    graph = updated_graph(lsdb)
+    assert graph.number_of_edges() == 2
+    # The LAN is only resolved once its Network LSA is known
+    lsdb.add_lsa(lsdb.parse_lsa(topology()[6]))
+    graph = updated_graph(lsdb)
+    assert_same_graph(graph, lsdb.build_graph())
+    assert graph.number_of_edges() > 2
+    # A router leaving the LAN, then withdrawn
+    lsdb.add_lsa(lsdb.parse_lsa(router_lsa('1.0.0.4')))
+    assert len(lsdb.transit_routers[dr_ip]) == 4
+    for lsa in routers:
+        lsdb.remove_lsa(lsdb.parse_lsa(lsa))
+    assert not lsdb.transit_routers
+    assert_same_graph(updated_graph(lsdb), lsdb.build_graph())
+
+
+def test_ext_prefixes_index(lsdb):
+    for lsa in topology():
+        lsdb.add_lsa(lsdb.parse_lsa(lsa))
+    assert len(lsdb.ext_prefixes) == 2
+    assert len(lsdb.ext_lsas_for('8.8.8.8')) == 2
+    assert lsdb.ext_lsas_for('8.8.9.0/24') == {}
+    lsdb.add_lsa(lsdb.parse_lsa(ext_lsa('1.0.0.2', '8.8.0.0/16')))
+    assert lsdb.ext_lsas_for('8.8.9.0/24').keys() == [
+        lsdb.parse_lsa(router_lsa('1.0.0.2')).key()]
+    assert len(lsdb.ext_lsas_for('8.8.8.0/25')) == 2
+    lsdb.remove_lsa(lsdb.parse_lsa(ext_lsa('1.0.0.4', '8.8.8.0/24')))
+    lsdb.remove_lsa(lsdb.parse_lsa(ext_lsa('1.0.0.1', '8.8.8.0/24')))
+    assert '8.8.8.0/24' not in lsdb.ext_prefixes
+    assert len(lsdb.ext_lsas_for('8.8.8.8')) == 1
+
+
+def test_address_owners(lsdb):
+    lsdb.add_lsa(lsdb.parse_lsa(router_lsa('1.0.0.3',
+                                           p2p=[('1.0.0.1', '10.0.1.3')])))
+    lsdb.add_lsa(lsdb.parse_lsa(ext_lsa('1.0.0.1', '8.8.8.0/24',
+                                        fwd_addr='10.0.1.3')))
+    rid, address = (lsdb.parse_lsa(router_lsa(ip)).key()
+                    for ip in ('1.0.0.3', '10.0.1.3'))
+    assert lsdb.owner_of(address) == rid
+    # The forwarding address is contracted in its router
+    graph = lsdb.build_graph()
+    assert address not in graph
+    assert_same_graph(updated_graph(lsdb), graph)
+    lsdb.prefix_table.update()
+    assert lsdb.prefix_table.edges.keys() == [(rid, '8.8.8.0/24')]
+    lsdb.prefix_table.changes()
+    # The address moves to another router
+    lsdb.add_lsa(lsdb.parse_lsa(router_lsa('1.0.0.3')))
+    assert lsdb.owner_of(address) == address
+    lsdb.add_lsa(lsdb.parse_lsa(router_lsa('1.0.0.1',
+                                           p2p=[('1.0.0.3', '10.0.1.3')])))
+    owner = lsdb.owner_of(address)
+    assert owner != rid
+    assert_same_graph(updated_graph(lsdb), lsdb.build_graph())
+    # and so does the prefix attached to it
+    lsdb.prefix_table.update()
+    added, removed, _ = lsdb.prefix_table.changes()
+    assert [e[:2] for e in added] == [(owner, '8.8.8.0/24')]
+    assert removed == [(rid, '8.8.8.0/24')]
+    lsdb.remove_lsa(lsdb.parse_lsa(router_lsa('1.0.0.1')))
+    assert lsdb.owner_of(address) == address
+    assert_same_graph(updated_graph(lsdb), lsdb.build_graph())
+
+
+def test_prefix_deltas(lsdb):
+    lsdb.set_leader_watchdog(StubWatchdog())
+    for lsa in topology():
+        lsdb.add_lsa(lsdb.parse_lsa(lsa))
+    lsdb.refresh_graph()
+    graph = lsdb.graph.copy()
+    assert '8.8.8.0/24' not in graph
+    assert len(lsdb.prefix_table) == 3
+    # A new prefix only yields a prefix delta
+    lsdb.add_lsa(lsdb.parse_lsa(ext_lsa('1.0.0.2', '7.7.7.0/24')))
+    lsdb.refresh_graph()
+    assert_same_graph(lsdb.graph, graph)
+    version, added, removed, node_props, prefixes = lsdb.deltas[-1]
+    assert not added and not removed and not node_props
+    assert prefixes[:2] == ([('1.0.0.2', '7.7.7.0/24', {'metric': '1'})], [])
+    lsdb.remove_lsa(lsdb.parse_lsa(ext_lsa('1.0.0.2', '7.7.7.0/24')))
+    lsdb.refresh_graph()
+    assert lsdb.deltas[-1][4][:2] == ([], [('1.0.0.2', '7.7.7.0/24')])
+    assert lsdb.deltas[-1][0] == version[:1] + [version[1] + 1]
+
+
+@pytest.mark.incremental
+def test_reload_private_addresses(lsdb):
+    for lsa in topology():
+        lsdb.add_lsa(lsdb.parse_lsa(lsa))
+    lsdb.incremental.update()
+    lsdb.incremental.changes()
+    assert not lsdb.reload_private_addresses()
+    private_ips = CFG.get(DEFAULTSECT, 'private_ips')
+    with open(private_ips + '.new', 'w') as f:
+        json.dump({"10.0.0.0/30": {"1.0.0.1": "10.0.0.1/30",
+                                   "1.0.0.2": "10.0.0.2/30"},
+                   "10.0.1.0/30": {"1.0.0.1": "10.0.1.1/30",
+                                   "1.0.0.3": "10.0.1.2/30"}}, f)
+    os.rename(private_ips + '.new', private_ips)
+    assert lsdb.reload_private_addresses()
+    graph = lsdb.incremental.update()
+    added, _, _ = lsdb.incremental.changes()
+    rid1, rid3 = (lsdb.parse_lsa(router_lsa(ip)).key()
+                  for ip in ('1.0.0.1', '1.0.0.3'))
+    assert set(added) == {(rid1, rid3), (rid3, rid1)}
+    assert_same_graph(graph, lsdb.build_graph())
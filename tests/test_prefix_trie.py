@@ -0,0 +1,80 @@
+import random
+
+import pytest
+from ipaddress import ip_network, ip_address
+
+from fibbingnode.misc.prefix_trie import PrefixTrie, parse_prefix
+
+
+def test_parse_prefix():
+    assert parse_prefix('10.0.0.0/8') == (32, 10 << 24, 8)
+    assert parse_prefix('10.1.2.3/8') == (32, 10 << 24, 8)
+    assert parse_prefix('10.0.0.1') == (32, (10 << 24) + 1, 32)
+    assert parse_prefix(ip_network(u'10.0.0.0/8')) == (32, 10 << 24, 8)
+    assert parse_prefix(ip_address(u'10.0.0.1')) == (32, (10 << 24) + 1, 32)
+    assert parse_prefix((10 << 24) + 1) == (32, (10 << 24) + 1, 32)
+    assert parse_prefix('2001:db8::/32') == (128, 0x20010db8 << 96, 32)
+    with pytest.raises(ValueError):
+        parse_prefix('10.0.0.0/33')
+
+
+def test_lookups():
+    t = PrefixTrie([('10.0.0.0/8', 'a'), ('10.1.0.0/16', 'b'),
+                    (ip_network(u'10.1.2.0/24'), 'c'), ('0.0.0.0/0', 'd'),
+                    ('2001:db8::/32', 'e')])
+    assert len(t) == 5
+    # Keys denoting the same prefix are the same key
+    assert t['10.1.2.0/24'] == 'c'
+    assert '10.1.0.0/24' not in t
+    assert t.longest_match('10.1.2.3') == (ip_network(u'10.1.2.0/24'), 'c')
+    assert t.longest_match('10.1.3.0/24') == ('10.1.0.0/16', 'b')
+    assert t.longest_match('11.0.0.1') == ('0.0.0.0/0', 'd')
+    assert t.longest_match('2001:db8::1') == ('2001:db8::/32', 'e')
+    assert [v for _, v in t.covering('10.1.2.128/25')] == ['d', 'a', 'b', 'c']
+    assert sorted(v for _, v in t.covered_by('10.0.0.0/8')) == ['a', 'b', 'c']
+    assert list(t.covered_by('10.1.2.0/23')) == [
+        (ip_network(u'10.1.2.0/24'), 'c')]
+    assert list(t.covered_by('10.2.0.0/16')) == []
+    assert t.pop('0.0.0.0/0') == 'd'
+    with pytest.raises(KeyError):
+        t.longest_match('11.0.0.1')
+    del t['10.1.0.0/16']
+    with pytest.raises(KeyError):
+        del t['10.1.0.0/16']
+    assert t.longest_match('10.1.3.0/24') == ('10.0.0.0/8', 'a')
+    assert len(t) == 3
+    assert t.keys() == ['10.0.0.0/8', ip_network(u'10.1.2.0/24'),
+                        '2001:db8::/32']
+
+
+def _covers(p, q):
+    """Whether the prefix p covers the prefix q"""
+    return p.prefixlen <= q.prefixlen and not (
+        int(p.network_address) ^ int(q.network_address)) >> (32 - p.prefixlen)
+
+
+def test_random_against_scan():
+    rnd = random.Random(1)
+    t, ref = PrefixTrie(), {}
+
+    def random_prefix():
+        return ip_network(rnd.getrandbits(12) << 20).supernet(
+            new_prefix=rnd.randint(0, 12))
+    for _ in xrange(600):
+        prefix = random_prefix()
+        if prefix in ref and rnd.random() < .5:
+            del t[prefix]
+            del ref[prefix]
+        else:
+            t[prefix] = ref[prefix] = rnd.random()
+        assert len(t) == len(ref)
+        query = random_prefix()
+        covering = sorted((p for p in ref if _covers(p, query)),
+                          key=lambda p: p.prefixlen)
+        assert [p for p, _ in t.covering(query)] == covering
+        if covering:
+            assert t.longest_match(query) == (covering[-1],
+                                              ref[covering[-1]])
+        assert sorted(p for p, _ in t.covered_by(query)) == sorted(
+            p for p in ref if _covers(query, p))
+    assert sorted(t.items()) == sorted(ref.items())
@@ -44,3 +44,38 @@ def test_simple(simple_address_file):
                       ['192.168.239.254'])
     assert same_lists(store.addresses_of('192.168.239.254'),
                       ['10.127.255.254/30', '10.223.255.254/30'])
+
+
+def test_indexes(simple_address_file):
+    store, d = simple_address_file
+    assert store.router_of('10.223.255.253/30') == '192.168.255.253'
+    assert same_lists(store.addresses_of('192.168.239.254',
+                                         '192.168.251.254'),
+                      ['10.127.255.254/30'])
+    with pytest.raises(ValueError):
+        store.targets_for('10.0.0.1/30')
+    with pytest.raises(ValueError):
+        store.router_of('10.0.0.1/30')
+
+
+def test_reload(simple_address_file):
+    store, d = simple_address_file
+    assert store.reload() is None
+    d["10.223.255.252/30"]["192.168.255.253"] = ["10.223.255.252/30"]
+    del d["10.255.255.252/30"]
+    with open(SIMPLE_TESTFILE + '.new', 'w') as f:
+        json.dump(d, f)
+    os.rename(SIMPLE_TESTFILE + '.new', SIMPLE_TESTFILE)
+    routers, ips = store.reload()
+    # The addresses of 192.168.239.254 towards 192.168.255.253 are the same
+    assert routers == {'192.168.251.253', '192.168.255.253'}
+    assert ips == {'10.223.255.252/30', '10.223.255.253/30',
+                   '10.255.255.253/30', '10.255.255.254/30'}
+    assert same_lists(store.addresses_of('192.168.255.253'),
+                      ['10.223.255.252/30'])
+    assert store.reload() is None
+    # A broken file keeps the previous bindings
+    with open(SIMPLE_TESTFILE, 'w') as f:
+        f.write('{')
+    assert store.reload() is None
+    assert store.router_of('10.223.255.252/30') == '192.168.255.253'
@@ -0,0 +1,112 @@
+from collections import deque
+from Queue import Empty
+
+from fibbingnode.southbound import lsdb as lsdb_module
+from test_lsdb import router_lsa, ext_lsa
+
+# When the LSDB is stopped
+END = 2000
+
+
+class Clock(object):
+    """A clock only moving forward while the LSDB waits for lines"""
+
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+
+class ScriptedQueue(object):
+    """Gives each (time queued, line) once the clock reaches its time"""
+
+    def __init__(self, clock, lines):
+        self.clock = clock
+        self.lines = deque(lines)
+
+    def get(self, timeout=None):
+        if self.lines and self.lines[0][0] <= self.clock.now + timeout:
+            queued, line = self.lines.popleft()
+            self.clock.now = max(self.clock.now, queued)
+            return queued, line
+        self.clock.now += timeout
+        raise Empty
+
+    def task_done(self):
+        pass
+
+    def put(self, item, block=True):
+        pass
+
+
+def run(db, monkeypatch, lines, min_interval=0, max_delay=100,
+        max_batch=10000):
+    """
+    Process lines with a commit policy, on a scripted clock
+    :param lines: the (time queued, line) to process
+    :return: the (time, lines processed, LSAs in the LSDB) of each graph
+             update
+    """
+    db.stop()  # The lines are processed by this thread instead
+    clock = Clock()
+    monkeypatch.setattr(lsdb_module, 'time', clock)
+
+    def policy():
+        db.commit_min_interval = min_interval
+        db.commit_max_delay = max_delay
+        db.commit_max_batch = max_batch
+        db.snapshot_interval = db.snapshot_reconcile = 0
+        db.private_ips_interval = 0
+    db.read_commit_policy = policy
+    processed = []
+    process_line = db.process_line
+
+    def counting(line):
+        processed.append(line)
+        return process_line(line)
+    db.process_line = counting
+    updates = []
+    db.refresh_graph = lambda: updates.append(
+        (clock.now, len(processed), len(db.routers) + len(db.ext_networks)))
+    db.queue = ScriptedQueue(clock, lines + [(END, '')])
+    db.keep_running = False
+    db.process_lsa()
+    assert len(processed) == len(lines)
+    return updates
+
+
+def prefixes(times):
+    return [(t, 'ADD|' + ext_lsa('1.0.0.1', '10.%d.0.0/16' % i))
+            for i, t in enumerate(times)]
+
+
+def test_max_batch(lsdb, monkeypatch):
+    # A backlog of 10 lines
+    assert run(lsdb, monkeypatch, prefixes([1000] * 10), max_batch=4) == [
+        (1000, 4, 4), (1000, 8, 8), (1000, 10, 10)]
+
+
+def test_max_delay(lsdb, monkeypatch):
+    # A line every 250ms, never idle long enough for the hold-down
+    lines = prefixes([1000 + .25 * i for i in xrange(1, 9)])
+    assert run(lsdb, monkeypatch, lines, min_interval=10, max_delay=1) == [
+        (1001.25, 5, 5), (1002.5, 8, 8)]
+
+
+def test_min_interval(lsdb, monkeypatch):
+    lines = prefixes([1000.5, 1001, 1005])
+    # The first update waits for the hold-down since the start, the
+    # second one happens once idle, as the hold-down has elapsed
+    assert run(lsdb, monkeypatch, lines, min_interval=2) == [
+        (1002, 2, 2), (1005, 3, 3)]
+
+
+def test_transaction_timeout(lsdb, monkeypatch):
+    lines = [(1001, 'BEGIN|'), (1001.5, 'ADD|' + router_lsa('1.0.0.1'))]
+    # The transaction is applied once split, after TRANSACTION_TIMEOUT
+    # without lines. The following splits are empty, and do not update
+    # the graph.
+    assert run(lsdb, monkeypatch, lines) == [
+        (1001.5, 2, 0),
+        (1001.5 + lsdb_module.TRANSACTION_TIMEOUT, 2, 1)]
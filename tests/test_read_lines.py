@@ -0,0 +1,29 @@
+import os
+import pytest
+
+from fibbingnode.misc.utils import read_lines
+
+
+def _pipe_with(data):
+    r, w = os.pipe()
+    os.write(w, data)
+    os.close(w)
+    return r
+
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 3, 7, 4096])
+def test_split_across_chunks(chunk_size):
+    lines = ['ADD|rid:1.1.1.1;', '', 'BEGIN|', 'COMMIT|' + 'x' * 20]
+    fd = _pipe_with('\n'.join(lines) + '\n')
+    try:
+        assert list(read_lines(fd, chunk_size)) == lines
+    finally:
+        os.close(fd)
+
+
+def test_incomplete_trailing_line():
+    fd = _pipe_with('a\nb\npartial')
+    try:
+        assert list(read_lines(fd, 2)) == ['a', 'b']
+    finally:
+        os.close(fd)
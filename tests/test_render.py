@@ -0,0 +1,55 @@
+import time
+from threading import Event
+
+from fibbingnode.southbound.render import GraphRenderer
+
+
+class SlowGraph(object):
+    """A graph recording where it is drawn, blocked until released"""
+
+    def __init__(self):
+        self.drawn = []
+        self.release = Event()
+
+    def draw(self, path):
+        self.release.wait()
+        self.drawn.append(path)
+
+
+def test_render_latest_only():
+    graph = SlowGraph()
+    versions = [1]
+    r = GraphRenderer(lambda: (graph, versions[0]))
+    try:
+        r.changed('a.pdf')
+        time.sleep(.05)
+        # Queued while the first drawing is blocked, only the last is drawn
+        for i in xrange(2, 6):
+            versions[0] = i
+            r.changed('%d.pdf' % i)
+        graph.release.set()
+        assert r.wait_idle(1)
+        assert graph.drawn == ['a.pdf', '5.pdf']
+        stats = r.stats()
+        assert stats['rendered'] == 2
+        assert stats['skipped'] == 3
+        assert stats['version'] == 5
+    finally:
+        r.stop()
+
+
+def test_render_min_interval():
+    graph = SlowGraph()
+    graph.release.set()
+    r = GraphRenderer(lambda: (graph, 0), min_interval=.2)
+    try:
+        r.changed('a.pdf')
+        assert r.wait_idle(1)
+        start = time.time()
+        r.changed('b.pdf')
+        assert not r.wait_idle(.1)
+        assert r.wait_idle(1)
+        assert time.time() - start >= .1
+        assert graph.drawn == ['a.pdf', 'b.pdf']
+    finally:
+        r.stop()
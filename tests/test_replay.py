@@ -0,0 +1,62 @@
+import pytest
+
+from fibbingnode.southbound.replay import Replay, synthetic_log, read_capture
+
+
+@pytest.fixture(scope="function", params=['0', '1'])
+def lsdb_options(request):
+    return {'incremental_graph': request.param, 'draw_graph': '0'}
+
+
+def test_synthetic_replay(lsdb):
+    replay = Replay(lsdb)
+    report = replay.run(synthetic_log(10, 20, updates=30))
+    assert report['lines'] == 60
+    assert report['unflushed_lines'] == 0
+    assert report['rebuilds'] >= 1
+    # 10 routers in a ring, the updates withdrew 15 of the 20 prefixes
+    assert report['nodes'] == 10
+    assert report['edges'] == 20
+    assert report['prefixes'] == 5
+    # The listener got the final graph. Depending on how the lines were
+    # coalesced, the 15 metric changes pushed again up to both edges of
+    # their router.
+    assert replay.listener.edges == set(lsdb.graph.edges())
+    assert 20 <= report['edges_added'] <= 20 + 15 * 2
+    assert report['edges_removed'] == 0
+    # Metric changes push their prefixes again, unless coalesced. A prefix
+    # added then withdrawn in the same listener batch is only removed.
+    assert report['prefixes_added'] >= 5
+
+
+def test_read_capture(tmpdir):
+    capture = tmpdir.join('lsdb.log')
+    capture.write('1.5\tADD|rid:1.0.0.1;\n\nBEGIN|\n')
+    assert list(read_capture(str(capture))) == [(1.5, 'ADD|rid:1.0.0.1;'),
+                                                (None, 'BEGIN|')]
+
+
+def test_replay_latency(lsdb):
+    report = Replay(lsdb).run(synthetic_log(10, 20, updates=30))
+    stages = report['latency']
+    # The lines collapsed in the LSDB queue or suppressed as refreshes
+    # are never processed
+    processed = (60 - report['queue_collapsed'] -
+                 report['suppressed_refreshes'])
+    assert stages['queue_wait']['count'] == processed
+    assert stages['parse']['count'] == processed
+    assert stages['build_graph']['count'] == report['rebuilds']
+    assert stages['update']['count'] >= 1
+    assert stages['listener_push']['count'] >= 1
+
+
+def test_replay_refreshes(lsdb):
+    report = Replay(lsdb).run(synthetic_log(10, 20, updates=30,
+                                            refreshes=2))
+    # Each refresh re-announces the 10 routers and the 5 remaining prefixes,
+    # one of the metric changes also restored the metric already announced
+    assert report['lines'] == 60 + 2 * 15
+    assert report['suppressed_refreshes'] == 2 * 15 + 1
+    assert report['unflushed_lines'] == 0
+    assert report['nodes'] == 10
+    assert report['prefixes'] == 5